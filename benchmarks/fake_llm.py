@@ -0,0 +1,71 @@
+"""Deterministic fake model, registered as the LiteLLM custom provider `fake-bench`.
+
+The model name selects how many tool calls a conversation makes, e.g.
+`fake-bench/100` alternates between taking a snapshot and clicking 100 times
+and then answers with a passing verdict. Token counts are estimated from the
+request size, so token metrics have realistic magnitudes.
+"""
+import asyncio
+import json
+import os
+
+import litellm
+from litellm import CustomLLM, ModelResponse
+
+PROVIDER = "fake-bench"
+
+
+class FakeBenchLlm(CustomLLM):
+    """Answers with a scripted sequence of tool calls followed by a final verdict."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    def _respond(self, model: str, messages: list) -> ModelResponse:
+        tool_calls = int(model.rsplit("/", 1)[-1])
+        done = sum(1 for message in messages if message.get("role") == "tool")
+        prompt_tokens = sum(len(str(message.get("content") or "")) for message in messages) // 4
+
+        if done >= tool_calls:
+            message = {"role": "assistant", "content": "All steps completed.\nTEST RESULT: PASSED"}
+            finish_reason = "stop"
+        else:
+            if done % 2 == 0:
+                name, args = "browser_snapshot", {}
+            else:
+                name, args = "browser_click", {"element": f"Product {done}", "ref": f"e{done}l"}
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{done}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(args)},
+                }],
+            }
+            finish_reason = "tool_calls"
+
+        return ModelResponse(
+            model=model,
+            choices=[{"index": 0, "message": message, "finish_reason": finish_reason}],
+            usage={"prompt_tokens": prompt_tokens, "completion_tokens": 20,
+                   "total_tokens": prompt_tokens + 20},
+        )
+
+    def completion(self, model, messages, *args, **kwargs) -> ModelResponse:
+        return self._respond(model, messages)
+
+    async def acompletion(self, model, messages, *args, **kwargs) -> ModelResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(model, messages)
+
+
+def register(latency: float = None):
+    """Register the fake provider with LiteLLM."""
+    if latency is None:
+        latency = float(os.environ.get("BENCH_MODEL_LATENCY", "0"))
+    litellm.custom_provider_map = [
+        entry for entry in litellm.custom_provider_map if entry["provider"] != PROVIDER
+    ] + [{"provider": PROVIDER, "custom_handler": FakeBenchLlm(latency)}]
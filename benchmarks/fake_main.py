@@ -0,0 +1,18 @@
+"""Run main.py with the fake model provider registered.
+
+Takes the same arguments as main.py, e.g.:
+    UITEST_CONFIG=bench.yaml python benchmarks/fake_main.py --target web --query "..." --output jsonl
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_llm import register
+
+
+if __name__ == "__main__":
+    register()
+    import main
+    sys.exit(asyncio.run(main.async_main()))
@@ -0,0 +1,217 @@
+"""Offline end-to-end benchmarks of the agent's own overhead.
+
+Every scenario runs `main.py` in a fresh process with the deterministic fake
+model (benchmarks/fake_llm.py) and the stub MCP server
+(benchmarks/stub_mcp_server.py), so no API key, device, browser or network
+access is needed. For each scenario the benchmark reports:
+
+- startup: seconds from process start to the first event
+- events/s: events emitted per second of the conversation
+- overhead/turn: time per model turn not spent in the model or in tools
+- peak RSS: maximum resident memory of the agent process
+
+Usage:
+    python benchmarks/run.py
+    python benchmarks/run.py --scenarios 10-small,100-large --repeat 3
+    python benchmarks/run.py --json results.json
+    python benchmarks/run.py --baseline results.json   # fail on regressions
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+from rich import box
+from rich.console import Console
+from rich.table import Table
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCHMARK_DIR.parent
+
+SCENARIOS = {
+    "10-small": {"tool_calls": 10, "snapshot_size": 1000},
+    "100-small": {"tool_calls": 100, "snapshot_size": 1000},
+    "1000-small": {"tool_calls": 1000, "snapshot_size": 1000},
+    "10-large": {"tool_calls": 10, "snapshot_size": 200000},
+    "100-large": {"tool_calls": 100, "snapshot_size": 200000},
+    "100-large-compacted": {"tool_calls": 100, "snapshot_size": 200000,
+                            "config": {"compaction": {"enabled": True}}},
+    "100-large-diffed": {"tool_calls": 100, "snapshot_size": 200000,
+                         "config": {"ui_diff": {"enabled": True}}},
+}
+
+# Metrics compared against a baseline, and whether higher values are better
+TRACKED_METRICS = {"startup": False, "events_per_sec": True, "overhead_per_turn": False, "peak_rss_mb": False}
+
+console = Console(stderr=True)
+
+
+def write_config(directory: Path, scenario: dict, tool_latency: float) -> Path:
+    """Write the config file that points the agent at the fake model and the stub server."""
+    config = {
+        "google_api_key": "offline-benchmark",
+        "use_litellm": True,
+        "model_name": f"fake-bench/{scenario['tool_calls']}",
+        "web_mcp_command": [
+            sys.executable, str(BENCHMARK_DIR / "stub_mcp_server.py"),
+            "--latency", str(tool_latency), "--snapshot-size", str(scenario["snapshot_size"]),
+        ],
+    }
+    config.update(scenario.get("config") or {})
+    path = directory / "config.yaml"
+    path.write_text(yaml.safe_dump(config))
+    return path
+
+
+def run_scenario(scenario: dict, tool_latency: float, model_latency: float) -> dict:
+    """Run one scenario in a fresh process and collect its metrics."""
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            UITEST_CONFIG=str(write_config(Path(directory), scenario, tool_latency)),
+            BENCH_MODEL_LATENCY=str(model_latency),
+            # Never fetch the model cost map over the network
+            LITELLM_LOCAL_MODEL_COST_MAP="True",
+        )
+        command = [
+            sys.executable, str(BENCHMARK_DIR / "fake_main.py"),
+            "--target", "web", "--output", "jsonl",
+            "--query", "Open the product list and check every product",
+        ]
+
+        start = time.monotonic()
+        process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, text=True)
+        first_event = last_event = None
+        events = 0
+        summary = {}
+        error = None
+        for line in process.stdout:
+            now = time.monotonic()
+            first_event = first_event or now
+            last_event = now
+            events += 1
+            event = json.loads(line)
+            if event["event_type"] == "run_summary":
+                summary = event
+            elif event["event_type"] == "error":
+                error = event["message"]
+        # wait4 reports the resource usage of this child alone
+        _, status, usage = os.wait4(process.pid, 0)
+
+    if first_event is None or status != 0:
+        raise RuntimeError(error or f"Benchmark process exited with status {status}")
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    duration = max(last_event - first_event, 1e-9)
+    turns = max(summary.get("llm_turns") or 0, 1)
+    return {
+        "startup": first_event - start,
+        "events": events,
+        "events_per_sec": events / duration,
+        "overhead_per_turn": (summary.get("overhead") or 0.0) / turns,
+        "wall_time": summary.get("wall_time"),
+        "peak_rss_mb": peak_rss,
+        "error": error,
+    }
+
+
+def median_result(runs):
+    """Combine repeated runs of a scenario into their per-metric median."""
+    return {
+        key: statistics.median(run[key] for run in runs) if isinstance(runs[0][key], (int, float)) else runs[0][key]
+        for key in runs[0]
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """List the metrics that regressed by more than `tolerance` (a fraction) against a baseline."""
+    regressions = []
+    for name, result in results.items():
+        for metric, higher_is_better in TRACKED_METRICS.items():
+            before = (baseline.get(name) or {}).get(metric)
+            if not before:
+                continue
+            change = (result[metric] - before) / before
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name}: {metric} {before:.3f} -> {result[metric]:.3f} ({change:+.0%})")
+    return regressions
+
+
+def print_results(results: dict):
+    table = Table(box=box.SIMPLE, padding=(0, 2))
+    table.add_column("Scenario", style="cyan")
+    table.add_column("Startup", justify="right")
+    table.add_column("Events", justify="right")
+    table.add_column("Events/s", justify="right")
+    table.add_column("Overhead/turn", justify="right")
+    table.add_column("Wall time", justify="right")
+    table.add_column("Peak RSS", justify="right")
+    for name, result in results.items():
+        table.add_row(
+            name,
+            f"{result['startup']:.2f}s",
+            str(int(result["events"])),
+            f"{result['events_per_sec']:.0f}",
+            f"{result['overhead_per_turn'] * 1000:.1f}ms",
+            f"{result['wall_time']:.2f}s" if result["wall_time"] is not None else "-",
+            f"{result['peak_rss_mb']:.0f} MB",
+        )
+    # Keep the table readable when the output is not a terminal
+    output = Console()
+    output.width = max(output.width, 110)
+    output.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run offline benchmarks of the agent's overhead")
+    parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS),
+                        help=f"Comma-separated scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario, the median is reported")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="Seconds every stub tool call takes")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Seconds every fake model turn takes")
+    parser.add_argument("--json", type=str, default=None, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Compare against results written with --json and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed regression against the baseline as a fraction (default: 0.2)")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    results = {}
+    for name in names:
+        console.print(f"[dim]Running {name}...[/dim]")
+        try:
+            runs = [run_scenario(SCENARIOS[name], args.tool_latency, args.model_latency)
+                    for _ in range(max(args.repeat, 1))]
+        except RuntimeError as e:
+            console.print(f"[red]{name} failed: {e}[/red]")
+            return 1
+        results[name] = median_result(runs)
+
+    print_results(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=1))
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            console.print(f"[red]Regression: {regression}[/red]")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
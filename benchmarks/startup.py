@@ -0,0 +1,90 @@
+"""Startup benchmark of the command line paths that do no work.
+
+`--help`, argument errors and an empty query on stdin must fail (or
+succeed) fast, without loading the ADK, LiteLLM, MCP or Rich. Every path
+runs `main.py` in a fresh process a few times. The benchmark fails if the
+median time of a path exceeds the budget, if a heavy module was imported,
+or if the path exits with an unexpected status.
+
+Usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --budget 0.5 --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCHMARK_DIR.parent
+
+# Name -> (arguments, stdin, expected exit status)
+PATHS = {
+    "help": (["--help"], None, 0),
+    "missing-target": ([], None, 2),
+    "invalid-target": (["--target", "desktop"], None, 2),
+    "empty-stdin": (["--target", "web"], "", 1),
+    "results-help": (["results", "--help"], None, 0),
+}
+
+# Packages that must not be imported on these paths
+HEAVY_MODULES = ("google.adk", "google.genai", "litellm", "mcp", "rich")
+
+
+def run_path(arguments, stdin, importtime=False):
+    """Run main.py once and return its exit status, duration and stderr."""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["main.py"] + arguments
+    start = time.monotonic()
+    process = subprocess.run(command, cwd=REPO_ROOT, input=stdin if stdin is not None else "",
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                             env=dict(os.environ, LITELLM_LOCAL_MODEL_COST_MAP="True"))
+    return process.returncode, time.monotonic() - start, process.stderr
+
+
+def heavy_imports(stderr: str):
+    """The heavy packages in the output of `python -X importtime`."""
+    imported = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        module = line.rsplit("|", 1)[-1].strip()
+        imported.update(heavy for heavy in HEAVY_MODULES if module == heavy or module.startswith(heavy + "."))
+    return sorted(imported)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the no-op command line paths start fast")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per path, the median is reported")
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="Maximum median seconds of every path (default: 1.0)")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'Path':<16} {'Median':>8} {'Max':>8}  Status")
+    for name, (arguments, stdin, expected) in PATHS.items():
+        runs = [run_path(arguments, stdin) for _ in range(max(args.repeat, 1))]
+        durations = [duration for _, duration, _ in runs]
+        median = statistics.median(durations)
+        statuses = sorted({status for status, _, _ in runs})
+        problems = []
+        if statuses != [expected]:
+            problems.append(f"exit status {statuses}, expected {expected}")
+        if median > args.budget:
+            problems.append(f"median {median:.3f}s over the budget of {args.budget:.3f}s")
+        imported = heavy_imports(run_path(arguments, stdin, importtime=True)[2])
+        if imported:
+            problems.append(f"imports {', '.join(imported)}")
+
+        print(f"{name:<16} {median:>7.3f}s {max(durations):>7.3f}s  {'; '.join(problems) or 'ok'}")
+        failures.extend(f"{name}: {problem}" for problem in problems)
+
+    for failure in failures:
+        print(f"FAILED {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Stub Playwright-like MCP stdio server for offline benchmarks.
+
+Serves `browser_snapshot`, `browser_click` and `browser_navigate` with a
+configurable latency and snapshot size, so the agent's own overhead can be
+measured without a browser.
+
+Usage:
+    python benchmarks/stub_mcp_server.py --latency 0.01 --snapshot-size 200000
+"""
+import argparse
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+
+def build_snapshot(size: int) -> str:
+    """Build an accessibility snapshot of roughly `size` bytes."""
+    lines = ["- Page URL: https://example.com/", "- Page Title: Example", "- Page Snapshot:", "```yaml"]
+    index = 0
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(f"- listitem [ref=e{index}]:")
+        lines.append(f"  - link \"Product {index}\" [ref=e{index}l]:")
+        lines.append(f"    - /url: /products/{index}")
+        index += 1
+    lines.append("```")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub MCP server for benchmarks")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every tool call takes")
+    parser.add_argument("--snapshot-size", type=int, default=1000, help="Size of a snapshot in bytes")
+    # Ignore flags meant for the real server, e.g. --isolated
+    args, _ = parser.parse_known_args()
+
+    snapshot = build_snapshot(args.snapshot_size)
+    server = FastMCP("benchmark-stub", log_level="ERROR")
+
+    @server.tool()
+    def browser_snapshot() -> str:
+        """Capture accessibility snapshot of the current page"""
+        time.sleep(args.latency)
+        return snapshot
+
+    @server.tool()
+    def browser_click(element: str, ref: str) -> str:
+        """Perform click on a web page"""
+        time.sleep(args.latency)
+        return f"Clicked {element} ({ref})"
+
+    @server.tool()
+    def browser_navigate(url: str) -> str:
+        """Navigate to a URL"""
+        time.sleep(args.latency)
+        return f"Navigated to {url}"
+
+    server.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,729 @@
 import asyncio
+import json
+import sys
+import time
 import warnings
 import logging
 import uuid
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from rich.console import Console
+from functools import lru_cache
+from pathlib import Path
 
-# Import from our modular structure
-from utils.config import setup_environment, get_default_model, use_litellm
-from utils.agent import get_agent_async
-from utils.cli import parse_args
-from utils.display import print_agent_events
-from utils.interactions import process_agent_interaction
+# Installed before anything else is imported, so every import is timed
+if "--profile-startup" in sys.argv:
+    from utils.startup import start_profiling
+    start_profiling()
+
+# Import from our modular structure. Modules that pull in the ADK, LiteLLM,
+# MCP or Rich are imported where they are needed, so `--help`, argument
+# errors and the results reports start without loading them.
+from utils.config import (
+    setup_environment, load_config, get_default_model, use_litellm, get_pool_settings, get_daemon_settings,
+    get_device_settings, get_budget_settings, get_results_settings, get_session_settings,
+    get_output_settings, get_tool_filter_settings, get_distributed_settings, get_verdict_cache_settings
+)
+from utils.budget import RunBudget
+from utils.devices import DeviceScheduler, discover_devices, pin_query
+from utils.cli import LATEST_SESSION, parse_args, parse_checkpoints_args, parse_results_args
+from utils.events import EventBus, TestResultEvent
+from utils.replay import TraceRecorder, load_trace, replay_trace
+from utils.results import ResultsRecorder, ResultsStore, new_batch_id, query_test_id
+from utils.sinks import EventFeed, create_sinks, dispatch_events
+from utils.startup import startup_phase
+from utils.verdicts import VerdictSink, verdict_query
 
 # Suppress warnings and reduce logging noise for cleaner output
 warnings.filterwarnings("ignore")
 logging.basicConfig(level=logging.ERROR)
 
-# Load configuration and setup environment
-config = setup_environment()
-DEFAULT_MODEL = get_default_model(config)
-USE_LITELLM = use_litellm(config)
+# Define app name and user ID for the agent sessions
+APP_NAME = "ui-test-agent"
+USER_ID = "user"
 
-# Initialize Rich console
-console = Console()
+@lru_cache(maxsize=None)
+def status_console():
+    """The Rich console for status messages, created on first use.
+    
+    Status messages go to stderr so they never mix with the event output on stdout.
+    """
+    from rich.console import Console
+    return Console(stderr=True)
 
-async def async_main():
-    args = parse_args()
+# All runs of this invocation share a batch in the results store
+BATCH = new_batch_id()
+
+def create_pool(default_size):
+    """Create the MCP server pool from config, sized to default_size unless configured."""
+    from utils.pool import MCPServerPool
+    pool_settings = get_pool_settings(load_config())
+    return MCPServerPool(
+        max_size=pool_settings['max_size'] or default_size,
+        idle_timeout=pool_settings['idle_timeout'],
+        health_check_timeout=pool_settings['health_check_timeout'],
+    )
+
+def budget_overrides(args):
+    """The budget limits given on the command line."""
+    return {
+        'max_llm_turns': args.max_turns,
+        'max_tool_calls': args.max_tool_calls,
+        'max_wall_time': args.max_time,
+        'max_tokens': args.max_tokens,
+    }
+
+def create_budget(args):
+    """Create the per-run budget from config, overridden by command line options."""
+    return RunBudget.from_settings(get_budget_settings(load_config()), **budget_overrides(args))
+
+def open_results_store():
+    """Open the historical results store, or return None if it is disabled."""
+    results_settings = get_results_settings(load_config())
+    if not results_settings['enabled']:
+        return None
+    return ResultsStore(results_settings['path'], results_settings['store_events'])
+
+def create_recorder(args, target, model_to_use, query, device=None):
+    """Create the sink that writes a single run to the results store, if it is enabled."""
+    store = open_results_store()
+    if store is None:
+        return None
+    return ResultsRecorder(store, args.test_id or query_test_id(query), target, model_to_use, BATCH,
+                           device.device_id if device else None)
+
+def with_recorder(sinks, recorder):
+    """Add the results store recorder to the output sinks, if there is one."""
+    return sinks + [recorder] if recorder is not None else sinks
+
+def run_results_command(args):
+    """Print a report of the historical results store.
     
-    model_to_use = args.model if args.model else DEFAULT_MODEL
-    target = args.target
+    Returns:
+        The process exit code: 1 if the store is missing or regressions were found, 0 otherwise.
+    """
+    path = Path(args.db or get_results_settings(load_config())['path']).expanduser()
+    if not path.exists():
+        sys.stderr.write(f"Error: No results store found at {path}. Enable 'results' in config.yaml.\n")
+        return 1
+    store = ResultsStore(path)
+    since = time.time() - args.since * 86400 if args.since else None
+    subtitle = None
+    try:
+        if args.report == "slowest-tests":
+            rows = store.slowest_tests(args.limit, since)
+        elif args.report == "slowest-tools":
+            rows = store.slowest_tools(args.limit, since)
+        elif args.report == "durations":
+            rows = store.durations_over_time(args.test, since, args.bucket)
+        elif args.report == "flaky":
+            rows = store.flaky_tests(args.window, since)
+        elif args.report == "batches":
+            rows = store.batches(args.limit)
+        else:
+            comparison = store.regressions(args.baseline, args.batch, args.tolerance)
+            rows = comparison['regressions']
+            subtitle = f"{comparison['batch']} against baseline {comparison['baseline']}"
+    except ValueError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+    finally:
+        store.close()
+    
+    if args.format == "json":
+        print(json.dumps(rows, indent=1))
+    else:
+        from utils.display import print_results_report
+        print_results_report(args.report, rows, subtitle)
+    return 1 if args.report == "regressions" and rows else 0
+
+def open_session_service(required=False):
+    """Open the persistent session service, or return None if sessions are neither enabled nor required."""
+    session_settings = get_session_settings(load_config())
+    if not (session_settings['enabled'] or required):
+        return None
+    from utils.sessions import SqliteSessionService
+    return SqliteSessionService(session_settings['path'], session_settings['checkpoint_dir'])
+
+def run_checkpoints_command(args):
+    """List the saved checkpoints, or delete one.
+    
+    Returns:
+        The process exit code: 1 if the checkpoint to delete does not exist, 0 otherwise.
+    """
+    from utils.sessions import SqliteSessionService
     
-    session_service = InMemorySessionService()
+    session_settings = get_session_settings(load_config())
+    session_service = SqliteSessionService(args.db or session_settings['path'], session_settings['checkpoint_dir'])
+    try:
+        if args.delete:
+            if not session_service.delete_checkpoint(args.delete):
+                sys.stderr.write(f"Error: Unknown checkpoint: {args.delete}\n")
+                return 1
+            status_console().print(f"Deleted checkpoint [cyan]{args.delete}[/cyan]")
+            return 0
+        from utils.display import print_checkpoints
+        print_checkpoints(session_service.list_checkpoints())
+        return 0
+    finally:
+        session_service.close()
 
-    # Define app name and generate random session ID
-    APP_NAME = "ui-test-agent"
-    USER_ID = "user"
-    SESSION_ID = str(uuid.uuid4())
+def load_suite_cases(args):
+    """Load the test cases of the suite, with the command line checkpoint and tool profile as defaults.
+    
+    Raises:
+        ValueError: If the suite contains no test cases.
+    """
+    from utils.suite import load_test_cases
+    
+    cases = load_test_cases(args.suite)
+    for case in cases:
+        case.checkpoint = case.checkpoint or args.from_checkpoint
+        case.tool_profile = case.tool_profile or args.tool_profile
+    return cases
 
-    session_service.create_session(
-        state={}, app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID
+async def create_scheduler(args):
+    """Create the device scheduler for `--devices`.
+    
+    Returns:
+        A tuple of (scheduler, devices), or (None, []) without `--devices`.
+    """
+    if args.devices is None:
+        return None, []
+    device_settings = get_device_settings(load_config())
+    scheduler = DeviceScheduler(
+        device_settings,
+        max_failures=device_settings['max_failures'],
+        quarantine_time=device_settings['quarantine_time'],
     )
+    devices = await scheduler.discover(args.target, args.devices)
+    if devices:
+        status_console().print(f"[bold]Sharding across {len(devices)} devices:[/bold] "
+                      f"{', '.join(device.label for device in devices)}")
+    return scheduler, devices
+
+async def prewarm_pool(pool, target, devices, count):
+    """Pay the MCP server startup cost once per worker (or device), before the first test case."""
+    try:
+        if devices:
+            await asyncio.gather(*[pool.prewarm(target, 1, device) for device in devices[:count]])
+        else:
+            await pool.prewarm(target, count)
+    except Exception as e:
+        status_console().print(f"[yellow]Warning: Could not prewarm MCP servers: {e}[/yellow]")
+
+def result_reporter(feed, verdict_cache=None, cache_keys=None):
+    """A callback that hands each test result to the output sinks through an EventFeed.
+    
+    With a verdict cache, the verdicts of executed test cases are stored under their cache keys.
+    """
+    def report_result(result):
+        feed.put(TestResultEvent(result.test_id, result.target, result.verdict, result.duration,
+                                 result.tool_calls, result.error, result.device, result.cached))
+        if verdict_cache is not None and result.test_id in (cache_keys or {}):
+            verdict_cache.put(cache_keys[result.test_id], result)
+    return report_result
+
+def open_verdict_cache(args):
+    """Open the verdict cache if it is enabled or `--build` is given.
+    
+    Returns:
+        A tuple of (cache, build fingerprint), or (None, None) without a cache.
+    """
+    cache_settings = get_verdict_cache_settings(load_config())
+    if not (cache_settings['enabled'] or args.build):
+        return None, None
+    build = args.build or cache_settings['build']
+    if not build:
+        status_console().print("[yellow]Warning: The verdict cache needs the fingerprint of the app build, "
+                               "pass --build or set verdict_cache.build. Running every test case.[/yellow]")
+        return None, None
+    from utils.verdict_cache import VerdictCache, build_fingerprint
+    return VerdictCache(cache_settings['path'], cache_settings['ttl']), build_fingerprint(str(build))
+
+def skip_cached_cases(args, cases, verdict_cache, build, model_to_use):
+    """Take the test cases with a cached passing verdict out of the suite.
+    
+    Returns:
+        A tuple of (cached results, test cases to run, cache key by test ID of the test cases to run).
+    """
+    if verdict_cache is None:
+        return [], cases, {}
+    from utils.verdict_cache import split_cached
+    cached, cases, cache_keys = split_cached(cases, verdict_cache, model_to_use, args.target, build, args.force)
+    if cached:
+        status_console().print(f"[bold]Reusing {len(cached)} cached passing verdicts[/bold] "
+                               f"[dim](build {build[:19]})[/dim]")
+    return cached, cases, cache_keys
+
+def merge_results(cases, *results):
+    """Results of several parts of a suite, in the order of its test cases."""
+    order = {case.test_id: index for index, case in enumerate(cases)}
+    return sorted((result for part in results for result in part),
+                  key=lambda result: order.get(result.test_id, len(order)))
+
+async def run_suite_mode(args, model_to_use):
+    """Run every test case of the suite and print an aggregated report.
+    
+    Returns:
+        The process exit code: 0 if all test cases passed, 1 otherwise.
+    """
+    from utils.suite import run_suite
+    
+    try:
+        suite_cases = load_suite_cases(args)
+    except ValueError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+    verdict_cache, build = open_verdict_cache(args)
+    cached, cases, cache_keys = skip_cached_cases(args, suite_cases, verdict_cache, build, model_to_use)
+    session_service = open_session_service(required=any(case.checkpoint for case in cases))
+    
+    scheduler, devices = None, []
+    if cases:
+        scheduler, devices = await create_scheduler(args)
+    if scheduler is not None and not devices:
+        sys.stderr.write(f"Error: No {args.target} devices found\n")
+        return 1
+    
+    # Each device runs one test case at a time, so by default every device gets a worker
+    concurrency = args.concurrency or len(devices) or 1
+    pool = create_pool(default_size=concurrency)
+    feed = EventFeed(create_sinks(args.output, args.output_file), get_output_settings(load_config()))
+    report_result = result_reporter(feed, verdict_cache, cache_keys)
+    for result in cached:
+        report_result(result)
+    
+    store = open_results_store()
+    recorder_factory = None
+    if store is not None:
+        def recorder_factory(test_id, target):
+            return ResultsRecorder(store, test_id, target, model_to_use, BATCH)
+    
+    if cases:
+        status_console().print(f"[bold]Running {len(cases)} test cases with concurrency {concurrency}[/bold]")
+    start = time.monotonic()
+    results = []
+    async with pool:
+        if cases:
+            await prewarm_pool(pool, args.target, devices, min(concurrency, len(cases)))
+            results = await run_suite(
+                cases,
+                model_name=model_to_use,
+                default_target=args.target,
+                use_litellm=use_litellm(load_config()),
+                concurrency=concurrency,
+                on_result=report_result,
+                pool=pool,
+                scheduler=scheduler,
+                budget=create_budget(args),
+                recorder_factory=recorder_factory,
+                session_service=session_service,
+            )
+    results = merge_results(suite_cases, cached, results)
+    await feed.close()
+    if store is not None:
+        store.close()
+        if cases:
+            status_console().print(f"[dim]Results stored in batch {BATCH}[/dim]")
+    if session_service is not None:
+        session_service.close()
+    if verdict_cache is not None:
+        verdict_cache.close()
+    if args.output == "rich":
+        from utils.display import print_suite_report
+        print_suite_report(results, time.monotonic() - start)
+    return 0 if all(result.passed for result in results) else 1
+
+async def run_coordinator_mode(args, model_to_use):
+    """Hand out the test cases of the suite to workers and print an aggregated report.
+    
+    A suite whose previous coordinator stopped before all its test cases had
+    a result continues that batch.
+    
+    Returns:
+        The process exit code: 0 if all test cases passed, 1 otherwise.
+    """
+    from utils.distributed import Coordinator, TestQueue, suite_key
+    
+    try:
+        suite_cases = load_suite_cases(args)
+    except ValueError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+    settings = get_distributed_settings(load_config())
+    address = args.address or settings['address']
+    queue = TestQueue(settings['path'])
+    key = suite_key(args.suite, args.target)
+    unfinished = queue.unfinished_batch(key)
+    if unfinished is not None:
+        model_to_use = unfinished['model']
+    verdict_cache, build = open_verdict_cache(args)
+    cached, cases, cache_keys = skip_cached_cases(args, suite_cases, verdict_cache, build, model_to_use)
+    if unfinished is not None:
+        batch = unfinished['batch']
+        counts = queue.counts(batch)
+        status_console().print(f"[bold]↻ Continuing batch {batch}[/bold] [dim]({counts.get('done', 0)} of "
+                               f"{sum(counts.values())} test cases done)[/dim]")
+    else:
+        batch = BATCH
+        if cases:
+            queue.create_batch(batch, key, model_to_use, cases, args.target)
+    
+    feed = EventFeed(create_sinks(args.output, args.output_file), get_output_settings(load_config()))
+    report_result = result_reporter(feed, verdict_cache, cache_keys)
+    store = open_results_store()
+    recorder_factory = None
+    if store is not None:
+        def recorder_factory(test_id, target):
+            return ResultsRecorder(store, test_id, target, model_to_use, batch)
+    
+    start = time.monotonic()
+    results = []
+    try:
+        if unfinished is not None or cases:
+            coordinator = Coordinator(queue, batch, model_to_use, settings, on_result=report_result,
+                                      on_status=lambda message: status_console().print(message, markup=False),
+                                      recorder_factory=recorder_factory)
+            status_console().print(f"[bold]🛰  Coordinating {sum(queue.counts(batch).values())} test cases on"
+                                   f"[/bold] [cyan]{address}[/cyan] [dim](model: {model_to_use})[/dim]")
+            results = await coordinator.serve(address)
+        # A continued batch may hold test cases whose verdicts were cached since it was created
+        served = {result.test_id for result in results}
+        cached = [result for result in cached if result.test_id not in served]
+        for result in cached:
+            report_result(result)
+    finally:
+        await feed.close()
+        if store is not None:
+            store.close()
+        if verdict_cache is not None:
+            verdict_cache.close()
+        queue.close()
+    results = merge_results(suite_cases, cached, results)
+    if store is not None and served:
+        status_console().print(f"[dim]Results stored in batch {batch}[/dim]")
+    if args.output == "rich":
+        from utils.display import print_suite_report
+        print_suite_report(results, time.monotonic() - start)
+    return 0 if all(result.passed for result in results) else 1
+
+async def run_worker_mode(args):
+    """Run the test cases a coordinator hands out on this machine's devices.
+    
+    Returns:
+        The process exit code: 1 if the coordinator could not be reached, 0 otherwise.
+    """
+    from utils.distributed import CoordinatorClient, CoordinatorError, run_worker, worker_name
+    from utils.suite import execute_test_case
+    
+    config = load_config()
+    settings = get_distributed_settings(config)
+    address = args.address or settings['address']
+    scheduler, devices = await create_scheduler(args)
+    if scheduler is not None and not devices:
+        sys.stderr.write(f"Error: No {args.target} devices found\n")
+        return 1
+    concurrency = args.concurrency or len(devices) or 1
+    pool = create_pool(default_size=concurrency)
+    session_service = open_session_service()
+    budget = create_budget(args)
+    
+    async def run_case(case, model_name, sink):
+        return await execute_test_case(case, pool, model_name, args.target, use_litellm(config), scheduler,
+                                       budget, sink, session_service)
+    
+    def report_result(result):
+        status_console().print(f"{'✓' if result.passed else '✗'} {result.test_id}: {result.verdict} "
+                               f"({result.duration:.1f}s)", markup=False)
+    
+    name = worker_name()
+    client = CoordinatorClient(address, name, settings['token'], settings['reconnect_timeout'])
+    status_console().print(f"[bold]Worker {name} running up to {concurrency} {args.target} test cases "
+                           f"for[/bold] [cyan]{address}[/cyan]")
+    try:
+        async with pool:
+            await prewarm_pool(pool, args.target, devices, concurrency)
+            results = await run_worker(client, [args.target], run_case, concurrency,
+                                       settings['heartbeat_interval'], on_result=report_result)
+    except (ConnectionError, CoordinatorError) as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+    finally:
+        if session_service is not None:
+            session_service.close()
+    status_console().print(f"[bold]Suite done, this worker ran {len(results)} test cases[/bold]")
+    return 0
 
-    root_agent, exit_stack = await get_agent_async(model_to_use, target, USE_LITELLM)
+async def run_daemon_mode(args, model_to_use):
+    """Run the resident agent daemon until interrupted."""
+    from utils.daemon import AgentDaemon
+    
+    config = load_config()
+    daemon_settings = get_daemon_settings(config)
+    address = args.address or daemon_settings['address']
+    prewarm = daemon_settings['prewarm'] or {args.target: 1}
+    
+    daemon = AgentDaemon(model_to_use, use_litellm(config), create_pool(default_size=4), get_budget_settings(config),
+                         daemon_settings['token'])
+    status_console().print(f"[bold]🛰  Agent daemon listening on[/bold] [cyan]{address}[/cyan] [dim](model: {model_to_use})[/dim]")
+    try:
+        await daemon.serve(address, prewarm=prewarm)
+    except ValueError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
 
+async def run_submit_mode(args):
+    """Send the query to a running daemon and print the streamed events."""
+    from utils.daemon import submit_query
+    
+    daemon_settings = get_daemon_settings(load_config())
+    address = args.address or daemon_settings['address']
+    try:
+        recorder = create_recorder(args, args.target, args.model or get_default_model(load_config()), args.query)
+        await dispatch_events(
+            submit_query(args.query, args.target, address, args.model, budget_overrides(args), args.tool_profile,
+                         daemon_settings['token']),
+            with_recorder(create_sinks(args.output, args.output_file), recorder),
+            get_output_settings(load_config())
+        )
+    except OSError as e:
+        sys.stderr.write(f"Error: Could not connect to agent daemon at {address}: {e}\n")
+        return 1
+
+def create_runner(root_agent, session_service=None, session_id=None):
+    """Create a runner for the agent, with a fresh in-memory session unless a session is given.
+    
+    Args:
+        root_agent: The agent to run
+        session_service: Optional session service that already holds the session
+        session_id: ID of the session in session_service
+    
+    Returns:
+        A tuple of (runner, session_id).
+    """
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+    
+    if session_service is None:
+        session_service = InMemorySessionService()
+        
+        # Generate random session ID
+        session_id = str(uuid.uuid4())
+        
+        session_service.create_session(
+            state={}, app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+        )
+    
     runner = Runner(
         agent=root_agent,
         app_name=APP_NAME,
         session_service=session_service
     )
+    return runner, session_id
+
+async def run_replay_mode(args, model_to_use):
+    """Replay a recorded trace, handing over to the agent if the app diverges."""
+    from utils.agent import create_agent
+    from utils.interactions import process_agent_interaction
+    from utils.tools import get_tools_async, prepare_tools
+    
+    try:
+        trace = load_trace(args.replay)
+    except ValueError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+    
+    target = trace.get('target') or args.target
+    tools, exit_stack = await get_tools_async(target)
+    event_bus = EventBus()
+    
+    def run_agent(query):
+        root_agent = create_agent(model_to_use, target, tools, use_litellm(load_config()), show_info=False,
+                                  event_bus=event_bus, tool_profile=args.tool_profile, query=query)
+        runner, session_id = create_runner(root_agent)
+        return process_agent_interaction(runner, verdict_query(query), USER_ID, session_id, event_bus,
+                                         create_budget(args))
+    
+    event_generator = replay_trace(trace, prepare_tools(tools, target, event_bus), run_agent, event_bus)
+    recorder = create_recorder(args, target, model_to_use, trace['query'])
+    await dispatch_events(event_generator, with_recorder(create_sinks(args.output, args.output_file), recorder),
+                          get_output_settings(load_config()))
+    await exit_stack.aclose()
+
+def start_session(args, session_service, target):
+    """Create, continue, resume or fork the persistent session of a single query.
+    
+    Returns:
+        A tuple of (session, message, query): the session, the message sent to
+        the agent and the query of the test.
+    
+    Raises:
+        ValueError: If the session to resume or the checkpoint does not exist.
+    """
+    from utils.sessions import CHECKPOINT_MESSAGE, RESUME_MESSAGE
+    
+    if args.resume:
+        session_id = args.resume
+        if session_id == LATEST_SESSION:
+            session_id = session_service.last_interrupted(APP_NAME, USER_ID, target)
+            if session_id is None:
+                raise ValueError(f"No interrupted {target} run to resume")
+        run = session_service.get_run(APP_NAME, USER_ID, session_id)
+        if run is None:
+            raise ValueError(f"Unknown session: {session_id}")
+        session = session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+        dropped = session_service.truncate_to_last_step(session)
+        status_console().print(f"[bold]↻ Resuming session[/bold] [cyan]{session_id}[/cyan] "
+                               f"[dim]after {len(session.events)} events, {dropped} of an unfinished step dropped[/dim]")
+        return session, RESUME_MESSAGE, run['query'] or ""
+    
+    if args.session:
+        session = session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=args.session)
+        if session is not None:
+            return session, args.query, args.query
+    if args.from_checkpoint:
+        session = session_service.fork_checkpoint(args.from_checkpoint, APP_NAME, USER_ID, args.session)
+        return session, CHECKPOINT_MESSAGE + args.query, args.query
+    session = session_service.create_session(app_name=APP_NAME, user_id=USER_ID, state={}, session_id=args.session)
+    return session, args.query, args.query
+
+def start_browser_profile(args, session_service, target):
+    """The browser profile a web run starts with, if it starts from or is saved as a checkpoint.
+    
+    The profile is a temporary copy, so the checkpoint it came from stays unchanged.
+    """
+    if target != "web" or session_service is None:
+        return None
+    from utils.sessions import copy_browser_profile, new_browser_profile
+    
+    profile = None
+    if args.from_checkpoint:
+        profile = copy_browser_profile(session_service.get_checkpoint(args.from_checkpoint))
+    if profile is None and args.save_checkpoint:
+        profile = new_browser_profile()
+    return profile
 
-    # Process and print agent events
+def finish_session(args, session_service, session, target, query, verdict_sink, browser_profile):
+    """Mark the run of a persistent session as completed and save it as a checkpoint if requested.
+    
+    A run without a final response stays resumable. Called after the MCP
+    server has been shut down, so the browser profile is complete.
+    """
+    from utils.sessions import COMPLETED
+    
+    if verdict_sink.final_response:
+        session_service.set_run(session, COMPLETED)
+    if args.save_checkpoint:
+        verdict, _ = verdict_sink.verdict()
+        if verdict in ("passed", "unknown"):
+            session = session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session.id)
+            session_service.save_checkpoint(args.save_checkpoint, session, target, query, browser_profile)
+            status_console().print(f"[bold]⚑ Saved checkpoint[/bold] [cyan]{args.save_checkpoint}[/cyan]")
+        else:
+            status_console().print(f"[yellow]Checkpoint {args.save_checkpoint} not saved, the run ended "
+                                   f"with verdict {verdict}[/yellow]")
+    if browser_profile is not None:
+        # The temporary directory of the profile, which is left empty if the profile was saved
+        import shutil
+        shutil.rmtree(browser_profile.parent, ignore_errors=True)
+
+async def async_main():
+    with startup_phase("parse arguments"):
+        results_args = checkpoints_args = None
+        if sys.argv[1:2] == ["results"]:
+            results_args = parse_results_args(sys.argv[2:])
+        elif sys.argv[1:2] == ["checkpoints"]:
+            checkpoints_args = parse_checkpoints_args(sys.argv[2:])
+        else:
+            args = parse_args()
+    if results_args is not None:
+        return run_results_command(results_args)
+    if checkpoints_args is not None:
+        return run_checkpoints_command(checkpoints_args)
+    
+    # Configuration is only loaded once the arguments are valid
+    with startup_phase("load configuration"):
+        config = setup_environment()
+    model_to_use = args.model if args.model else get_default_model(config)
+    target = args.target
+    
+    if args.tool_profile:
+        from utils.tool_filter import get_profile_tools
+        try:
+            get_profile_tools(args.tool_profile, get_tool_filter_settings(config, target))
+        except ValueError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+    
+    if args.serve:
+        return await run_daemon_mode(args, model_to_use)
+    if args.submit:
+        return await run_submit_mode(args)
+    if args.worker:
+        return await run_worker_mode(args)
+    if args.coordinate:
+        return await run_coordinator_mode(args, model_to_use)
+    if args.suite:
+        return await run_suite_mode(args, model_to_use)
+    if args.replay:
+        return await run_replay_mode(args, model_to_use)
+    
+    device = None
+    if args.device:
+        devices = await discover_devices(target, args.device, get_device_settings(config))
+        if not devices:
+            sys.stderr.write(f"Error: No {target} devices found\n")
+            return 1
+        device = devices[0]
+    
+    with startup_phase("import agent modules"):
+        from utils.agent import get_agent_async
+        from utils.interactions import process_agent_interaction
+    
+    # Persistent sessions keep the conversation on disk, so an interrupted run can be resumed
+    session_service = open_session_service(
+        required=bool(args.session or args.resume or args.from_checkpoint or args.save_checkpoint)
+    )
+    session = None
+    message = query = args.query
+    if session_service is not None:
+        from utils.sessions import RUNNING
+        try:
+            session, message, query = start_session(args, session_service, target)
+        except ValueError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        session_service.set_run(session, RUNNING, target, query)
+        status_console().print(f"[dim]Session {session.id}[/dim]")
+    browser_profile = start_browser_profile(args, session_service, target)
+    
+    event_bus = EventBus()
+    with startup_phase("start MCP server and create agent"):
+        root_agent, exit_stack = await get_agent_async(
+            model_to_use, target, use_litellm(config), show_info=args.output == "rich", event_bus=event_bus,
+            device=device, browser_profile=browser_profile, tool_profile=args.tool_profile, query=query
+        )
+    
+    runner, session_id = create_runner(root_agent, session_service, session.id if session else None)
+    
+    verdict_sink = VerdictSink()
+    sinks = with_recorder(create_sinks(args.output, args.output_file) + [verdict_sink],
+                          create_recorder(args, target, model_to_use, query, device))
+    if args.record:
+        sinks.append(TraceRecorder(args.record, target))
+    
+    # Process agent events and hand them to the output sinks
     event_generator = process_agent_interaction(
         runner=runner,
-        query=args.query,
+        query=verdict_query(pin_query(message, device)),
         user_id=USER_ID,
-        session_id=SESSION_ID
+        session_id=session_id,
+        event_bus=event_bus,
+        budget=create_budget(args)
     )
-    await print_agent_events(event_generator)
+    await dispatch_events(event_generator, sinks, get_output_settings(config))
     await exit_stack.aclose()
+    if session_service is not None:
+        finish_session(args, session_service, session, target, query, verdict_sink, browser_profile)
+        session_service.close()
 
 if __name__ == "__main__":
-    asyncio.run(async_main())
+    sys.exit(asyncio.run(async_main()))
@@ -0,0 +1,101 @@
+import dataclasses
+import time
+
+import pytest
+
+from utils import distributed, suite
+from utils.distributed import Coordinator, CoordinatorError, split_events
+
+BATCH = "batch-1"
+
+
+class Clock:
+    """Stands in for the time module, so leases expire without waiting."""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return time.monotonic()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(distributed, "time", clock)
+    return clock
+
+
+def create_coordinator(tmp_path, results, max_attempts=3, token=None):
+    queue = distributed.TestQueue(tmp_path / "queue.sqlite")
+    queue.create_batch(BATCH, "suite", "model", [suite.TestCase(test_id="login", query="Log in")], "web")
+    settings = {"lease_timeout": 60, "max_attempts": max_attempts, "token": token}
+    return Coordinator(queue, BATCH, "model", settings, on_result=results.append)
+
+
+def lease(coordinator, worker):
+    return coordinator.handle_request({"op": "lease", "worker": worker, "targets": ["web"]})
+
+
+def complete(coordinator, token, worker):
+    result = suite.TestResult(test_id="login", target="web", verdict="passed", duration=1.0, device=worker)
+    return coordinator.handle_request({"op": "complete", "lease": token, "result": dataclasses.asdict(result)})
+
+
+def test_lost_lease_is_requeued_then_given_up(tmp_path, clock):
+    results = []
+    coordinator = create_coordinator(tmp_path, results, max_attempts=2)
+
+    first = lease(coordinator, "w1")["lease"]
+    assert first["attempt"] == 1
+    assert lease(coordinator, "w2") == {"retry_after": distributed.RETRY_AFTER}
+    clock.now += 30
+    assert coordinator.handle_request({"op": "heartbeat", "lease": first["token"]}) == {"ok": True}
+
+    clock.now += 61
+    coordinator.expire_leases()
+    assert coordinator.queue.counts(BATCH) == {"pending": 1}
+    assert coordinator.handle_request({"op": "heartbeat", "lease": first["token"]}) == {"ok": False}
+
+    second = lease(coordinator, "w2")["lease"]
+    assert second["attempt"] == 2
+    clock.now += 61
+    coordinator.expire_leases()
+    assert [result.verdict for result in results] == ["error"]
+    assert lease(coordinator, "w3") == {"done": True}
+
+
+def test_late_complete_after_lost_lease_is_rejected(tmp_path, clock):
+    results = []
+    coordinator = create_coordinator(tmp_path, results)
+
+    first = lease(coordinator, "w1")["lease"]
+    clock.now += 61
+    coordinator.expire_leases()
+    second = lease(coordinator, "w2")["lease"]
+
+    assert complete(coordinator, first["token"], "w1") == {"ok": False}
+    assert results == []
+    assert complete(coordinator, second["token"], "w2") == {"ok": True}
+    assert [result.device for result in results] == ["w2"]
+    assert [result.device for result in coordinator.queue.results(BATCH)] == ["w2"]
+
+
+def test_requests_need_the_token(tmp_path):
+    coordinator = create_coordinator(tmp_path, [], token="s3cret")
+    with pytest.raises(CoordinatorError):
+        lease(coordinator, "w1")
+    assert "lease" in coordinator.handle_request({"op": "lease", "worker": "w1", "targets": ["web"],
+                                                  "token": "s3cret"})
+
+
+def test_oversized_events_are_split_and_skipped():
+    events = [{"event_type": "tool_result", "seq": seq, "result": "x" * 40} for seq in range(4)]
+    events.append({"event_type": "tool_result", "seq": 4, "result": "x" * 500})
+    batches = split_events(events, limit=200)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert batches[-1][0]["event_type"] == "events_skipped"
+    assert split_events([]) == [[]]
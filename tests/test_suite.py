@@ -0,0 +1,21 @@
+import pytest
+
+from utils.suite import load_test_cases
+
+
+def write_manifest(tmp_path, entries):
+    path = tmp_path / "suite.yaml"
+    path.write_text("tests:\n" + "".join(f"  - {entry}\n" for entry in entries))
+    return path
+
+
+def test_manifest_rejects_duplicate_ids(tmp_path):
+    path = write_manifest(tmp_path, ["{id: login, query: Log in}", "{id: login, query: Log out}"])
+    with pytest.raises(ValueError, match="Duplicate test ID"):
+        load_test_cases(path)
+
+
+def test_manifest_rejects_unsupported_targets(tmp_path):
+    path = write_manifest(tmp_path, ["{id: login, query: Log in, target: Web}", "{id: cart, query: Buy, target: tv}"])
+    with pytest.raises(ValueError, match="Unsupported target"):
+        load_test_cases(path)
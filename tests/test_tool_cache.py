@@ -0,0 +1,39 @@
+import asyncio
+
+from google.adk.tools.base_tool import BaseTool
+from mcp.types import CallToolResult, TextContent
+
+from utils.compaction import wrap_with_compaction
+from utils.tool_cache import wrap_with_cache
+
+
+class FakeTool(BaseTool):
+    """An inspection tool that counts its calls and returns a fixed result."""
+
+    def __init__(self, name, is_error=False):
+        super().__init__(name=name, description="")
+        self.is_error = is_error
+        self.calls = 0
+
+    async def run_async(self, *, args, tool_context):
+        self.calls += 1
+        return CallToolResult(content=[TextContent(type="text", text="snapshot")], isError=self.is_error)
+
+
+def call_twice(tools):
+    async def run():
+        for _ in range(2):
+            await tools[0].run_async(args={}, tool_context=None)
+    asyncio.run(run())
+
+
+def test_compacted_errors_are_not_cached():
+    tool = FakeTool("browser_snapshot", is_error=True)
+    call_twice(wrap_with_cache(wrap_with_compaction([tool], {}), {}))
+    assert tool.calls == 2
+
+
+def test_compacted_results_are_cached():
+    tool = FakeTool("browser_snapshot")
+    call_twice(wrap_with_cache(wrap_with_compaction([tool], {}), {}))
+    assert tool.calls == 1
@@ -1,13 +1,25 @@
 from google.adk.agents import Agent
-from google.adk.models.lite_llm import LiteLlm
-from utils.tools import get_tools_async
+from utils.config import (
+    load_config, get_llm_cache_settings, get_prompt_cache_settings, get_routing_settings, get_fanout_settings,
+    get_tool_filter_settings
+)
+from utils.fanout import create_fanout_agent
+from utils.llm_cache import LlmCacheCallbacks, open_store
+from utils.routing import create_cascade, create_model
+from utils.tool_filter import filter_tools
+from utils.tools import get_tools_async, prepare_tools
 from utils.display import print_agent_instructions, print_agent_info
+from functools import lru_cache
 from pathlib import Path
 import sys
 
+@lru_cache(maxsize=None)
 def load_instruction(target=None):
     """Load the agent instruction from a file.
     
+    The result is cached, so every agent of a target gets the very same
+    instruction string and the prompt prefix stays byte-identical.
+    
     Args:
         target: The target platform (android, ios, or web)
     """
@@ -30,7 +42,7 @@ def load_instruction(target=None):
                     mobile_instruction = f.read().strip()
                 instruction = f"{instruction}\n\n{mobile_instruction}"
             else:
-                print(f"Warning: {mobile_instruction_path} not found. Using base instruction only.")
+                print(f"Warning: {mobile_instruction_path} not found. Using base instruction only.", file=sys.stderr)
         
         # Then load target-specific instructions
         target_instruction_path = Path(__file__).parent.parent / "prompts" / f"{target}_instruction.txt"
@@ -39,35 +51,64 @@ def load_instruction(target=None):
                 target_instruction = f.read().strip()
             instruction = f"{instruction}\n\n{target_instruction}"
         else:
-            print(f"Warning: {target_instruction_path} not found. Using base instruction only.")
+            print(f"Warning: {target_instruction_path} not found. Using base instruction only.", file=sys.stderr)
     
     # Final strip to ensure no trailing empty lines
     instruction = instruction.strip()
     
     return instruction
 
-async def get_agent_async(model_name, target, use_litellm=False):
-    """Creates an ADK Agent equipped with tools from the MCP Server.
+def create_agent(model_name, target, tools, use_litellm=False, show_info=True, event_bus=None, tool_profile=None,
+                 query=None):
+    """Creates an ADK Agent equipped with already loaded MCP tools.
     
     Args:
         model_name: The name of the model to use
         target: The target platform (android, ios, or web)
+        tools: The tools from the MCP server
         use_litellm: Whether to use LiteLLM wrapper for the model
+        show_info: Whether to print the instructions and agent information
+        event_bus: Optional EventBus receiving events emitted by the tool wrappers
+        tool_profile: Optional tool profile of the test, overriding the configured one
+        query: The text of the test, which the "auto" tool profile picks the tools from
+    
+    Raises:
+        ValueError: If the tool profile is unknown.
     """
-    # Get the appropriate tools based on the target
-    tools, exit_stack = await get_tools_async(target)
+    config = load_config()
+    server_tools_count = len(tools)
+    tools = filter_tools(tools, get_tool_filter_settings(config, target.lower()), tool_profile, query)
+    tools = prepare_tools(tools, target, event_bus)
     
     # Load instruction from file with the target platform
     instruction = load_instruction(target)
     
     # Print the combined instructions using the dedicated display function
-    print_agent_instructions(instruction)
+    if show_info:
+        print_agent_instructions(instruction)
+    
+    llm_cache_settings = get_llm_cache_settings(config)
+    prompt_cache_settings = get_prompt_cache_settings(config)
+    routing_settings = get_routing_settings(config)
     
     # Determine whether to use LiteLLM based on passed parameter
-    if use_litellm:
-        model = LiteLlm(model=model_name)
+    if routing_settings['enabled']:
+        model = create_cascade(model_name, use_litellm, routing_settings, event_bus, prompt_cache_settings)
+    elif use_litellm:
+        model = create_model(model_name, use_litellm, prompt_cache_settings)
     else:
         model = model_name
+    
+    callbacks = {}
+    if llm_cache_settings['enabled'] or (prompt_cache_settings['enabled'] and not use_litellm):
+        cache = LlmCacheCallbacks(
+            model,
+            open_store(llm_cache_settings['path'], llm_cache_settings['max_entries'], llm_cache_settings['ttl']),
+            cache_responses=llm_cache_settings['enabled'],
+            prefix_settings=prompt_cache_settings,
+            event_bus=event_bus,
+        )
+        callbacks = {'before_model_callback': cache.before_model, 'after_model_callback': cache.after_model}
 
     # Create the agent
     root_agent = Agent(
@@ -76,9 +117,41 @@ async def get_agent_async(model_name, target, use_litellm=False):
         description="Provide UI testing services",
         instruction=instruction,
         tools=tools,
+        **callbacks,
     )
     
+    fanout_settings = get_fanout_settings(config)
+    if fanout_settings['enabled']:
+        root_agent = create_fanout_agent(root_agent, fanout_settings)
+    
     # Print agent information using the dedicated display function
-    print_agent_info(root_agent.name, root_agent.model, len(tools), target, use_litellm)
+    if show_info:
+        print_agent_info(root_agent.name, root_agent.model, len(tools), target, use_litellm, server_tools_count)
+    
+    return root_agent
+
+async def get_agent_async(model_name, target, use_litellm=False, show_info=True, event_bus=None, device=None,
+                          browser_profile=None, tool_profile=None, query=None):
+    """Creates an ADK Agent equipped with tools from the MCP Server.
+    
+    Args:
+        model_name: The name of the model to use
+        target: The target platform (android, ios, or web)
+        use_litellm: Whether to use LiteLLM wrapper for the model
+        show_info: Whether to print the instructions and agent information
+        event_bus: Optional EventBus receiving events emitted by the tool wrappers
+        device: Optional Device to pin the MCP server to
+        browser_profile: Optional browser profile directory for the web MCP server
+        tool_profile: Optional tool profile of the test, overriding the configured one
+        query: The text of the test, which the "auto" tool profile picks the tools from
+    """
+    # Get the appropriate tools based on the target
+    tools, exit_stack = await get_tools_async(target, device, browser_profile)
+    
+    try:
+        root_agent = create_agent(model_name, target, tools, use_litellm, show_info, event_bus, tool_profile, query)
+    except BaseException:
+        await exit_stack.aclose()
+        raise
     
     return root_agent, exit_stack
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""Spilling of large tool payloads to an on-disk artifact store.
+
+Tool responses can carry megabytes of text or base64 screenshots. Events
+that keep them inline hold on to that memory for as long as any sink still
+queues or collects the event. Instead, strings above a size threshold are
+written to an artifact file when the event is created, and the event only
+carries a small PayloadRef with the handle and size. Sinks that need the
+content read it back through a memory map.
+
+Artifacts of the default temporary store are deleted as soon as the last
+reference to them is gone, so disk usage stays flat too. With a configured
+directory, artifacts are kept for later inspection.
+"""
+import atexit
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from utils.config import get_artifact_settings, load_config
+
+DEFAULT_THRESHOLD = 64 * 1024
+
+
+class PayloadRef:
+    """Reference to a payload that was spilled to an artifact file."""
+
+    __slots__ = ("handle", "size", "path", "media_type", "__weakref__")
+
+    def __init__(self, handle: str, size: int, path: str, media_type: Optional[str] = None):
+        self.handle = handle
+        self.size = size
+        self.path = path
+        self.media_type = media_type
+
+    def open(self) -> mmap.mmap:
+        """Memory-map the UTF-8 encoded payload read-only."""
+        with open(self.path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self) -> str:
+        """Read the payload back."""
+        with self.open() as mapped:
+            return mapped[:].decode("utf-8")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Describe the reference as JSON-serializable data, without the payload."""
+        data = {"artifact": self.handle, "size": self.size, "path": self.path}
+        if self.media_type:
+            data["media_type"] = self.media_type
+        return data
+
+    def __repr__(self) -> str:
+        return f"PayloadRef({self.handle}, {self.size} bytes)"
+
+
+class ArtifactStore:
+    """Writes large payloads to files and hands out references to them."""
+
+    def __init__(self, directory: Optional[str] = None, threshold: int = DEFAULT_THRESHOLD):
+        """Initializes the store.
+
+        Args:
+            directory: Directory that keeps the artifacts. By default, a temporary
+                directory is used and every artifact is deleted once it is no
+                longer referenced.
+            threshold: Length from which strings are spilled
+        """
+        self.threshold = threshold
+        self.temporary = directory is None
+        self.directory = Path(tempfile.mkdtemp(prefix="uitest-artifacts-")) if self.temporary \
+            else Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def put(self, payload: str, media_type: Optional[str] = None) -> PayloadRef:
+        """Write a payload to a new artifact file.
+
+        Base64 data (e.g. screenshots) is stored as it is: decoding it would
+        cost more than writing it.
+
+        Args:
+            payload: The text to store
+            media_type: Optional media type of base64 data
+        """
+        data = payload.encode("utf-8")
+        handle = uuid.uuid4().hex
+        path = self.directory / handle
+        with open(path, "wb") as f:
+            f.write(data)
+        ref = PayloadRef(handle, len(data), str(path), media_type)
+        if self.temporary:
+            weakref.finalize(ref, _remove, str(path))
+        return ref
+
+    def close(self) -> None:
+        """Delete a temporary store with all its artifacts."""
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def spill_payloads(value: Any, store: Optional["ArtifactStore"]) -> Any:
+    """Replace the large strings in JSON-like data by references to artifacts.
+
+    Args:
+        value: The data, e.g. a tool response converted with `to_jsonable`
+        store: The store to spill to. Without a store, the data is returned as is.
+    """
+    if store is None:
+        return value
+    if isinstance(value, str):
+        return store.put(value) if len(value) >= store.threshold else value
+    if isinstance(value, list):
+        return [spill_payloads(item, store) for item in value]
+    if isinstance(value, dict):
+        # MCP image and audio content carries base64 data next to its mime type
+        media_type = value.get("mimeType") if isinstance(value.get("mimeType"), str) else None
+        return {
+            key: store.put(item, media_type) if key == "data" and media_type and isinstance(item, str)
+            and len(item) >= store.threshold else spill_payloads(item, store)
+            for key, item in value.items()
+        }
+    return value
+
+
+_default_store: Optional[ArtifactStore] = None
+_default_store_lock = threading.Lock()
+
+
+def default_store() -> Optional[ArtifactStore]:
+    """The artifact store of this process as configured in `artifacts`, or None if disabled."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            settings = get_artifact_settings(load_config())
+            if not settings['enabled']:
+                return None
+            _default_store = ArtifactStore(settings['dir'], settings['threshold'])
+            atexit.register(_default_store.close)
+        return _default_store
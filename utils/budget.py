@@ -0,0 +1,143 @@
+"""Budgets that stop runaway agent conversations early.
+
+A budget limits the LLM turns, tool calls, tokens and wall time of a single
+run, and detects loops: the model issuing the same tool call with the same
+arguments again and again while the screen does not change.
+"""
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional
+
+from utils.events import BudgetExceededEvent
+from utils.replay import response_fingerprint
+
+
+@dataclass
+class RunBudget:
+    """Limits for a single run. A limit of None (or 0) means unlimited."""
+    max_llm_turns: Optional[int] = None
+    max_tool_calls: Optional[int] = None
+    max_wall_time: Optional[float] = None
+    max_tokens: Optional[int] = None
+    # How often the same tool call may be repeated on an unchanged screen
+    max_repeated_calls: Optional[int] = None
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], **overrides) -> "RunBudget":
+        """Create a budget from config settings, with overrides (e.g. from the command line) taking precedence."""
+        values = {field.name: settings.get(field.name) for field in fields(cls)}
+        values.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**values)
+
+    def is_limited(self) -> bool:
+        return any(getattr(self, field.name) for field in fields(self))
+
+
+class BudgetTracker:
+    """Checks the progress of a run against its budget."""
+
+    def __init__(self, budget: RunBudget):
+        self.budget = budget
+        loop = asyncio.get_running_loop()
+        self.deadline = loop.time() + budget.max_wall_time if budget.max_wall_time else None
+        self._started = loop.time()
+        self._screen = None
+        self._repeats: Dict[Any, int] = {}
+
+    def check_turn(self, metrics, is_final: bool) -> Optional[BudgetExceededEvent]:
+        """Check the budget after an LLM turn. A final answer is never cut off."""
+        if is_final:
+            return None
+        if self.budget.max_llm_turns and metrics.llm_turns >= self.budget.max_llm_turns:
+            return BudgetExceededEvent("max_llm_turns", self.budget.max_llm_turns, metrics.llm_turns)
+        tokens = (metrics.prompt_tokens or 0) + (metrics.completion_tokens or 0)
+        if self.budget.max_tokens and tokens >= self.budget.max_tokens:
+            return BudgetExceededEvent("max_tokens", self.budget.max_tokens, tokens)
+        return None
+
+    def check_tool_calls(self, calls: List[Any], metrics) -> Optional[BudgetExceededEvent]:
+        """Check the tool calls the model requested, before they are executed."""
+        if self.budget.max_tool_calls and metrics.tool_calls + len(calls) > self.budget.max_tool_calls:
+            return BudgetExceededEvent("max_tool_calls", self.budget.max_tool_calls, metrics.tool_calls + len(calls))
+
+        if self.budget.max_repeated_calls:
+            for call in calls:
+                key = (call.name, json.dumps(call.args or {}, sort_keys=True, default=str), self._screen)
+                self._repeats[key] = self._repeats.get(key, 0) + 1
+                if self._repeats[key] > self.budget.max_repeated_calls:
+                    return BudgetExceededEvent(
+                        "max_repeated_calls", self.budget.max_repeated_calls, self._repeats[key],
+                        f"{call.name} was called {self._repeats[key]} times with the same arguments "
+                        f"on an unchanged screen"
+                    )
+        return None
+
+    def observe_responses(self, responses: List[Any]):
+        """Remember what the screen looked like after the latest tool responses."""
+        if responses and self.budget.max_repeated_calls:
+            self._screen = response_fingerprint(responses[-1].response)
+
+    def wall_time_exceeded(self) -> BudgetExceededEvent:
+        used = asyncio.get_running_loop().time() - self._started
+        return BudgetExceededEvent("max_wall_time", self.budget.max_wall_time, round(used, 3))
+
+
+class _DetachErrorFilter(logging.Filter):
+    def filter(self, record):
+        return record.getMessage() != "Failed to detach context"
+
+
+_detach_filter = _DetachErrorFilter()
+
+
+def quiet_abandoned_spans():
+    """Silence the tracing errors caused by stopping a runner early.
+
+    The runner's nested generators are then finalized by the event loop in
+    another context, where OpenTelemetry cannot detach their spans and logs
+    a harmless error with a traceback.
+    """
+    logger = logging.getLogger("opentelemetry.context")
+    if _detach_filter not in logger.filters:
+        logger.addFilter(_detach_filter)
+
+
+async def next_before(events, deadline: Optional[float]):
+    """Await the next item of an async generator, giving up at a loop-time deadline.
+
+    Unlike `asyncio.wait_for`, the generator keeps running in the current
+    task, so context variables set inside the runner stay intact.
+
+    Raises:
+        asyncio.TimeoutError: If the deadline passes first.
+        StopAsyncIteration: If the generator is exhausted.
+    """
+    if deadline is None:
+        return await events.__anext__()
+
+    task = asyncio.current_task()
+    timed_out = False
+
+    def expire():
+        nonlocal timed_out
+        timed_out = True
+        task.cancel()
+
+    handle = asyncio.get_running_loop().call_at(deadline, expire)
+    try:
+        item = await events.__anext__()
+    except asyncio.CancelledError:
+        if not timed_out:
+            raise
+    finally:
+        handle.cancel()
+        # Python 3.11+ counts cancellation requests. Ours is withdrawn even if the step
+        # swallowed it, so that it cannot surface at a later, unrelated await
+        if timed_out and hasattr(task, "uncancel") and task.cancelling():
+            task.uncancel()
+    if timed_out:
+        # A step that finished once the deadline had fired is still too late
+        raise asyncio.TimeoutError()
+    return item
@@ -1,6 +1,9 @@
 import argparse
 import sys
 
+# `--resume` without a session ID resumes the latest interrupted run
+LATEST_SESSION = "latest"
+
 def parse_args():
     """Parse command line arguments for the UI Testing Agent."""
     parser = argparse.ArgumentParser(description="Run UI Testing Agent")
@@ -10,9 +13,131 @@ def parse_args():
                     default=None)
     parser.add_argument("--target", type=str, choices=["android", "ios", "web"], 
                     help="Target platform for the agent (required)", required=True)
+    parser.add_argument("--suite", type=str,
+                    help="Run a test suite from a directory of test files or a YAML manifest instead of a single query",
+                    default=None)
+    parser.add_argument("--concurrency", type=int,
+                    help="Number of test cases to run in parallel in suite mode "
+                         "(default: 1, or the number of devices with --devices)",
+                    default=None)
+    parser.add_argument("--devices", type=str,
+                    help="Shard the suite across devices: 'auto' for all connected devices (or the configured "
+                         "number of browser contexts), a number, or a comma-separated list of device IDs",
+                    default=None)
+    parser.add_argument("--device", type=str,
+                    help="Pin a single query to this device ID",
+                    default=None)
+    parser.add_argument("--max-turns", type=int,
+                    help="Stop a run after this many LLM turns (overrides config file)",
+                    default=None)
+    parser.add_argument("--max-tool-calls", type=int,
+                    help="Stop a run after this many tool calls (overrides config file)",
+                    default=None)
+    parser.add_argument("--max-time", type=float,
+                    help="Stop a run after this many seconds (overrides config file)",
+                    default=None)
+    parser.add_argument("--max-tokens", type=int,
+                    help="Stop a run after this many prompt and completion tokens (overrides config file)",
+                    default=None)
+    parser.add_argument("--serve", action="store_true",
+                    help="Start a resident daemon that keeps agents and MCP servers warm and accepts queries")
+    parser.add_argument("--submit", action="store_true",
+                    help="Submit the query to a running daemon instead of running it in this process")
+    parser.add_argument("--coordinate", action="store_true",
+                    help="Hand out the test cases of the suite to workers on other machines instead of running "
+                         "them here, and report their results")
+    parser.add_argument("--worker", action="store_true",
+                    help="Run test cases handed out by a coordinator on this machine's devices until its suite is done")
+    parser.add_argument("--address", type=str,
+                    help="Unix socket path or host:port of the daemon, or of the coordinator with --coordinate "
+                         "and --worker (overrides config file)",
+                    default=None)
+    parser.add_argument("--output", type=str, choices=["rich", "jsonl"],
+                    help="Output format: rich terminal rendering or one JSON event per line (default: rich)",
+                    default="rich")
+    parser.add_argument("--output-file", type=str,
+                    help="Write JSONL events to this file (default: stdout in jsonl mode)",
+                    default=None)
+    parser.add_argument("--record", type=str,
+                    help="Record the tool calls of this run into a trace file for later replay",
+                    default=None)
+    parser.add_argument("--replay", type=str,
+                    help="Replay a recorded trace without the model, falling back to the agent on divergence",
+                    default=None)
+    parser.add_argument("--test-id", type=str,
+                    help="ID under which a single query is stored in the results store (default: derived from the query)",
+                    default=None)
+    parser.add_argument("--session", type=str,
+                    help="Keep the conversation in the persistent session of this ID, continuing it if it exists",
+                    default=None)
+    parser.add_argument("--resume", type=str, nargs="?", const=LATEST_SESSION,
+                    help="Resume an interrupted run from its last completed step: the given session ID, "
+                         "or the latest interrupted run of the target",
+                    default=None)
+    parser.add_argument("--from-checkpoint", type=str,
+                    help="Start from the conversation (and for web, the browser state) of a named checkpoint",
+                    default=None)
+    parser.add_argument("--save-checkpoint", type=str,
+                    help="Save the conversation (and for web, the browser state) as a named checkpoint "
+                         "if the run does not fail",
+                    default=None)
+    parser.add_argument("--tool-profile", type=str,
+                    help="Only give the agent the tools of this profile, e.g. 'read-only', 'navigation', 'forms', "
+                         "a profile from the config file, or 'auto' to pick them from the query (overrides config file)",
+                    default=None)
+    parser.add_argument("--build", type=str,
+                    help="Fingerprint of the app build under test for the verdict cache: an APK or IPA file, "
+                         "which is hashed, or a version string (overrides config file)",
+                    default=None)
+    parser.add_argument("--force", action="store_true",
+                    help="Run every test case of the suite, even those with a cached passing verdict")
+    parser.add_argument("--profile-startup", action="store_true",
+                    help="Print the time spent in each startup phase and the slowest module imports on exit")
     
     args = parser.parse_args()
     
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.devices is not None and (args.suite is None and not args.worker or args.coordinate):
+        parser.error("--devices can only be used with --suite or --worker")
+    if args.coordinate and args.suite is None:
+        parser.error("--coordinate requires --suite")
+    if args.coordinate and args.concurrency is not None:
+        parser.error("--concurrency cannot be used with --coordinate, workers choose their own")
+    if args.worker and (args.coordinate or args.serve or args.submit or args.suite is not None
+                        or args.query is not None or args.record or args.replay or args.device
+                        or args.session or args.resume or args.save_checkpoint or args.from_checkpoint):
+        parser.error("--worker receives its test cases from the coordinator and only accepts --target, "
+                     "--devices, --concurrency, --address and budget options")
+    if (args.build or args.force) and args.suite is None:
+        parser.error("--build and --force can only be used with --suite")
+    if args.device and (args.serve or args.submit or args.suite is not None or args.replay):
+        parser.error("--device can only be used for a single local query, use --devices for suites")
+    
+    if args.serve and (args.submit or args.suite is not None or args.coordinate):
+        parser.error("--serve cannot be combined with --submit or --suite")
+    if args.tool_profile and args.serve:
+        parser.error("--tool-profile cannot be used with --serve, clients choose the profile of their queries")
+    if (args.record or args.replay) and (args.serve or args.submit or args.suite is not None):
+        parser.error("--record and --replay can only be used for a single local query")
+    if args.record and args.replay:
+        parser.error("--record cannot be combined with --replay")
+    
+    if (args.session or args.resume or args.save_checkpoint) and (args.serve or args.submit or args.suite is not None
+                                                                  or args.replay):
+        parser.error("--session, --resume and --save-checkpoint can only be used for a single local query")
+    if args.from_checkpoint and (args.serve or args.submit or args.replay):
+        parser.error("--from-checkpoint can only be used for a single local query or a suite")
+    if args.resume and (args.query is not None or args.session or args.from_checkpoint):
+        parser.error("--resume continues the query of the interrupted run and cannot be combined with "
+                     "--query, --session or --from-checkpoint")
+    
+    # In suite mode the queries come from the test files, the daemon receives them from clients,
+    # workers from the coordinator, a replay uses the query of the recorded trace and a resumed run
+    # the query of the interrupted run
+    if args.suite is not None or args.serve or args.worker or args.replay or args.resume:
+        return args
+    
     # If query is not provided via command line, read from stdin
     if args.query is None:
         # Check if there's data available on stdin (e.g., from a pipe)
@@ -27,4 +152,41 @@ def parse_args():
             sys.stderr.write("Error: No query provided. Please provide a query via --query parameter or pipe input to stdin.\n")
             sys.exit(1)
     
-    return args
\ No newline at end of file
+    return args
+
+
+RESULTS_REPORTS = ("slowest-tests", "slowest-tools", "durations", "flaky", "regressions", "batches")
+
+def parse_results_args(argv):
+    """Parse the arguments of the `results` subcommand, which queries the results store."""
+    parser = argparse.ArgumentParser(prog="main.py results", description="Query the historical results store")
+    parser.add_argument("report", choices=RESULTS_REPORTS, help="The report to show")
+    parser.add_argument("--db", type=str, help="Path of the results database (overrides config file)", default=None)
+    parser.add_argument("--since", type=float, help="Only consider runs of the last N days", default=None)
+    parser.add_argument("--limit", type=int, help="Number of rows of the slowest-* reports (default: 20)", default=20)
+    parser.add_argument("--test", type=str, help="Test ID for the durations report (default: all tests)", default=None)
+    parser.add_argument("--bucket", type=str, choices=["day", "week"],
+                    help="Period of the durations report (default: day)", default="day")
+    parser.add_argument("--window", type=int,
+                    help="Latest runs per test considered by the flaky report (default: 20)", default=20)
+    parser.add_argument("--batch", type=str,
+                    help="Batch checked by the regressions report (default: the latest)", default=None)
+    parser.add_argument("--baseline", type=str,
+                    help="Baseline batch of the regressions report (default: the batch before)", default=None)
+    parser.add_argument("--tolerance", type=float,
+                    help="Allowed growth of median durations as a fraction (default: 0.2)", default=0.2)
+    parser.add_argument("--format", type=str, choices=["table", "json"], help="Output format (default: table)",
+                    default="table")
+    parser.add_argument("--profile-startup", action="store_true",
+                    help="Print the time spent in each startup phase and the slowest module imports on exit")
+    return parser.parse_args(argv)
+
+
+def parse_checkpoints_args(argv):
+    """Parse the arguments of the `checkpoints` subcommand, which lists or deletes saved checkpoints."""
+    parser = argparse.ArgumentParser(prog="main.py checkpoints", description="List or delete saved checkpoints")
+    parser.add_argument("--delete", type=str, help="Delete the checkpoint of this name", default=None)
+    parser.add_argument("--db", type=str, help="Path of the sessions database (overrides config file)", default=None)
+    parser.add_argument("--profile-startup", action="store_true",
+                    help="Print the time spent in each startup phase and the slowest module imports on exit")
+    return parser.parse_args(argv)
@@ -0,0 +1,235 @@
+"""Compaction of large tool payloads before they are sent back to the model.
+
+Mobile element lists, Playwright accessibility snapshots and screenshots can
+be very large. Compaction prunes invisible nodes, collapses repeated subtrees,
+caps string lengths and optionally downscales images.
+"""
+import base64
+import io
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+from utils.events import EventBus, PayloadCompactionEvent, to_jsonable
+from utils.tool_wrapper import ToolWrapper
+
+DEFAULT_COMPACTION_SETTINGS = {
+    # Maximum length of string values inside JSON payloads (0 disables)
+    "max_string_length": 300,
+    # Maximum length of a whole text item, e.g. a snapshot (0 disables)
+    "max_text_length": 100000,
+    # Drop element nodes that are marked invisible or have an empty or negative bounding box
+    "prune_invisible": True,
+    # Keep at most this many identical sibling subtrees (0 disables)
+    "max_repeats": 3,
+    # Downscale images so that their longer side fits (0 disables, requires Pillow)
+    "image_max_dimension": 0,
+    # Re-encode downscaled images in this format ("jpeg", "png" or "webp")
+    "image_format": "jpeg",
+    "image_quality": 70,
+}
+
+VISIBILITY_KEYS = ("visible", "displayed", "isVisible")
+RECT_KEYS = ("rect", "bounds", "coordinates", "frame")
+REF_PATTERN = re.compile(r"\s*\[ref=[^\]]*\]")
+
+
+def payload_size(value: Any) -> int:
+    """Size of a tool payload in bytes when serialized as JSON."""
+    return len(json.dumps(to_jsonable(value), ensure_ascii=False, separators=(",", ":")).encode())
+
+
+class PayloadCompactor:
+    """Compacts MCP tool results according to a set of settings."""
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        self.settings = dict(DEFAULT_COMPACTION_SETTINGS)
+        self.settings.update(settings or {})
+
+    def compact(self, response: Any) -> Any:
+        """Return a compacted copy of a tool result.
+
+        MCP results are converted to plain dictionaries; anything that is not
+        an MCP result is returned unchanged.
+        """
+        data = to_jsonable(response)
+        if not isinstance(data, dict) or not isinstance(data.get("content"), list):
+            return response
+
+        data["content"] = [self._compact_item(item) for item in data["content"]]
+        return data
+
+    def _compact_item(self, item):
+        if not isinstance(item, dict):
+            return item
+        if item.get("type") == "text" and isinstance(item.get("text"), str):
+            return dict(item, text=self._compact_text(item["text"]))
+        if item.get("type") == "image" and self.settings["image_max_dimension"]:
+            return self._compact_image(item)
+        return item
+
+    def _compact_text(self, text: str) -> str:
+        # Structured payloads are often JSON, possibly after a short prefix like
+        # "Found these elements on screen: [...]"
+        start = min((index for index in (text.find("["), text.find("{")) if index >= 0), default=-1)
+        if start >= 0:
+            try:
+                data = json.loads(text[start:])
+            except ValueError:
+                pass
+            else:
+                data = self._compact_json(data)
+                text = text[:start] + json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+                return self._cap(text, self.settings["max_text_length"])
+
+        if self.settings["max_repeats"]:
+            text = self._collapse_repeated_lines(text)
+        return self._cap(text, self.settings["max_text_length"])
+
+    def _compact_json(self, value):
+        if isinstance(value, dict):
+            return {key: self._compact_json(item) for key, item in value.items()}
+        if isinstance(value, list):
+            items = [item for item in value if not (self.settings["prune_invisible"] and _is_invisible(item))]
+            items = [self._compact_json(item) for item in items]
+            if self.settings["max_repeats"]:
+                items = self._collapse_repeated_items(items)
+            return items
+        if isinstance(value, str):
+            return self._cap(value, self.settings["max_string_length"])
+        return value
+
+    def _collapse_repeated_items(self, items: List[Any]) -> List[Any]:
+        counts = {}
+        result = []
+        omitted = 0
+        for item in items:
+            key = json.dumps(item, sort_keys=True, default=str)
+            counts[key] = counts.get(key, 0) + 1
+            if counts[key] > self.settings["max_repeats"]:
+                omitted += 1
+            else:
+                result.append(item)
+        if omitted:
+            result.append(f"... {omitted} repeated items omitted")
+        return result
+
+    def _collapse_repeated_lines(self, text: str) -> str:
+        """Collapse identical subtrees of an indented (YAML-like) snapshot.
+
+        A subtree is a line together with the following lines that are
+        indented deeper. Subtrees are compared without their element refs,
+        and only repeats beyond `max_repeats` among siblings are dropped.
+        """
+        lines = text.split("\n")
+        result = []
+        # Per indentation level: how often each subtree signature was seen
+        seen: Dict[int, Dict[str, int]] = {}
+        # (indent, count, position in result) of the most recent omission marker
+        omitted = None
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            indent = len(line) - len(line.lstrip())
+            end = index + 1
+            while end < len(lines) and lines[end].strip() and \
+                    len(lines[end]) - len(lines[end].lstrip()) > indent:
+                end += 1
+
+            # Leaving a level invalidates the sibling bookkeeping of deeper levels
+            for level in [level for level in seen if level > indent]:
+                del seen[level]
+
+            signature = REF_PATTERN.sub("", "\n".join(lines[index:end]).strip())
+            siblings = seen.setdefault(indent, {})
+            siblings[signature] = siblings.get(signature, 0) + 1
+            if not signature or siblings[signature] <= self.settings["max_repeats"]:
+                result.append(line)
+                index += 1
+            else:
+                # Consecutive omissions at the same level share a single marker
+                if omitted and omitted[0] == indent and omitted[2] == len(result) - 1:
+                    omitted = (indent, omitted[1] + 1, omitted[2])
+                else:
+                    result.append("")
+                    omitted = (indent, 1, len(result) - 1)
+                result[-1] = " " * indent + f"# ... {omitted[1]} repeated subtrees omitted"
+                index = end
+        return "\n".join(result)
+
+    def _compact_image(self, item):
+        try:
+            from PIL import Image
+        except ImportError:
+            # Pillow is optional, images are passed through unchanged without it
+            return item
+
+        try:
+            image = Image.open(io.BytesIO(base64.b64decode(item["data"])))
+            image.thumbnail((self.settings["image_max_dimension"],) * 2)
+            image_format = self.settings["image_format"].lower()
+            if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, format=image_format.upper(), quality=self.settings["image_quality"])
+        except Exception:
+            return item
+
+        data = base64.b64encode(output.getvalue()).decode()
+        if len(data) >= len(item["data"]):
+            return item
+        return dict(item, data=data, mimeType=f"image/{image_format}")
+
+    @staticmethod
+    def _cap(text: str, limit: int) -> str:
+        if not limit or len(text) <= limit:
+            return text
+        return text[:limit] + f"…[truncated {len(text) - limit} chars]"
+
+
+def _is_invisible(node) -> bool:
+    if not isinstance(node, dict):
+        return False
+    if any(node.get(key) is False for key in VISIBILITY_KEYS):
+        return True
+    for key in RECT_KEYS:
+        rect = node.get(key)
+        if isinstance(rect, dict) and "width" in rect and "height" in rect:
+            try:
+                if float(rect["width"]) <= 0 or float(rect["height"]) <= 0:
+                    return True
+                if float(rect.get("x", 0)) + float(rect["width"]) < 0 or \
+                        float(rect.get("y", 0)) + float(rect["height"]) < 0:
+                    return True
+            except (TypeError, ValueError):
+                pass
+    return False
+
+
+class CompactingTool(ToolWrapper):
+    """Compacts tool results and reports the bytes saved as PayloadCompactionEvents."""
+
+    def __init__(self, tool, compactor: PayloadCompactor, event_bus: Optional[EventBus] = None):
+        super().__init__(tool)
+        self.compactor = compactor
+        self.event_bus = event_bus
+
+    async def run_async(self, *, args, tool_context):
+        response = await self.tool.run_async(args=args, tool_context=tool_context)
+        compacted = self.compactor.compact(response)
+        if self.event_bus is not None:
+            self.event_bus.emit(PayloadCompactionEvent(self.name, payload_size(response), payload_size(compacted)))
+        return compacted
+
+
+def wrap_with_compaction(tools, settings, event_bus: Optional[EventBus] = None):
+    """Wrap tools so their results are compacted before reaching the model.
+
+    Args:
+        tools: The tools from the MCP server
+        settings: Compaction settings for the target as returned by `get_compaction_settings`
+        event_bus: Optional bus for bytes-in/bytes-out events
+    """
+    compactor = PayloadCompactor(settings)
+    return [CompactingTool(tool, compactor, event_bus) for tool in tools]
+
@@ -1,16 +1,27 @@
 import os
+import sys
 import yaml
+from functools import lru_cache
 from pathlib import Path
 
 def load_config():
-    """Load configuration from config.yaml file."""
-    config_path = Path(__file__).parent.parent / "config.yaml"
+    """Load configuration from config.yaml file.
+    
+    The UITEST_CONFIG environment variable can point to another config file.
+    The file is only parsed once per process, later calls return the same
+    dictionary, which callers must not modify.
+    """
+    return _read_config(os.environ.get("UITEST_CONFIG") or str(Path(__file__).parent.parent / "config.yaml"))
+
+@lru_cache(maxsize=None)
+def _read_config(path):
+    config_path = Path(path)
     if not config_path.exists():
-        print("No config.yaml found. See config.sample.yaml for reference and create your own config.yaml.")
+        print(f"No config file found at {config_path}. See config.sample.yaml for reference and create your own config.yaml.", file=sys.stderr)
         return {}
         
     with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+        return yaml.safe_load(f) or {}
 
 def setup_environment():
     """Set up environment variables from config."""
@@ -18,7 +29,7 @@ def setup_environment():
     
     # Check for API key in config or environment
     if not config.get('google_api_key') and not os.environ.get('GOOGLE_API_KEY'):
-        print("Warning: No Google API key found. Set in config.yaml or as GOOGLE_API_KEY environment variable.")
+        print("Warning: No Google API key found. Set in config.yaml or as GOOGLE_API_KEY environment variable.", file=sys.stderr)
     
     # Set environment variables from config if provided
     if 'google_api_key' in config:
@@ -34,4 +45,237 @@ def get_default_model(config):
 
 def use_litellm(config):
     """Check if LiteLLM should be used based on config."""
-    return config.get('use_litellm', False)
\ No newline at end of file
+    return config.get('use_litellm', False)
+
+def get_pool_settings(config):
+    """Get the MCP server pool settings from config."""
+    pool_config = config.get('mcp_pool') or {}
+    return {
+        'max_size': pool_config.get('max_size'),
+        'idle_timeout': pool_config.get('idle_timeout', 300),
+        'health_check_timeout': pool_config.get('health_check_timeout', 10),
+    }
+
+
+def get_daemon_settings(config):
+    """Get the agent daemon settings from config."""
+    daemon_config = config.get('daemon') or {}
+    return {
+        'address': daemon_config.get('address', "/tmp/uitest-agent.sock"),
+        'prewarm': daemon_config.get('prewarm') or {},
+        'token': daemon_config.get('token'),
+    }
+
+
+def get_output_settings(config):
+    """Get the settings of the event queues between the agent and the output sinks from config."""
+    output_config = config.get('output') or {}
+    return {
+        'queue_size': output_config.get('queue_size', 256),
+        'overflow': output_config.get('overflow') or {},
+    }
+
+
+def get_artifact_settings(config):
+    """Get the settings of the store that large tool payloads are spilled to from config."""
+    artifact_config = config.get('artifacts') or {}
+    return {
+        'enabled': artifact_config.get('enabled', True),
+        'dir': artifact_config.get('dir'),
+        'threshold': artifact_config.get('threshold', 64 * 1024),
+    }
+
+
+def get_results_settings(config):
+    """Get the historical results store settings from config."""
+    results_config = config.get('results') or {}
+    return {
+        'enabled': results_config.get('enabled', False),
+        'path': results_config.get('path', "~/.local/share/uitest-agent/results.sqlite"),
+        'store_events': results_config.get('store_events', True),
+    }
+
+
+def get_session_settings(config):
+    """Get the persistent session and checkpoint settings from config."""
+    session_config = config.get('sessions') or {}
+    return {
+        'enabled': session_config.get('enabled', False),
+        'path': session_config.get('path', "~/.local/share/uitest-agent/sessions.sqlite"),
+        'checkpoint_dir': session_config.get('checkpoint_dir'),
+    }
+
+
+def get_device_settings(config):
+    """Get the device sharding settings from config."""
+    device_config = config.get('devices') or {}
+    return {
+        'android': device_config.get('android') or [],
+        'ios': device_config.get('ios') or [],
+        'web_contexts': device_config.get('web_contexts', 4),
+        'max_failures': device_config.get('max_failures', 2),
+        'quarantine_time': device_config.get('quarantine_time', 60),
+    }
+
+
+def get_budget_settings(config):
+    """Get the per-run budget settings from config. Missing limits are unlimited."""
+    budget_config = config.get('budget') or {}
+    return {
+        'max_llm_turns': budget_config.get('max_llm_turns'),
+        'max_tool_calls': budget_config.get('max_tool_calls'),
+        'max_wall_time': budget_config.get('max_wall_time'),
+        'max_tokens': budget_config.get('max_tokens'),
+        'max_repeated_calls': budget_config.get('max_repeated_calls'),
+    }
+
+
+def get_tool_cache_settings(config):
+    """Get the tool result cache settings from config."""
+    cache_config = config.get('tool_cache') or {}
+    return {
+        'enabled': cache_config.get('enabled', False),
+        'default_ttl': cache_config.get('default_ttl', 5),
+        'tools': cache_config.get('tools') or {},
+        'read_only': cache_config.get('read_only') or [],
+    }
+
+
+def get_llm_cache_settings(config):
+    """Get the model response cache settings from config."""
+    cache_config = config.get('llm_cache') or {}
+    return {
+        'enabled': cache_config.get('enabled', False),
+        'path': cache_config.get('path', "~/.cache/uitest-agent/llm_cache.sqlite"),
+        'max_entries': cache_config.get('max_entries', 1000),
+        'ttl': cache_config.get('ttl', 0),
+    }
+
+
+def get_verdict_cache_settings(config):
+    """Get the settings of the cache of passing verdicts from config."""
+    cache_config = config.get('verdict_cache') or {}
+    return {
+        'enabled': cache_config.get('enabled', False),
+        'path': cache_config.get('path', "~/.cache/uitest-agent/verdicts.sqlite"),
+        'ttl': cache_config.get('ttl', 7 * 24 * 3600),
+        'build': cache_config.get('build'),
+    }
+
+
+def get_prompt_cache_settings(config):
+    """Get the provider-side prompt prefix cache settings from config."""
+    cache_config = config.get('prompt_cache') or {}
+    return {
+        'enabled': cache_config.get('enabled', False),
+        'ttl': cache_config.get('ttl', 3600),
+        'keep_alive': cache_config.get('keep_alive', "30m"),
+    }
+
+
+def get_routing_settings(config):
+    """Get the settings for routing routine turns to a fast model from config."""
+    routing_config = config.get('routing') or {}
+    return {
+        'enabled': routing_config.get('enabled', False),
+        'fast_model': routing_config.get('fast_model', "gemini-2.0-flash"),
+        'fast_model_litellm': routing_config.get('fast_model_litellm', False),
+        # The strong model defaults to the configured model_name and use_litellm
+        'strong_model': routing_config.get('strong_model'),
+        'strong_model_litellm': routing_config.get('strong_model_litellm'),
+        'escalate_on_tool_error': routing_config.get('escalate_on_tool_error', True),
+        'escalate_on_invalid_response': routing_config.get('escalate_on_invalid_response', True),
+        'verify_final': routing_config.get('verify_final', True),
+        'sticky_turns': routing_config.get('sticky_turns', 1),
+    }
+
+
+def get_fanout_settings(config):
+    """Get the settings for verifying independent checks with parallel sub-agents from config."""
+    fanout_config = config.get('fanout') or {}
+    return {
+        'enabled': fanout_config.get('enabled', False),
+        'max_parallel': fanout_config.get('max_parallel', 4),
+        'read_only_tools': fanout_config.get('read_only_tools', []),
+    }
+
+
+def get_ui_diff_settings(config):
+    """Get the settings for diffing inspection results against the previous call from config."""
+    diff_config = config.get('ui_diff') or {}
+    return {
+        'enabled': diff_config.get('enabled', False),
+        'tools': diff_config.get('tools', []),
+        'max_diff_ratio': diff_config.get('max_diff_ratio', 0.5),
+    }
+
+
+def get_compaction_settings(config, target):
+    """Get the tool payload compaction settings for a target from config.
+    
+    Target-specific settings (e.g. `compaction.web`) override the shared ones.
+    """
+    compaction_config = config.get('compaction') or {}
+    settings = {
+        key: value for key, value in compaction_config.items()
+        if key not in ('android', 'ios', 'web')
+    }
+    settings.update(compaction_config.get(target) or {})
+    settings.setdefault('enabled', False)
+    return settings
+
+
+def get_tool_filter_settings(config, target):
+    """Get the settings for pruning the tools of an agent for a target from config.
+    
+    Target-specific settings (e.g. `tool_filter.web.deny`) override the shared ones.
+    """
+    filter_config = config.get('tool_filter') or {}
+    settings = {
+        key: value for key, value in filter_config.items()
+        if key not in ('android', 'ios', 'web')
+    }
+    settings.update(filter_config.get(target) or {})
+    return {
+        'allow': settings.get('allow') or [],
+        'deny': settings.get('deny') or [],
+        'profile': settings.get('profile'),
+        'profiles': settings.get('profiles') or {},
+    }
+
+
+def get_macro_settings(config):
+    """Get the settings of the local macro tools from config."""
+    macro_config = config.get('macros') or {}
+    return {
+        'enabled': macro_config.get('enabled', False),
+        'disabled': macro_config.get('disabled') or [],
+        'plugin_dir': macro_config.get('plugin_dir'),
+    }
+
+
+def get_wait_settings(config):
+    """Get the settings of the built-in wait_for tool from config."""
+    wait_config = config.get('wait_for') or {}
+    return {
+        'enabled': wait_config.get('enabled', False),
+        'default_timeout': wait_config.get('default_timeout', 10),
+        'max_timeout': wait_config.get('max_timeout', 60),
+        'initial_interval': wait_config.get('initial_interval', 0.25),
+        'max_interval': wait_config.get('max_interval', 2.0),
+        'backoff': wait_config.get('backoff', 2.0),
+    }
+
+
+def get_distributed_settings(config):
+    """Get the settings of distributed suite runs with a coordinator and workers from config."""
+    distributed_config = config.get('distributed') or {}
+    return {
+        'address': distributed_config.get('address', ":7420"),
+        'path': distributed_config.get('path', "~/.local/share/uitest-agent/queue.sqlite"),
+        'lease_timeout': distributed_config.get('lease_timeout', 60),
+        'heartbeat_interval': distributed_config.get('heartbeat_interval', 10),
+        'max_attempts': distributed_config.get('max_attempts', 3),
+        'reconnect_timeout': distributed_config.get('reconnect_timeout', 60),
+        'token': distributed_config.get('token'),
+    }
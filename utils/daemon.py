@@ -0,0 +1,231 @@
+"""Resident agent daemon that keeps runners and tool connections warm.
+
+Clients talk to the daemon over a Unix socket or a localhost TCP port using
+newline-delimited JSON: a client sends a single request line such as
+`{"query": "...", "target": "web"}` and receives one line per `AgentEvent`
+until the conversation ends and the connection is closed. A request may
+override the daemon's run budget with a `budget` object such as
+`{"max_tool_calls": 50}`, and the tool profile with `tool_profile`.
+
+The Unix socket is only accessible to the daemon's user. A daemon on a TCP
+port requires a shared `token`, which every request must carry.
+"""
+import asyncio
+import json
+import os
+import uuid
+import weakref
+from typing import AsyncGenerator, Optional
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+from utils.agent import create_agent
+from utils.budget import RunBudget
+from utils.config import get_tool_filter_settings, load_config
+from utils.events import AgentEvent, ErrorEvent, EventBus, event_from_dict
+from utils.interactions import process_agent_interaction
+from utils.pool import MCPServerPool
+from utils.suite import SUPPORTED_TARGETS
+from utils.tool_filter import filter_tools
+from utils.tools import reset_tools
+from utils.verdicts import verdict_query
+
+APP_NAME = "ui-test-agent"
+USER_ID = "user"
+DEFAULT_ADDRESS = "/tmp/uitest-agent.sock"
+
+# Upper bound for a single request line sent by a client
+MAX_REQUEST_SIZE = 1024 * 1024
+
+
+def parse_address(address: str):
+    """Split a daemon address into (socket_path, host, port).
+
+    An address of the form "host:port" or ":port" refers to a TCP socket,
+    anything else is treated as the path of a Unix socket.
+    """
+    host, _, port = address.rpartition(":")
+    if port.isdigit() and "/" not in address:
+        return None, host or "127.0.0.1", int(port)
+    return address, None, None
+
+
+class AgentDaemon:
+    """Serves test queries from a warm pool of MCP servers and agents."""
+
+    def __init__(self, model_name, use_litellm=False, pool: Optional[MCPServerPool] = None, budget_settings=None,
+                 token: Optional[str] = None):
+        """Initializes the daemon.
+
+        Args:
+            model_name: The name of the default model to use
+            use_litellm: Whether to use LiteLLM wrapper for the model
+            pool: The MCP server pool to lease servers from
+            budget_settings: Default budget limits of every run, as returned by `get_budget_settings`
+            token: Shared secret every request must carry; required on a TCP port
+        """
+        self.model_name = model_name
+        self.use_litellm = use_litellm
+        self.pool = pool or MCPServerPool()
+        self.budget_settings = budget_settings or {}
+        self.token = token
+        self.session_service = InMemorySessionService()
+        # Runners are built once per pooled server and model, and dropped with the server
+        self._runners = weakref.WeakKeyDictionary()
+
+    def _get_runner(self, server, model_name, query, tool_profile=None):
+        # A server is leased by one query at a time, so its runner and event bus are never shared.
+        # Queries whose tool profile selects the same tools share a runner.
+        tools = filter_tools(server.tools, get_tool_filter_settings(load_config(), server.target), tool_profile, query)
+        key = (model_name, tuple(tool.name for tool in tools))
+        runners = self._runners.setdefault(server, {})
+        if key not in runners:
+            event_bus = EventBus()
+            root_agent = create_agent(model_name, server.target, server.tools, self.use_litellm,
+                                      show_info=False, event_bus=event_bus, tool_profile=tool_profile, query=query)
+            runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=self.session_service)
+            runners[key] = (runner, event_bus)
+        return runners[key]
+
+    async def run_query(self, query: str, target: str, model_name=None, budget: Optional[RunBudget] = None,
+                        tool_profile: Optional[str] = None) -> AsyncGenerator[AgentEvent, None]:
+        """Run a single query on a leased MCP server and yield its events.
+
+        Args:
+            query: The user's query text
+            target: The target platform (android, ios, or web)
+            model_name: Optional model overriding the daemon's default model
+            budget: Optional budget overriding the daemon's default budget
+            tool_profile: Optional tool profile overriding the configured one
+        """
+        budget = budget or RunBudget.from_settings(self.budget_settings)
+        async with self.pool.lease(target) as server:
+            runner, event_bus = self._get_runner(server, model_name or self.model_name, query, tool_profile)
+            # The runner's tools are reused, but nothing they remember may carry over to this query
+            reset_tools(_agent_tools(runner.agent))
+            session_id = str(uuid.uuid4())
+            self.session_service.create_session(
+                state={}, app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+            )
+            try:
+                async for event in process_agent_interaction(runner, verdict_query(query), USER_ID, session_id,
+                                                             event_bus, budget):
+                    yield event
+            finally:
+                self.session_service.delete_session(
+                    app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+                )
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handle a single client connection: one request, a stream of events."""
+        try:
+            try:
+                request = json.loads(await reader.readline())
+                if self.token and request.get("token") != self.token:
+                    await _write_event(writer, ErrorEvent("Invalid token"))
+                    return
+                query = request["query"]
+                target = str(request.get("target", "")).lower()
+                if target not in SUPPORTED_TARGETS:
+                    raise ValueError(f"Unsupported target: {target}. Must be 'android', 'ios', or 'web'.")
+                budget = RunBudget.from_settings(self.budget_settings, **(request.get("budget") or {}))
+            except (ValueError, KeyError, TypeError) as e:
+                await _write_event(writer, ErrorEvent(f"Invalid request: {e}"))
+                return
+
+            try:
+                async for event in self.run_query(query, target, request.get("model"), budget,
+                                                  request.get("tool_profile")):
+                    await _write_event(writer, event)
+            except Exception as e:
+                await _write_event(writer, ErrorEvent(str(e)))
+        except ConnectionError:
+            # The client went away, nothing left to report to
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str = DEFAULT_ADDRESS, prewarm=None):
+        """Listen on a Unix socket or TCP port until cancelled.
+
+        Args:
+            address: Unix socket path or "host:port"
+            prewarm: Optional dict mapping targets to the number of MCP servers
+                to spawn before accepting requests
+
+        Raises:
+            ValueError: If the address is a TCP port and the daemon has no token.
+        """
+        socket_path, host, port = parse_address(address)
+        if not socket_path and not self.token:
+            raise ValueError("A daemon on a TCP port needs a token, set it in the daemon config option")
+
+        for target, count in (prewarm or {}).items():
+            await self.pool.prewarm(target, count)
+
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=socket_path, limit=MAX_REQUEST_SIZE)
+            # Anyone who can connect can run queries on the devices of this host
+            os.chmod(socket_path, 0o600)
+        else:
+            server = await asyncio.start_server(self.handle_client, host=host, port=port, limit=MAX_REQUEST_SIZE)
+
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                await self.pool.close()
+
+
+def _agent_tools(agent):
+    # The tools of an agent and its sub-agents (e.g. the executor of fan-out mode)
+    tools = list(getattr(agent, "tools", None) or [])
+    for sub_agent in agent.sub_agents:
+        tools.extend(_agent_tools(sub_agent))
+    return tools
+
+
+async def _write_event(writer: asyncio.StreamWriter, event: AgentEvent):
+    writer.write(json.dumps(event.to_dict(inline=True)).encode() + b"\n")
+    await writer.drain()
+
+
+async def submit_query(query: str, target: str, address: str = DEFAULT_ADDRESS,
+                       model_name=None, budget=None, tool_profile=None,
+                       token: Optional[str] = None) -> AsyncGenerator[AgentEvent, None]:
+    """Submit a query to a running daemon and yield the streamed events.
+
+    Args:
+        query: The user's query text
+        target: The target platform (android, ios, or web)
+        address: Unix socket path or "host:port" of the daemon
+        model_name: Optional model overriding the daemon's default model
+        budget: Optional dict of budget limits overriding the daemon's defaults
+        tool_profile: Optional tool profile overriding the daemon's configured one
+        token: Optional shared secret the daemon requires
+    """
+    socket_path, host, port = parse_address(address)
+    if socket_path:
+        reader, writer = await asyncio.open_unix_connection(socket_path, limit=2 ** 26)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=2 ** 26)
+
+    try:
+        request = {"query": query, "target": target}
+        if token:
+            request["token"] = token
+        if model_name:
+            request["model"] = model_name
+        if tool_profile:
+            request["tool_profile"] = tool_profile
+        budget = {key: value for key, value in (budget or {}).items() if value is not None}
+        if budget:
+            request["budget"] = budget
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+
+        while line := await reader.readline():
+            yield event_from_dict(json.loads(line))
+    finally:
+        writer.close()
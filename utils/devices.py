@@ -0,0 +1,228 @@
+"""Discovery and scheduling of devices and browser contexts for concurrent runs.
+
+Mobile targets are sharded across the connected Android devices and booted
+iOS simulators, the web target across isolated Playwright browser contexts.
+Every concurrent run is pinned to exactly one device; devices that keep
+failing are quarantined for a while before they are tried again.
+"""
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# The deviceType values understood by mobile-mcp's device selection tool
+ANDROID = "android"
+IOS_SIMULATOR = "simulator"
+BROWSER = "browser"
+
+
+@dataclass
+class Device:
+    """A device or browser context that runs one test at a time."""
+    device_id: str
+    target: str
+    device_type: str
+    name: str = ""
+    busy: bool = False
+    healthy: bool = True
+    failures: int = 0
+    runs: int = 0
+    quarantined_until: float = 0.0
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} ({self.device_id})" if self.name and self.name != self.device_id else self.device_id
+
+
+async def _run_command(*command) -> str:
+    """Run a command and return its stdout, or an empty string if it is unavailable or fails."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        return ""
+    stdout, _ = await process.communicate()
+    return stdout.decode(errors="replace") if process.returncode == 0 else ""
+
+
+async def list_android_devices() -> List[Device]:
+    """List the Android devices and emulators reported as ready by `adb devices`."""
+    output = await _run_command("adb", "devices")
+    devices = []
+    for line in output.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[1] == "device":
+            devices.append(Device(parts[0], "android", ANDROID))
+    return devices
+
+
+async def list_ios_devices() -> List[Device]:
+    """List the booted iOS simulators reported by `xcrun simctl`."""
+    output = await _run_command("xcrun", "simctl", "list", "devices", "booted", "-j")
+    try:
+        runtimes = json.loads(output).get("devices", {}) if output else {}
+    except ValueError:
+        return []
+    return [
+        Device(simulator["udid"], "ios", IOS_SIMULATOR, name=simulator.get("name", ""))
+        for simulators in runtimes.values()
+        for simulator in simulators
+        if simulator.get("state") == "Booted"
+    ]
+
+
+def browser_contexts(count: int) -> List[Device]:
+    """Create `count` isolated Playwright browser contexts."""
+    return [Device(f"browser-{index + 1}", "web", BROWSER) for index in range(count)]
+
+
+async def discover_devices(target: str, selection: Optional[str] = None, settings=None) -> List[Device]:
+    """Find the devices a target's runs can be sharded across.
+
+    Args:
+        target: The target platform (android, ios, or web)
+        selection: "auto" (or None) for all available devices, a number to use
+            at most that many devices (or browser contexts), or a comma-separated
+            list of device IDs
+        settings: Device settings as returned by `get_device_settings`
+
+    Returns:
+        The selected devices, possibly empty if none are connected.
+    """
+    target = target.lower()
+    settings = settings or {}
+    selection = (selection or "auto").strip()
+
+    if target == "web":
+        if selection == "auto":
+            return browser_contexts(settings.get('web_contexts', 4))
+        if selection.isdigit():
+            return browser_contexts(int(selection))
+        return [Device(device_id.strip(), "web", BROWSER)
+                for device_id in selection.split(",") if device_id.strip()]
+
+    available = await (list_android_devices() if target == "android" else list_ios_devices())
+    # Devices listed in config restrict what auto-discovery may use
+    configured = settings.get(target) or []
+    if configured:
+        available = [device for device in available if device.device_id in configured]
+
+    if selection == "auto":
+        return available
+    if selection.isdigit():
+        return available[:int(selection)]
+
+    known = {device.device_id: device for device in available}
+    device_type = ANDROID if target == "android" else IOS_SIMULATOR
+    return [
+        known.get(device_id.strip()) or Device(device_id.strip(), target, device_type)
+        for device_id in selection.split(",") if device_id.strip()
+    ]
+
+
+def pin_query(query: str, device: Optional[Device]) -> str:
+    """Tell the agent which device a run is pinned to."""
+    if device is None or device.target == "web":
+        return query
+    return (
+        f"{query}\n\n"
+        f"Use the device '{device.device_id}'. It has already been selected for you, "
+        f"do not select or interact with any other device."
+    )
+
+
+class DeviceScheduler:
+    """Hands out devices to concurrent runs, one run per device at a time.
+
+    Devices are discovered per target on first use. A device that fails
+    `max_failures` runs in a row is quarantined for `quarantine_time` seconds,
+    after which it gets one more chance.
+
+    Example:
+        scheduler = DeviceScheduler()
+        await scheduler.discover("android")
+        device = await scheduler.acquire("android")
+        try:
+            ...
+        finally:
+            await scheduler.release(device, ok=True)
+    """
+
+    def __init__(self, settings=None, max_failures: int = 2, quarantine_time: float = 60.0):
+        """Initializes the scheduler.
+
+        Args:
+            settings: Device settings as returned by `get_device_settings`
+            max_failures: Consecutive failures after which a device is quarantined
+            quarantine_time: Seconds a quarantined device is left alone
+        """
+        self.settings = settings or {}
+        self.max_failures = max_failures
+        self.quarantine_time = quarantine_time
+        self._devices: Dict[str, List[Device]] = {}
+        self._condition = asyncio.Condition()
+
+    def devices(self, target: str) -> List[Device]:
+        """The devices known for a target."""
+        return list(self._devices.get(target.lower(), []))
+
+    async def discover(self, target: str, selection: Optional[str] = None) -> List[Device]:
+        """Discover the devices of a target, replacing any previously known ones."""
+        devices = await discover_devices(target, selection, self.settings)
+        async with self._condition:
+            self._devices[target.lower()] = devices
+            self._condition.notify_all()
+        return devices
+
+    async def acquire(self, target: str) -> Device:
+        """Wait for an idle, healthy device of the target and mark it busy.
+
+        Raises:
+            RuntimeError: If the target has no usable devices at all.
+        """
+        target = target.lower()
+        if target not in self._devices:
+            await self.discover(target)
+
+        async with self._condition:
+            while True:
+                devices = self._devices.get(target, [])
+                now = time.monotonic()
+                for device in devices:
+                    if not device.healthy and now >= device.quarantined_until:
+                        # Give a quarantined device another chance; one more failure quarantines it again
+                        device.healthy = True
+                        device.failures = self.max_failures - 1
+
+                idle = [device for device in devices if device.healthy and not device.busy]
+                if idle:
+                    # Spread runs evenly over the devices
+                    device = min(idle, key=lambda device: device.runs)
+                    device.busy = True
+                    device.runs += 1
+                    return device
+
+                if not devices:
+                    raise RuntimeError(f"No devices available for target {target}")
+
+                quarantined = [device.quarantined_until for device in devices if not device.healthy]
+                timeout = max(min(quarantined) - now, 0.01) if quarantined else None
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, device: Device, ok: bool = True):
+        """Return a device after a run, recording whether the run succeeded."""
+        async with self._condition:
+            device.busy = False
+            if ok:
+                device.failures = 0
+            else:
+                device.failures += 1
+                if device.failures >= self.max_failures:
+                    device.healthy = False
+                    device.quarantined_until = time.monotonic() + self.quarantine_time
+            self._condition.notify_all()
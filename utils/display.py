@@ -1,6 +1,8 @@
 import asyncio
+import reprlib
+import time
 from typing import AsyncGenerator, List
-from rich.console import Console
+from rich.console import Console, Group
 from rich.panel import Panel
 from rich.text import Text
 from rich import box
@@ -10,12 +12,34 @@ from rich.markdown import Markdown
 from utils.events import (
     AgentEvent, UserQueryEvent, AgentResponseEvent, ToolCallEvent,
     FinalResponseEvent, ConversationStartEvent, ConversationEndEvent, ErrorEvent,
-    ToolResponseEvent
+    ToolResponseEvent, ToolCacheEvent, LlmCacheEvent, TestResultEvent, LlmTurnEvent, ToolTimingEvent,
+    RunSummaryEvent, PayloadCompactionEvent, ReplayDivergenceEvent, BudgetExceededEvent, ModelRouteEvent,
+    EventsSkippedEvent
 )
 
 # Initialize Rich console
 console = Console()
 
+# Longest rendering of a tool payload in the terminal
+MAX_PAYLOAD_CHARS = 1000
+
+def summarize_payload(value, limit: int = MAX_PAYLOAD_CHARS) -> str:
+    """Render a tool payload for the terminal without stringifying all of it.
+    
+    Large strings, lists and nested structures are cut while they are
+    rendered, so the cost does not grow with the size of the payload.
+    
+    Args:
+        value: The payload, e.g. the arguments of a tool call
+        limit: Maximum length of the rendering
+    """
+    summarizer = reprlib.Repr()
+    summarizer.maxlevel = 4
+    summarizer.maxdict = summarizer.maxlist = summarizer.maxtuple = 20
+    summarizer.maxstring = summarizer.maxother = limit
+    text = summarizer.repr(value)
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
 def print_agent_instructions(instructions: str) -> None:
     """Print the agent instructions using Rich formatting.
     
@@ -41,19 +65,21 @@ def print_agent_instructions(instructions: str) -> None:
     ))
     console.print()
 
-def print_agent_info(agent_name: str, model_name: str, tools_count: int, target: str, use_litellm: bool = False) -> None:
+def print_agent_info(agent_name: str, model_name: str, tools_count: int, target: str, use_litellm: bool = False,
+                     server_tools_count: int = None) -> None:
     """Print information about the created agent using Rich formatting.
     
     Args:
         agent_name: Name of the agent
         model_name: Name of the model used (string or LiteLLM object)
-        tools_count: Number of tools available
+        tools_count: Number of tools available to the agent
         target: Target platform (android, ios, or web)
         use_litellm: Whether LiteLLM is being used
+        server_tools_count: Number of tools the MCP server offers, if the agent's tools were pruned
     """
-    # Extract clean model name if it's a LiteLLM object
+    # Extract clean model name if it's a model object (LiteLLM or a model cascade)
     clean_model_name = model_name
-    if use_litellm and not isinstance(model_name, str):
+    if not isinstance(model_name, str):
         try:
             # Try to access the model attribute directly
             clean_model_name = model_name.model
@@ -78,6 +104,8 @@ def print_agent_info(agent_name: str, model_name: str, tools_count: int, target:
     
     agent_info.append(f" with ", style="dim")
     agent_info.append(f"{tools_count}", style="yellow bold")
+    if server_tools_count is not None and server_tools_count != tools_count:
+        agent_info.append(f" of {server_tools_count}", style="dim")
     agent_info.append(" tools from MCP server.", style="dim")
     
     platform_info = Text()
@@ -89,106 +117,385 @@ def print_agent_info(agent_name: str, model_name: str, tools_count: int, target:
     console.print(platform_info)
     console.print()
 
-async def print_agent_events(event_generator: AsyncGenerator[AgentEvent, None]):
-    """Consume agent events and print them using Rich formatting."""
-    async for event in event_generator:
-        if isinstance(event, ConversationStartEvent):
-            console.rule("[bold blue]New Conversation", style="blue")
+def print_agent_event(event: AgentEvent) -> None:
+    """Print a single agent event using Rich formatting."""
+    if isinstance(event, ConversationStartEvent):
+        console.rule("[bold blue]New Conversation", style="blue")
+    
+    elif isinstance(event, UserQueryEvent):
+        # Create a table for user query with padding
+        user_table = Table(box=box.SIMPLE, show_header=False, padding=(0, 2))
+        user_table.add_column("Query")
+        
+        # Truncate query to remove empty lines at the end and render as markdown
+        truncated_query = event.query.rstrip()
+        user_table.add_row(Markdown(truncated_query))
+        
+        console.print(Panel(
+            user_table, 
+            title="🧑 USER QUERY",
+            title_align="left",
+            box=box.ROUNDED, 
+            border_style="cyan", 
+            expand=False, 
+            width=100
+        ))
+    
+    elif isinstance(event, AgentResponseEvent):
+        # Truncate text to remove empty lines at the end
+        truncated_text = event.text.rstrip()
+        
+        # Create a table for agent response with padding
+        agent_table = Table(box=box.SIMPLE, show_header=False, padding=(0, 2))
+        agent_table.add_column("Response")
+        
+        # Use Markdown rendering
+        agent_table.add_row(Markdown(truncated_text))
         
-        elif isinstance(event, UserQueryEvent):
-            # Create a table for user query with padding
-            user_table = Table(box=box.SIMPLE, show_header=False, padding=(0, 2))
-            user_table.add_column("Query")
-            
-            # Truncate query to remove empty lines at the end and render as markdown
-            truncated_query = event.query.rstrip()
-            user_table.add_row(Markdown(truncated_query))
-            
-            console.print(Panel(
-                user_table, 
-                title="🧑 USER QUERY",
-                title_align="left",
-                box=box.ROUNDED, 
-                border_style="cyan", 
-                expand=False, 
-                width=100
-            ))
+        console.print(Panel(
+            agent_table,
+            title="🤖 AGENT",
+            title_align="left",
+            border_style="yellow",
+            box=box.ROUNDED,
+            width=100,
+            expand=False
+        ))
+    
+    elif isinstance(event, ToolCallEvent):
+        # Create a table for tool details
+        tool_table = Table(box=box.SIMPLE, show_header=False, padding=(0, 2))
+        tool_table.add_column("Property", style="green")
+        tool_table.add_column("Value")
+        
+        tool_table.add_row("Function", event.name)
+        tool_table.add_row("Arguments", summarize_payload(event.args))
         
-        elif isinstance(event, AgentResponseEvent):
-            # Truncate text to remove empty lines at the end
-            truncated_text = event.text.rstrip()
-            
-            # Create a table for agent response with padding
-            agent_table = Table(box=box.SIMPLE, show_header=False, padding=(0, 2))
-            agent_table.add_column("Response")
-            
-            # Use Markdown rendering
-            agent_table.add_row(Markdown(truncated_text))
-            
-            console.print(Panel(
-                agent_table,
-                title="🤖 AGENT",
-                title_align="left",
-                border_style="yellow",
-                box=box.ROUNDED,
-                width=100,
-                expand=False
-            ))
+        console.print(Panel(
+            tool_table,
+            title="🔧 TOOL",
+            title_align="left",
+            border_style="green",
+            box=box.ROUNDED,
+            width=100,
+            expand=False
+        ))
+
+    elif isinstance(event, ToolResponseEvent):
+        # Display a simple line instead of a full panel for tool responses
+        console.print(f"[dim blue]← Received response from tool[/dim blue] [bold blue]{event.name}[/bold blue]")
+
+    elif isinstance(event, ToolCacheEvent):
+        if event.hit:
+            console.print(
+                f"[dim green]⚡ Served [bold]{event.name}[/bold] from cache "
+                f"({event.hits} hits, {event.misses} misses)[/dim green]"
+            )
+
+    elif isinstance(event, LlmCacheEvent):
+        if event.hit:
+            console.print(
+                f"[dim green]⚡ Served model response from cache "
+                f"({event.hits} hits, {event.misses} misses)[/dim green]"
+            )
+
+    elif isinstance(event, FinalResponseEvent):
+        # Truncate final response text to remove empty lines at the end
+        truncated_text = event.text.rstrip()
         
-        elif isinstance(event, ToolCallEvent):
-            # Create a table for tool details
-            tool_table = Table(box=box.SIMPLE, show_header=False, padding=(0, 2))
-            tool_table.add_column("Property", style="green")
-            tool_table.add_column("Value")
-            
-            tool_table.add_row("Function", event.name)
-            tool_table.add_row("Arguments", str(event.args))
-            
-            console.print(Panel(
-                tool_table,
-                title="🔧 TOOL",
-                title_align="left",
-                border_style="green",
-                box=box.ROUNDED,
-                width=100,
-                expand=False
-            ))
-
-        elif isinstance(event, ToolResponseEvent):
-            # Display a simple line instead of a full panel for tool responses
-            console.print(f"[dim blue]← Received response from tool[/dim blue] [bold blue]{event.name}[/bold blue]")
-
-        elif isinstance(event, FinalResponseEvent):
-            # Truncate final response text to remove empty lines at the end
-            truncated_text = event.text.rstrip()
-            
-            # Create a table for final response with padding
-            final_table = Table(box=box.SIMPLE, show_header=False, padding=(0, 2))
-            final_table.add_column("Response")
-            
-            # Use Markdown rendering
-            final_table.add_row(Markdown(truncated_text))
-            
-            console.print(Panel(
-                final_table,
-                title="🎯 FINAL RESPONSE",
-                title_align="left",
-                border_style="magenta",
-                box=box.ROUNDED,
-                width=100,
-                expand=False
-            ))
+        # Create a table for final response with padding
+        final_table = Table(box=box.SIMPLE, show_header=False, padding=(0, 2))
+        final_table.add_column("Response")
         
-        elif isinstance(event, ErrorEvent):
-            console.print(Panel(
-                f"❌ Error: {event.message}",
-                title="ERROR",
-                title_align="left",
-                border_style="red",
-                box=box.ROUNDED,
-                width=100,
-                expand=False
-            ))
+        # Use Markdown rendering
+        final_table.add_row(Markdown(truncated_text))
         
-        elif isinstance(event, ConversationEndEvent):
-            console.rule("[bold blue]End of Conversation", style="blue")
\ No newline at end of file
+        console.print(Panel(
+            final_table,
+            title="🎯 FINAL RESPONSE",
+            title_align="left",
+            border_style="magenta",
+            box=box.ROUNDED,
+            width=100,
+            expand=False
+        ))
+    
+    elif isinstance(event, ErrorEvent):
+        console.print(Panel(
+            f"❌ Error: {event.message}",
+            title="ERROR",
+            title_align="left",
+            border_style="red",
+            box=box.ROUNDED,
+            width=100,
+            expand=False
+        ))
+    
+    elif isinstance(event, LlmTurnEvent):
+        tokens = ""
+        if event.prompt_tokens is not None or event.completion_tokens is not None:
+            tokens = f", {event.prompt_tokens or 0} prompt / {event.completion_tokens or 0} completion tokens"
+        console.print(f"[dim]⏱  {event.model} responded in {event.duration:.2f}s{tokens}[/dim]")
+    
+    elif isinstance(event, ToolTimingEvent):
+        console.print(f"[dim]⏱  {event.name} took {event.duration:.2f}s[/dim]")
+    
+    elif isinstance(event, ModelRouteEvent):
+        if event.escalated:
+            console.print(f"[dim yellow]⤴  Escalated to {event.model}: {event.reason}[/dim yellow]")
+    
+    elif isinstance(event, PayloadCompactionEvent):
+        if event.bytes_out < event.bytes_in:
+            console.print(
+                f"[dim]🗜  Compacted {event.name} response from {event.bytes_in:,} to "
+                f"{event.bytes_out:,} bytes[/dim]"
+            )
+    
+    elif isinstance(event, ReplayDivergenceEvent):
+        console.print(Panel(
+            f"↪ Replay diverged at step {event.step + 1} ([bold]{event.name}[/bold]): {event.reason}",
+            title="REPLAY",
+            title_align="left",
+            border_style="yellow",
+            box=box.ROUNDED,
+            width=100,
+            expand=False
+        ))
+    
+    elif isinstance(event, BudgetExceededEvent):
+        console.print(Panel(
+            f"⏹ Run stopped: {event.message}",
+            title="BUDGET EXCEEDED",
+            title_align="left",
+            border_style="yellow",
+            box=box.ROUNDED,
+            width=100,
+            expand=False
+        ))
+    
+    elif isinstance(event, EventsSkippedEvent):
+        details = ", ".join(f"{count} {event_type}" for event_type, count in event.event_types.items())
+        console.print(f"[dim yellow]… Skipped {event.count} events to keep up with the run ({details})[/dim yellow]")
+    
+    elif isinstance(event, RunSummaryEvent):
+        print_run_summary(event)
+    
+    elif isinstance(event, ConversationEndEvent):
+        console.rule("[bold blue]End of Conversation", style="blue")
+    
+    elif isinstance(event, TestResultEvent):
+        print_test_result(event)
+
+def print_run_summary(summary: RunSummaryEvent) -> None:
+    """Print how the wall time of a conversation splits into model, tool and overhead time.
+    
+    Args:
+        summary: The RunSummaryEvent of the conversation
+    """
+    summary_table = Table(box=box.SIMPLE, padding=(0, 2))
+    summary_table.add_column("", style="green")
+    summary_table.add_column("Time", justify="right")
+    summary_table.add_column("Share", justify="right")
+    summary_table.add_column("Count", justify="right")
+    
+    wall_time = summary.wall_time or 1e-9
+    rows = [
+        ("Model", summary.model_time, f"{summary.llm_turns} turns"),
+        ("Tools", summary.tool_time, f"{summary.tool_calls} calls"),
+        ("Overhead", summary.overhead, ""),
+    ]
+    for label, duration, count in rows:
+        summary_table.add_row(label, f"{duration:.2f}s", f"{duration / wall_time:.0%}", count)
+        # Only a model cascade splits the turns between models
+        if label == "Model" and len(summary.turns_by_model) > 1:
+            for model, turns in summary.turns_by_model.items():
+                summary_table.add_row(f"[dim]  {model}[/dim]", "", "", f"[dim]{turns} turns[/dim]")
+    summary_table.add_row("[bold]Wall time[/bold]", f"[bold]{summary.wall_time:.2f}s[/bold]", "", "")
+    
+    if summary.prompt_tokens is not None or summary.completion_tokens is not None:
+        summary_table.add_row(
+            "Tokens", "", "",
+            f"{summary.prompt_tokens or 0} prompt / {summary.completion_tokens or 0} completion"
+        )
+    
+    console.print(Panel(
+        summary_table,
+        title="⏱  RUN SUMMARY",
+        title_align="left",
+        border_style="blue",
+        box=box.ROUNDED,
+        width=100,
+        expand=False
+    ))
+
+async def print_agent_events(event_generator: AsyncGenerator[AgentEvent, None]):
+    """Consume agent events and print them using Rich formatting."""
+    async for event in event_generator:
+        print_agent_event(event)
+
+
+VERDICT_STYLES = {
+    "passed": "green bold",
+    "failed": "red bold",
+    "error": "red",
+    "aborted": "yellow bold",
+    "unknown": "yellow",
+}
+
+def print_test_result(result) -> None:
+    """Print a single line for a completed test case of a suite run.
+    
+    Args:
+        result: The TestResult or TestResultEvent of the completed test case
+    """
+    style = VERDICT_STYLES.get(result.verdict, "white")
+    location = f"{result.target} on {result.device}" if getattr(result, "device", None) else result.target
+    timing = "cached" if getattr(result, "cached", False) else f"{result.duration:.1f}s"
+    console.print(
+        f"[{style}]{result.verdict.upper():<8}[/{style}] "
+        f"[cyan]{result.test_id}[/cyan] [dim]({location}, {timing})[/dim]"
+    )
+
+def print_suite_report(results, wall_time: float) -> None:
+    """Print the aggregated pass/fail report of a suite run.
+    
+    Args:
+        results: List of TestResult objects
+        wall_time: Total wall-clock time of the suite run in seconds
+    """
+    report_table = Table(box=box.SIMPLE, padding=(0, 2))
+    report_table.add_column("Test", style="cyan")
+    report_table.add_column("Target", style="magenta")
+    show_devices = any(result.device for result in results)
+    if show_devices:
+        report_table.add_column("Device", style="blue")
+    report_table.add_column("Verdict")
+    report_table.add_column("Tools", justify="right")
+    report_table.add_column("Duration", justify="right")
+    
+    for result in results:
+        style = VERDICT_STYLES.get(result.verdict, "white")
+        device = [result.device or ""] if show_devices else []
+        report_table.add_row(
+            result.test_id,
+            result.target,
+            *device,
+            f"[{style}]{result.verdict.upper()}[/{style}]" + (" [dim](cached)[/dim]" if result.cached else ""),
+            "" if result.cached else str(result.tool_calls),
+            "-" if result.cached else f"{result.duration:.1f}s",
+        )
+    
+    passed = sum(1 for result in results if result.passed)
+    cached = sum(1 for result in results if result.cached)
+    total_duration = sum(result.duration for result in results)
+    summary = (
+        f"{passed}/{len(results)} passed{f' ({cached} cached)' if cached else ''} in {wall_time:.1f}s "
+        f"(sum of test durations {total_duration:.1f}s)"
+    )
+    
+    console.print(Panel(
+        report_table,
+        title="📊 SUITE REPORT",
+        title_align="left",
+        subtitle=summary,
+        subtitle_align="left",
+        border_style="green" if passed == len(results) else "red",
+        box=box.ROUNDED,
+        width=100,
+        expand=False
+    ))
+    
+    for result in results:
+        if result.error:
+            console.print(f"[red]❌ {result.test_id}:[/red] {result.error}")
+
+def _seconds(value) -> str:
+    return f"{value:.2f}s" if value is not None else "-"
+
+# Columns of the results store reports: (key, header, formatter)
+RESULTS_REPORT_COLUMNS = {
+    "slowest-tests": [
+        ("test_id", "Test", str), ("runs", "Runs", str), ("total", "Total", _seconds),
+        ("p50", "p50", _seconds), ("p95", "p95", _seconds), ("max", "Max", _seconds),
+    ],
+    "slowest-tools": [
+        ("tool", "Tool", str), ("calls", "Calls", str), ("total", "Total", _seconds),
+        ("p50", "p50", _seconds), ("p95", "p95", _seconds),
+    ],
+    "durations": [
+        ("period", "Period", str), ("runs", "Runs", str), ("p50", "p50", _seconds), ("p95", "p95", _seconds),
+    ],
+    "flaky": [
+        ("test_id", "Test", str), ("runs", "Runs", str), ("passed", "Passed", str), ("failed", "Failed", str),
+        ("flakiness", "Flakiness", lambda value: f"{value:.0%}"), ("last", "Last", str.upper),
+    ],
+    "regressions": [
+        ("test_id", "Test", str), ("baseline_verdict", "Baseline", str.upper), ("verdict", "Now", str.upper),
+        ("baseline_p50", "Baseline p50", _seconds), ("p50", "p50", _seconds), ("reason", "Regression", str),
+    ],
+    "batches": [
+        ("batch", "Batch", str), ("started", "Started", lambda value: time.strftime("%Y-%m-%d %H:%M", time.localtime(value))),
+        ("runs", "Runs", str), ("passed", "Passed", str), ("total", "Total", _seconds),
+    ],
+}
+
+def print_results_report(report: str, rows, subtitle: str = None) -> None:
+    """Print a report of the historical results store as a table.
+    
+    Args:
+        report: Name of the report, one of RESULTS_REPORT_COLUMNS
+        rows: The rows returned by the ResultsStore query of the report
+        subtitle: Optional line shown below the table
+    """
+    columns = RESULTS_REPORT_COLUMNS[report]
+    report_table = Table(box=box.SIMPLE, padding=(0, 1))
+    for index, (_, header, _) in enumerate(columns):
+        report_table.add_column(header, style="cyan" if index == 0 else None, justify="left" if index == 0 else "right",
+                                no_wrap=True)
+    for row in rows:
+        report_table.add_row(*[formatter(row[key]) if row[key] is not None else "-" for key, _, formatter in columns])
+    
+    body = [report_table if rows else Text("No regressions." if report == "regressions" else "No matching runs.", style="dim")]
+    if subtitle:
+        body.append(Text(subtitle, style="dim"))
+    
+    console.print(Panel(
+        Group(*body),
+        title=f"📈 {report.upper().replace('-', ' ')}",
+        title_align="left",
+        border_style="blue",
+        box=box.ROUNDED,
+        expand=False
+    ))
+
+def print_checkpoints(checkpoints) -> None:
+    """Print the saved checkpoints as a table.
+    
+    Args:
+        checkpoints: The checkpoints as returned by `SqliteSessionService.list_checkpoints`
+    """
+    checkpoint_table = Table(box=box.SIMPLE, padding=(0, 1))
+    checkpoint_table.add_column("Name", style="cyan", no_wrap=True)
+    checkpoint_table.add_column("Target", no_wrap=True)
+    checkpoint_table.add_column("Events", justify="right", no_wrap=True)
+    checkpoint_table.add_column("Browser", no_wrap=True)
+    checkpoint_table.add_column("Created", no_wrap=True)
+    checkpoint_table.add_column("Query", overflow="ellipsis", no_wrap=True, max_width=40)
+    for checkpoint in checkpoints:
+        checkpoint_table.add_row(
+            checkpoint["name"],
+            checkpoint["target"] or "-",
+            str(checkpoint["events"]),
+            "yes" if checkpoint["browser_profile"] else "no",
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(checkpoint["created"])),
+            (checkpoint["query"] or "").replace("\n", " "),
+        )
+    
+    console.print(Panel(
+        checkpoint_table if checkpoints else Text("No checkpoints saved.", style="dim"),
+        title="⚑ CHECKPOINTS",
+        title_align="left",
+        border_style="blue",
+        box=box.ROUNDED,
+        expand=False
+    ))
@@ -0,0 +1,600 @@
+"""Distributed suite runs: a coordinator hands out test cases to workers on other machines.
+
+The coordinator keeps the test cases of a suite in a durable SQLite queue and
+serves them to workers over TCP (or a Unix socket) with newline-delimited
+JSON. A worker leases a test case, runs it on its own devices and sends its
+events back with every heartbeat, then reports the result. A lease that is
+not renewed within the lease timeout (e.g. because the worker's host went
+down) is handed out again, up to a maximum number of attempts.
+
+Workers send one request line per call and receive one response line:
+
+- `{"op": "lease", "worker": ..., "targets": [...]}` returns
+  `{"lease": {"token": ..., "case": {...}, "model": ..., "attempt": 1}}`,
+  `{"retry_after": seconds}` while other workers still hold leases, or
+  `{"done": true}` once every test case has a result.
+- `{"op": "heartbeat", "lease": token, "events": [...]}` renews the lease and
+  returns `{"ok": false}` if it was lost.
+- `{"op": "complete", "lease": token, "events": [...], "result": {...}}`.
+
+Events that do not fit into one message are sent ahead in extra heartbeats.
+
+If a shared `token` is configured, every request must carry it.
+
+Since the queue is on disk, a coordinator that is restarted with the same
+suite continues the unfinished batch, and workers reconnect to it.
+"""
+import asyncio
+import dataclasses
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.daemon import parse_address
+from utils.events import ErrorEvent, EventsSkippedEvent, event_from_dict
+from utils.sinks import EventSink
+from utils.suite import TestCase, TestResult
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch TEXT PRIMARY KEY,
+    suite TEXT NOT NULL,
+    model TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS batches_suite ON batches (suite, finished);
+CREATE TABLE IF NOT EXISTS tests (
+    batch TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    test_id TEXT NOT NULL,
+    target TEXT NOT NULL,
+    test_case TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease TEXT,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    PRIMARY KEY (batch, position)
+);
+CREATE INDEX IF NOT EXISTS tests_state ON tests (batch, state, position);
+CREATE UNIQUE INDEX IF NOT EXISTS tests_lease ON tests (lease);
+"""
+
+# States of a test case in the queue
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+# Seconds a worker waits before asking again while all remaining test cases are leased
+RETRY_AFTER = 1.0
+
+# Upper bound for a message, which carries the events of a test case with their payloads
+MAX_MESSAGE_SIZE = 2 ** 26
+
+# Upper bound for the events of one message, leaving room for the rest of the request.
+# Workers split larger batches across several messages.
+MAX_EVENTS_SIZE = MAX_MESSAGE_SIZE // 2
+
+# Seconds the coordinator keeps telling workers that the batch is done before it exits
+LINGER_TIME = 3.0
+
+
+def suite_key(suite: str, target: str) -> str:
+    """Identifies a suite, so that a restarted coordinator continues its unfinished batch."""
+    return f"{Path(suite).resolve()}:{target}"
+
+
+class TestQueue:
+    """A durable queue of the test cases of suite runs, with leases."""
+
+    def __init__(self, path):
+        """Initializes the queue.
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def create_batch(self, batch: str, suite: str, model: str, cases: List[TestCase], default_target: str) -> None:
+        """Add the test cases of a suite run as a new batch.
+
+        Args:
+            batch: ID of the batch
+            suite: Key of the suite as returned by `suite_key`
+            model: The model the workers run the test cases with
+            cases: The test cases
+            default_target: Target platform for test cases that do not specify one
+        """
+        with self._lock, self._db:
+            self._db.execute("INSERT INTO batches (batch, suite, model, created) VALUES (?, ?, ?, ?)",
+                             (batch, suite, model, time.time()))
+            self._db.executemany(
+                "INSERT INTO tests (batch, position, test_id, target, test_case, state) VALUES (?, ?, ?, ?, ?, ?)",
+                [(batch, position, case.test_id, (case.target or default_target).lower(),
+                  json.dumps(dataclasses.asdict(case)), PENDING)
+                 for position, case in enumerate(cases)],
+            )
+
+    def unfinished_batch(self, suite: str) -> Optional[Dict[str, Any]]:
+        """The latest batch of a suite that has not finished, with its `batch` ID and `model`, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT batch, model FROM batches WHERE suite = ? AND finished IS NULL ORDER BY created DESC LIMIT 1",
+                (suite,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def finish_batch(self, batch: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("UPDATE batches SET finished = ? WHERE batch = ?", (time.time(), batch))
+
+    def lease(self, batch: str, worker: str, targets: List[str], lease_timeout: float) -> Optional[Dict[str, Any]]:
+        """Lease the next pending test case of a batch for one of the worker's targets.
+
+        Returns:
+            A dict with the lease `token`, the `case`, its `test_id`, `target`
+            and the `attempt`, or None if no test case is pending.
+        """
+        token = uuid.uuid4().hex
+        with self._lock, self._db:
+            row = self._db.execute(
+                f"SELECT position, test_id, target, test_case, attempts FROM tests "
+                f"WHERE batch = ? AND state = ? AND target IN ({', '.join('?' * len(targets))}) "
+                f"ORDER BY position LIMIT 1",
+                (batch, PENDING, *targets),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE tests SET state = ?, attempts = attempts + 1, lease = ?, worker = ?, lease_expires = ? "
+                "WHERE batch = ? AND position = ?",
+                (LEASED, token, worker, time.time() + lease_timeout, batch, row["position"]),
+            )
+        return {"token": token, "case": json.loads(row["test_case"]), "test_id": row["test_id"],
+                "target": row["target"], "attempt": row["attempts"] + 1}
+
+    def get_lease(self, token: str) -> Optional[Dict[str, Any]]:
+        """The test ID, target and worker of a current lease, or None if the lease is gone."""
+        with self._lock:
+            row = self._db.execute("SELECT test_id, target, worker FROM tests WHERE lease = ? AND state = ?",
+                                   (token, LEASED)).fetchone()
+        return dict(row) if row else None
+
+    def heartbeat(self, token: str, lease_timeout: float) -> bool:
+        """Renew a lease. Returns False if the lease expired and the test case was handed out again."""
+        with self._lock, self._db:
+            cursor = self._db.execute("UPDATE tests SET lease_expires = ? WHERE lease = ? AND state = ?",
+                                      (time.time() + lease_timeout, token, LEASED))
+        return cursor.rowcount > 0
+
+    def complete(self, token: str, result: Dict[str, Any]) -> bool:
+        """Store the result of a leased test case. Returns False if the lease was lost."""
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE tests SET state = ?, result = ?, lease_expires = NULL WHERE lease = ? AND state = ?",
+                (DONE, json.dumps(result), token, LEASED),
+            )
+        return cursor.rowcount > 0
+
+    def expire_leases(self, batch: str, max_attempts: int) -> List[Dict[str, Any]]:
+        """Hand out the test cases of expired leases again, or fail them after too many attempts.
+
+        Returns:
+            The expired leases, each with its `token`, `test_id`, `target`,
+            `worker` and whether it was `requeued`.
+        """
+        now = time.time()
+        expired = []
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT position, test_id, target, worker, lease, attempts FROM tests "
+                "WHERE batch = ? AND state = ? AND lease_expires < ?",
+                (batch, LEASED, now),
+            ).fetchall()
+            for row in rows:
+                requeued = row["attempts"] < max_attempts
+                result = None if requeued else dataclasses.asdict(TestResult(
+                    test_id=row["test_id"], target=row["target"], verdict="error", duration=0.0,
+                    error=f"Worker {row['worker']} was lost {row['attempts']} times",
+                ))
+                self._db.execute(
+                    "UPDATE tests SET state = ?, lease = NULL, lease_expires = NULL, result = ? "
+                    "WHERE batch = ? AND position = ?",
+                    (PENDING if requeued else DONE, json.dumps(result) if result else None, batch, row["position"]),
+                )
+                expired.append({"token": row["lease"], "test_id": row["test_id"], "target": row["target"],
+                                "worker": row["worker"], "requeued": requeued, "result": result})
+        return expired
+
+    def counts(self, batch: str) -> Dict[str, int]:
+        """The number of test cases of a batch per state."""
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) AS count FROM tests WHERE batch = ? GROUP BY state",
+                                    (batch,)).fetchall()
+        return {row["state"]: row["count"] for row in rows}
+
+    def results(self, batch: str) -> List[TestResult]:
+        """The results of a batch, in the order of its test cases."""
+        with self._lock:
+            rows = self._db.execute("SELECT result FROM tests WHERE batch = ? AND result IS NOT NULL "
+                                    "ORDER BY position", (batch,)).fetchall()
+        return [TestResult(**json.loads(row["result"])) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class CoordinatorError(Exception):
+    """Raised when the coordinator rejects a request."""
+
+
+class Coordinator:
+    """Serves the test cases of a batch to workers and collects their events and results."""
+
+    def __init__(self, queue: TestQueue, batch: str, model_name: str, settings: Dict[str, Any],
+                 on_result: Optional[Callable[[TestResult], None]] = None,
+                 on_status: Optional[Callable[[str], None]] = None,
+                 recorder_factory: Optional[Callable[[str, str], EventSink]] = None):
+        """Initializes the coordinator.
+
+        Args:
+            queue: The queue holding the batch
+            batch: ID of the batch to serve
+            model_name: The model the workers run the test cases with
+            settings: Distributed settings as returned by `get_distributed_settings`
+            on_result: Optional callback invoked with each TestResult as it completes
+            on_status: Optional callback invoked with status messages, e.g. about lost workers
+            recorder_factory: Optional callable taking a test ID and a target and returning
+                an EventSink for the events of that test case, e.g. a ResultsRecorder
+        """
+        self.queue = queue
+        self.batch = batch
+        self.model_name = model_name
+        self.settings = settings
+        self.on_result = on_result
+        self.on_status = on_status or (lambda message: None)
+        self.recorder_factory = recorder_factory
+        # Lease token -> recorder of the attempt holding the lease
+        self._recorders: Dict[str, EventSink] = {}
+        self._finished = asyncio.Event()
+
+    def is_finished(self) -> bool:
+        counts = self.queue.counts(self.batch)
+        return not counts.get(PENDING) and not counts.get(LEASED)
+
+    def _recorder(self, token: str) -> Optional[EventSink]:
+        if self.recorder_factory is None:
+            return None
+        if token not in self._recorders:
+            lease = self.queue.get_lease(token)
+            if lease is None:
+                return None
+            self._recorders[token] = self.recorder_factory(lease["test_id"], lease["target"])
+        return self._recorders[token]
+
+    def _record(self, token: str, events: List[Dict[str, Any]]) -> None:
+        recorder = self._recorder(token) if events else None
+        if recorder is None:
+            return
+        for data in events:
+            try:
+                recorder.handle(event_from_dict(data))
+            except (ValueError, TypeError):
+                # Events of a newer worker version are skipped
+                pass
+
+    def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer a single request of a worker."""
+        if self.settings.get('token') and request.get("token") != self.settings['token']:
+            raise CoordinatorError("Invalid token")
+        op = request.get("op")
+        lease_timeout = self.settings['lease_timeout']
+
+        if op == "lease":
+            targets = [str(target).lower() for target in request.get("targets") or []]
+            worker = str(request.get("worker") or "unknown")
+            lease = self.queue.lease(self.batch, worker, targets, lease_timeout) if targets else None
+            if lease is not None:
+                self.on_status(f"▶ {lease['test_id']} → {worker}"
+                               + (f" (attempt {lease['attempt']})" if lease['attempt'] > 1 else ""))
+                return {"lease": {"token": lease["token"], "case": lease["case"], "model": self.model_name,
+                                  "attempt": lease["attempt"]}}
+            if self.is_finished():
+                return {"done": True}
+            return {"retry_after": RETRY_AFTER}
+
+        token = str(request.get("lease"))
+        if op == "heartbeat":
+            self._record(token, request.get("events") or [])
+            return {"ok": self.queue.heartbeat(token, lease_timeout)}
+        if op == "complete":
+            self._record(token, request.get("events") or [])
+            result = TestResult(**request["result"])
+            recorder = self._recorders.pop(token, None)
+            if not self.queue.complete(token, dataclasses.asdict(result)):
+                # The lease was lost and the test case handed out again, so the late result is dropped
+                return {"ok": False}
+            if recorder is not None:
+                recorder.device = result.device
+                recorder.close()
+            if self.on_result:
+                self.on_result(result)
+            if self.is_finished():
+                self._finished.set()
+            return {"ok": True}
+        raise CoordinatorError(f"Unknown operation: {op}")
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer the requests of a worker connection until it is closed."""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # The rest of the oversized request is still on its way, so the
+                    # connection cannot be used for further requests
+                    response = {"error": f"Request exceeds the limit of {MAX_MESSAGE_SIZE} bytes"}
+                    writer.write(json.dumps(response).encode() + b"\n")
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    response = self.handle_request(json.loads(line))
+                except (CoordinatorError, ValueError, KeyError, TypeError) as e:
+                    response = {"error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            # The worker went away; its leases expire unless it reconnects
+            pass
+        finally:
+            writer.close()
+
+    def expire_leases(self) -> None:
+        """Hand out the test cases of lost workers again."""
+        for lease in self.queue.expire_leases(self.batch, self.settings['max_attempts']):
+            recorder = self._recorders.pop(lease["token"], None)
+            if recorder is not None:
+                recorder.handle(ErrorEvent(f"Lease of worker {lease['worker']} expired"))
+                recorder.close()
+            if lease["requeued"]:
+                self.on_status(f"⚠ {lease['test_id']}: worker {lease['worker']} was lost, queued again")
+            else:
+                self.on_status(f"⚠ {lease['test_id']}: worker {lease['worker']} was lost, giving up")
+                if self.on_result:
+                    self.on_result(TestResult(**lease["result"]))
+        if self.is_finished():
+            self._finished.set()
+
+    async def serve(self, address: str) -> List[TestResult]:
+        """Serve workers until every test case of the batch has a result.
+
+        Args:
+            address: "host:port" or Unix socket path to listen on
+
+        Returns:
+            The results of the batch in the order of its test cases.
+        """
+        socket_path, host, port = parse_address(address)
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_worker, path=socket_path, limit=MAX_MESSAGE_SIZE)
+        else:
+            server = await asyncio.start_server(self.handle_worker, host=host, port=port, limit=MAX_MESSAGE_SIZE)
+
+        async with server:
+            self.expire_leases()
+            while not self._finished.is_set():
+                try:
+                    await asyncio.wait_for(self._finished.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    self.expire_leases()
+            # Tell the workers that are still asking for test cases that the batch is done
+            await asyncio.sleep(LINGER_TIME)
+        self.queue.finish_batch(self.batch)
+        return self.queue.results(self.batch)
+
+
+class CoordinatorClient:
+    """A worker's connection to the coordinator, reconnecting when it is lost."""
+
+    def __init__(self, address: str, worker: str, token: Optional[str] = None, reconnect_timeout: float = 60):
+        """Initializes the client.
+
+        Args:
+            address: "host:port" or Unix socket path of the coordinator
+            worker: Name of the worker reported to the coordinator
+            token: Optional shared token the coordinator requires
+            reconnect_timeout: Seconds to keep trying to reach the coordinator
+        """
+        self.address = address
+        self.worker = worker
+        self.token = token
+        self.reconnect_timeout = reconnect_timeout
+        self._reader = self._writer = None
+        # Requests and their responses share one connection, one at a time
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        socket_path, host, port = parse_address(self.address)
+        if socket_path:
+            return await asyncio.open_unix_connection(socket_path, limit=MAX_MESSAGE_SIZE)
+        return await asyncio.open_connection(host, port, limit=MAX_MESSAGE_SIZE)
+
+    async def request(self, op: str, **fields) -> Dict[str, Any]:
+        """Send a request and return the response.
+
+        Raises:
+            ConnectionError: If the coordinator cannot be reached within the reconnect timeout.
+            CoordinatorError: If the coordinator rejects the request.
+        """
+        message = json.dumps(dict(fields, op=op, worker=self.worker, token=self.token)).encode() + b"\n"
+        deadline = time.monotonic() + self.reconnect_timeout
+        delay = 0.5
+        async with self._lock:
+            while True:
+                try:
+                    if self._writer is None:
+                        self._reader, self._writer = await self._connect()
+                    self._writer.write(message)
+                    await self._writer.drain()
+                    line = await self._reader.readline()
+                    if not line:
+                        raise ConnectionError("Connection closed by the coordinator")
+                    break
+                except OSError as e:
+                    self._close()
+                    if time.monotonic() + delay > deadline:
+                        raise ConnectionError(f"Could not reach the coordinator at {self.address}: {e}") from e
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+        response = json.loads(line)
+        if "error" in response:
+            raise CoordinatorError(response["error"])
+        return response
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def close(self):
+        async with self._lock:
+            self._close()
+
+
+class ForwardingSink(EventSink):
+    """Buffers the events of a leased test case until they are sent to the coordinator."""
+
+    name = "coordinator"
+
+    def __init__(self):
+        self.device = None
+        self._events: List[Dict[str, Any]] = []
+        # Events are handled in the sink's worker thread and taken on the event loop
+        self._lock = threading.Lock()
+
+    def handle(self, event) -> None:
+        data = event.to_dict(inline=True)
+        with self._lock:
+            self._events.append(data)
+
+    def take(self) -> List[Dict[str, Any]]:
+        """The events buffered since the previous call."""
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+
+def split_events(events: List[Dict[str, Any]], limit: int = MAX_EVENTS_SIZE) -> List[List[Dict[str, Any]]]:
+    """Split events into batches that each fit into a message to the coordinator.
+
+    An event that does not fit into a message on its own is replaced by an
+    EventsSkippedEvent. There is always at least one (possibly empty) batch.
+    """
+    batches: List[List[Dict[str, Any]]] = [[]]
+    size = 0
+    for data in events:
+        event_size = len(json.dumps(data))
+        if event_size > limit:
+            notice = EventsSkippedEvent(count=1, event_types={str(data.get("event_type")): 1})
+            notice.seq = data.get("seq", 0)
+            data = notice.to_dict(inline=True)
+            event_size = len(json.dumps(data))
+        if batches[-1] and size + event_size > limit:
+            batches.append([])
+            size = 0
+        batches[-1].append(data)
+        size += event_size
+    return batches
+
+
+def worker_name() -> str:
+    """A name that identifies this worker process to the coordinator."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def run_worker(client: CoordinatorClient, targets: List[str],
+                     run_case: Callable[[TestCase, str, EventSink], Awaitable[TestResult]],
+                     concurrency: int = 1, heartbeat_interval: float = 10,
+                     on_result: Optional[Callable[[TestResult], None]] = None) -> List[TestResult]:
+    """Lease and run test cases from the coordinator until its batch is done.
+
+    Args:
+        client: The connection to the coordinator
+        targets: The target platforms this worker can run test cases on
+        run_case: Coroutine function running a test case with a model and an
+            event sink, e.g. a wrapper of `execute_test_case`
+        concurrency: Number of test cases to run at the same time
+        heartbeat_interval: Seconds between heartbeats, which also carry the events
+        on_result: Optional callback invoked with each TestResult as it completes
+
+    Returns:
+        The results of the test cases this worker ran.
+
+    Raises:
+        ConnectionError: If the coordinator cannot be reached anymore.
+    """
+    results = []
+
+    async def send(op: str, token: str, events: List[Dict[str, Any]], **fields) -> Dict[str, Any]:
+        # Events that do not fit into one message go ahead in heartbeats of their own
+        batches = split_events(events)
+        for batch in batches[:-1]:
+            await client.request("heartbeat", lease=token, events=batch)
+        return await client.request(op, lease=token, events=batches[-1], **fields)
+
+    async def slot():
+        while True:
+            response = await client.request("lease", targets=targets)
+            if response.get("done"):
+                return
+            lease = response.get("lease")
+            if lease is None:
+                await asyncio.sleep(response.get("retry_after", RETRY_AFTER))
+                continue
+
+            sink = ForwardingSink()
+            task = asyncio.ensure_future(run_case(TestCase(**lease["case"]), lease["model"], sink))
+            try:
+                while not task.done():
+                    await asyncio.wait({task}, timeout=heartbeat_interval)
+                    if task.done():
+                        break
+                    heartbeat = await send("heartbeat", lease["token"], sink.take())
+                    if not heartbeat.get("ok"):
+                        # The coordinator gave the test case to another worker
+                        task.cancel()
+            except BaseException:
+                task.cancel()
+                raise
+            if task.cancelled():
+                continue
+            result = task.result()
+            await send("complete", lease["token"], sink.take(), result=dataclasses.asdict(result))
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+    slots = [asyncio.ensure_future(slot()) for _ in range(max(1, concurrency))]
+    try:
+        await asyncio.gather(*slots)
+    finally:
+        for task in slots:
+            task.cancel()
+        await client.close()
+    return results
@@ -1,89 +1,363 @@
 """Event classes for agent interactions."""
-from dataclasses import dataclass
-from typing import Dict, Any, Optional, List
+import time
+from dataclasses import dataclass, field, fields
+from typing import Any, ClassVar, Dict, List, Optional
 
+from utils.artifacts import PayloadRef, default_store, spill_payloads
 
-@dataclass
+
+def event_dataclass(cls):
+    """Turn an event class into a dataclass without an instance `__dict__`.
+    
+    Every step of every run creates several events, so they use `__slots__`
+    like `dataclass(slots=True)` does on Python 3.10 and later. Methods of
+    slotted classes cannot use `super()` without arguments.
+    """
+    cls = dataclass(cls)
+    own_fields = tuple(f.name for f in fields(cls) if f.name in cls.__dict__.get("__annotations__", {}))
+    namespace = {key: value for key, value in cls.__dict__.items()
+                 if key not in own_fields and key not in ("__dict__", "__weakref__")}
+    namespace["__slots__"] = own_fields
+    slotted = type(cls)(cls.__name__, cls.__bases__, namespace)
+    slotted.__qualname__ = cls.__qualname__
+    return slotted
+
+
+@event_dataclass
 class AgentEvent:
-    """Base class for all agent events."""
-    event_type: str
+    """Base class for all agent events.
+    
+    Every event records the wall-clock and monotonic time it was created at.
+    The sequence number is assigned when the event is yielded by the
+    interaction loop.
+    """
+    EVENT_TYPE: ClassVar[str] = ""
+    
+    event_type: str = field(init=False)
+    timestamp: float = field(init=False, compare=False)
+    monotonic: float = field(init=False, compare=False)
+    seq: int = field(init=False, compare=False)
 
+    def __post_init__(self):
+        self.event_type = self.EVENT_TYPE
+        self.timestamp = time.time()
+        self.monotonic = time.monotonic()
+        self.seq = 0
 
-@dataclass
+    def to_dict(self, inline: bool = False) -> Dict[str, Any]:
+        """Convert the event into a JSON-serializable dictionary.
+        
+        Args:
+            inline: Whether spilled payloads are read back into the dictionary
+                instead of being described by their artifact reference
+        """
+        return {field.name: to_jsonable(getattr(self, field.name), inline) for field in fields(self)}
+
+
+@event_dataclass
 class UserQueryEvent(AgentEvent):
     """Event representing a user query."""
+    EVENT_TYPE: ClassVar[str] = "user_query"
+    
     query: str
 
-    def __init__(self, query: str):
-        super().__init__(event_type="user_query")
-        self.query = query
 
-
-@dataclass
+@event_dataclass
 class AgentResponseEvent(AgentEvent):
     """Event representing an agent response."""
-    text: str
+    EVENT_TYPE: ClassVar[str] = "agent_response"
     
-    def __init__(self, text: str):
-        super().__init__(event_type="agent_response")
-        self.text = text
+    text: str
 
 
-@dataclass
+@event_dataclass
 class ToolCallEvent(AgentEvent):
     """Event representing a tool call."""
+    EVENT_TYPE: ClassVar[str] = "tool_call"
+    
     name: str
     args: Dict[str, Any]
-    
-    def __init__(self, name: str, args: Dict[str, Any]):
-        super().__init__(event_type="tool_call")
-        self.name = name
-        self.args = args
 
 
-@dataclass
+@event_dataclass
 class ToolResponseEvent(AgentEvent):
-    """Event representing a tool response."""
+    """Event representing a tool response.
+    
+    Large strings in the response (e.g. base64 screenshots) are spilled to the
+    artifact store and replaced by PayloadRefs when the event is created.
+    """
+    EVENT_TYPE: ClassVar[str] = "tool_response"
+    
     name: str
     response: Any
     
-    def __init__(self, name: str, response: Any):
-        super().__init__(event_type="tool_response")
-        self.name = name
-        self.response = response
+    def __post_init__(self):
+        AgentEvent.__post_init__(self)
+        store = default_store()
+        if store is not None:
+            self.response = spill_payloads(to_jsonable(self.response), store)
 
 
-@dataclass
+@event_dataclass
 class FinalResponseEvent(AgentEvent):
     """Event representing the final response from the agent."""
-    text: str
+    EVENT_TYPE: ClassVar[str] = "final_response"
     
-    def __init__(self, text: str):
-        super().__init__(event_type="final_response")
-        self.text = text
+    text: str
 
 
-@dataclass
+@event_dataclass
 class ConversationStartEvent(AgentEvent):
     """Event indicating the start of a conversation."""
-    
-    def __init__(self):
-        super().__init__(event_type="conversation_start")
+    EVENT_TYPE: ClassVar[str] = "conversation_start"
 
 
-@dataclass
+@event_dataclass
 class ConversationEndEvent(AgentEvent):
     """Event indicating the end of a conversation."""
-    
-    def __init__(self):
-        super().__init__(event_type="conversation_end")
+    EVENT_TYPE: ClassVar[str] = "conversation_end"
 
 
-@dataclass
+@event_dataclass
 class ErrorEvent(AgentEvent):
     """Event representing an error in the agent processing."""
+    EVENT_TYPE: ClassVar[str] = "error"
+    
     message: str
+
+
+@event_dataclass
+class ToolCacheEvent(AgentEvent):
+    """Event representing a lookup in the tool result cache."""
+    EVENT_TYPE: ClassVar[str] = "tool_cache"
+    
+    name: str
+    hit: bool
+    hits: int
+    misses: int
+
+
+@event_dataclass
+class LlmCacheEvent(AgentEvent):
+    """Event representing a lookup in the model response cache."""
+    EVENT_TYPE: ClassVar[str] = "llm_cache"
+    
+    model: str
+    hit: bool
+    hits: int
+    misses: int
+
+
+@event_dataclass
+class BudgetExceededEvent(AgentEvent):
+    """Event representing a run that was stopped because it exceeded its budget."""
+    EVENT_TYPE: ClassVar[str] = "budget_exceeded"
+    
+    limit: str
+    threshold: float
+    used: float
+    message: Optional[str] = None
+    
+    def __post_init__(self):
+        AgentEvent.__post_init__(self)
+        self.message = self.message or f"{self.limit} of {self.threshold} reached ({self.used})"
+
+
+@event_dataclass
+class ModelRouteEvent(AgentEvent):
+    """Event representing which model of a cascade handled an LLM turn, and why."""
+    EVENT_TYPE: ClassVar[str] = "model_route"
+    
+    model: str
+    reason: str
+    escalated: bool = False
+
+
+@event_dataclass
+class TestResultEvent(AgentEvent):
+    """Event representing the outcome of a test case in a suite run."""
+    EVENT_TYPE: ClassVar[str] = "test_result"
+    
+    test_id: str
+    target: str
+    verdict: str
+    duration: float
+    tool_calls: int = 0
+    error: Optional[str] = None
+    device: Optional[str] = None
+    cached: bool = False
+
+
+@event_dataclass
+class LlmTurnEvent(AgentEvent):
+    """Event representing the latency and token usage of a single LLM turn."""
+    EVENT_TYPE: ClassVar[str] = "llm_turn"
+    
+    model: str
+    duration: float
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+@event_dataclass
+class ToolTimingEvent(AgentEvent):
+    """Event representing the latency of a single tool call."""
+    EVENT_TYPE: ClassVar[str] = "tool_timing"
+    
+    name: str
+    duration: float
+
+
+@event_dataclass
+class RunSummaryEvent(AgentEvent):
+    """Event summarizing where the wall time of a conversation was spent."""
+    EVENT_TYPE: ClassVar[str] = "run_summary"
+    
+    wall_time: float
+    model_time: float
+    tool_time: float
+    overhead: float
+    llm_turns: int
+    tool_calls: int
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    turns_by_model: Optional[Dict[str, int]] = None
+    
+    def __post_init__(self):
+        AgentEvent.__post_init__(self)
+        self.turns_by_model = self.turns_by_model or {}
+
+
+@event_dataclass
+class PayloadCompactionEvent(AgentEvent):
+    """Event representing the compaction of a tool response before it reaches the model."""
+    EVENT_TYPE: ClassVar[str] = "payload_compaction"
+    
+    name: str
+    bytes_in: int
+    bytes_out: int
+
+
+@event_dataclass
+class ReplayDivergenceEvent(AgentEvent):
+    """Event indicating that a replayed trace diverged from its recording."""
+    EVENT_TYPE: ClassVar[str] = "replay_divergence"
+    
+    step: int
+    name: str
+    reason: str
+
+
+@event_dataclass
+class EventsSkippedEvent(AgentEvent):
+    """Event standing in for events a slow sink skipped to keep up with the run."""
+    EVENT_TYPE: ClassVar[str] = "events_skipped"
+    
+    count: int = 0
+    event_types: Optional[Dict[str, int]] = None
+    
+    def __post_init__(self):
+        AgentEvent.__post_init__(self)
+        self.event_types = self.event_types or {}
+    
+    def add(self, event: AgentEvent) -> None:
+        """Count a skipped event, or merge the counts of another EventsSkippedEvent."""
+        if isinstance(event, EventsSkippedEvent):
+            self.count += event.count
+            for event_type, count in event.event_types.items():
+                self.event_types[event_type] = self.event_types.get(event_type, 0) + count
+        else:
+            self.count += 1
+            self.event_types[event.event_type] = self.event_types.get(event.event_type, 0) + 1
+
+
+class EventBus:
+    """Collects events emitted outside of the runner, e.g. by tool wrappers.
+    
+    The interaction loop drains the bus after each runner event, so these
+    events appear in the event stream next to the tool calls they belong to.
+    """
+    
+    def __init__(self):
+        self._pending: List[AgentEvent] = []
+    
+    def emit(self, event: AgentEvent) -> None:
+        self._pending.append(event)
+    
+    def drain(self) -> List[AgentEvent]:
+        events, self._pending = self._pending, []
+        return events
+
+
+def to_jsonable(value: Any, inline: bool = False) -> Any:
+    """Convert a value (e.g. an MCP tool result) into JSON-serializable data.
+    
+    Args:
+        value: The value to convert
+        inline: Whether spilled payloads are read back instead of being
+            described by their artifact reference
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, PayloadRef):
+        return value.read() if inline else value.to_dict()
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item, inline) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item, inline) for item in value]
+    if hasattr(value, "model_dump"):
+        return to_jsonable(value.model_dump(mode="json", exclude_none=True), inline)
+    return str(value)
+
+
+def is_error_result(value: Any) -> bool:
+    """Whether a tool result reports an error.
+    
+    Handles MCP results as well as the plain dictionaries that wrapped tools
+    (e.g. compaction) return, including ADK's `{"result": ...}` envelope.
+    """
+    if isinstance(value, dict):
+        if isinstance(value.get("result"), dict):
+            value = value["result"]
+        return bool(value.get("isError"))
+    return bool(getattr(value, "isError", False))
+
+
+EVENT_TYPES = {
+    "user_query": UserQueryEvent,
+    "agent_response": AgentResponseEvent,
+    "tool_call": ToolCallEvent,
+    "tool_response": ToolResponseEvent,
+    "final_response": FinalResponseEvent,
+    "conversation_start": ConversationStartEvent,
+    "conversation_end": ConversationEndEvent,
+    "error": ErrorEvent,
+    "tool_cache": ToolCacheEvent,
+    "llm_cache": LlmCacheEvent,
+    "budget_exceeded": BudgetExceededEvent,
+    "model_route": ModelRouteEvent,
+    "test_result": TestResultEvent,
+    "llm_turn": LlmTurnEvent,
+    "tool_timing": ToolTimingEvent,
+    "run_summary": RunSummaryEvent,
+    "payload_compaction": PayloadCompactionEvent,
+    "replay_divergence": ReplayDivergenceEvent,
+    "events_skipped": EventsSkippedEvent,
+}
+
+
+def event_from_dict(data: Dict[str, Any]) -> AgentEvent:
+    """Recreate an event from a dictionary produced by `AgentEvent.to_dict`.
     
-    def __init__(self, message: str):
-        super().__init__(event_type="error")
-        self.message = message
\ No newline at end of file
+    Raises:
+        ValueError: If the event type is unknown.
+    """
+    event_class = EVENT_TYPES.get(data.get("event_type"))
+    if event_class is None:
+        raise ValueError(f"Unknown event type: {data.get('event_type')}")
+    metadata = {field.name for field in fields(AgentEvent)}
+    event = event_class(**{key: value for key, value in data.items() if key not in metadata})
+    for name in metadata - {"event_type"}:
+        if name in data:
+            setattr(event, name, data[name])
+    return event
@@ -0,0 +1,286 @@
+"""Fan-out of independent checks to parallel sub-agents.
+
+Test cases often end with several independent verifications ("verify the
+header, the footer and the cart count"), which a single agent performs one
+LLM turn after another. In fan-out mode a planner splits the test case into
+setup steps and independent checks. The UI testing agent performs the setup,
+then every check is verified by its own sub-agent with read-only tools, all
+at the same time against the same screen, and their verdicts are merged
+into one final response.
+"""
+import asyncio
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.genai import types
+
+from utils.routing import CascadeLlm
+from utils.tool_cache import DEFAULT_CACHEABLE_TOOLS, DEFAULT_READ_ONLY_TOOLS
+from utils.tools import SELECT_DEVICE_TOOL
+from utils.wait_for import WAIT_TOOL
+
+# Session state key of the planner's output
+PLAN_KEY = "fanout_plan"
+
+CHECK_VERDICT_PATTERN = re.compile(r"CHECK RESULT:\s*\**\s*(PASSED|FAILED)", re.IGNORECASE)
+SETUP_FAILED = "SETUP FAILED"
+
+# Tools a check agent may use besides the read-only inspection tools. Waiting for an
+# element does not change the screen. Selecting a device is left out: the checks share
+# the executor's server, so switching its device would move every check along.
+CHECK_EXTRA_TOOLS = {WAIT_TOOL}
+
+
+@lru_cache(maxsize=None)
+def load_prompt(name: str) -> str:
+    """Load an instruction file from the prompts directory."""
+    return (Path(__file__).parent.parent / "prompts" / f"{name}.txt").read_text().strip()
+
+
+def _literal(text: str) -> str:
+    # ADK fills `{name}` placeholders of instructions from the session state, which
+    # must not happen to text written by the model
+    return text.replace("{", "(").replace("}", ")")
+
+
+def _device_note(device: Optional[str]) -> str:
+    if device is None:
+        return "Stay on the device the setup used, it is already selected and you must not select another one."
+    return f"Stay on the device '{_literal(device)}' the setup used, it is already selected and you must not select another one."
+
+
+def parse_plan(text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse the planner's response, or return None if the test should not be fanned out.
+
+    Fan-out only pays off with at least two independent checks.
+    """
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        plan = json.loads(match.group())
+    except ValueError:
+        return None
+    if not isinstance(plan, dict) or not isinstance(plan.get("checks"), list):
+        return None
+    checks = [str(check).strip() for check in plan["checks"] if str(check).strip()]
+    if len(checks) < 2:
+        return None
+    return {"setup": str(plan.get("setup") or "").strip(), "checks": checks}
+
+
+def parse_check_verdict(text: str) -> str:
+    """Extract the verdict ("passed", "failed" or "unknown") of a single check."""
+    matches = CHECK_VERDICT_PATTERN.findall(text or "")
+    return matches[-1].lower() if matches else "unknown"
+
+
+def merge_verdicts(checks: List[str], responses: List[str]) -> str:
+    """Merge the responses of the check agents into the final response of the test."""
+    verdicts = [parse_check_verdict(response) for response in responses]
+    passed = sum(verdict == "passed" for verdict in verdicts)
+    sections = [f"Verified {len(checks)} independent checks in parallel, {passed} passed."]
+    for index, (check, response, verdict) in enumerate(zip(checks, responses, verdicts), start=1):
+        sections.append(f"**Check {index} ({verdict.upper()}):** {check}\n\n{response.strip() or 'No response.'}")
+    overall = "PASSED" if passed == len(checks) else "FAILED"
+    sections.append(f"TEST RESULT: {overall}")
+    return "\n\n".join(sections)
+
+
+def _final_text(event: Event) -> Optional[str]:
+    if not event.is_final_response() or not event.content or not event.content.parts:
+        return None
+    return "".join(part.text for part in event.content.parts if part.text)
+
+
+async def _merge_runs(runs: List[AsyncGenerator[Event, None]], limit: int) -> AsyncGenerator[Event, None]:
+    """Interleave the events of several agent runs, with at most `limit` running at once.
+
+    Every run is consumed by a task of its own, so the tracing context of its
+    spans stays intact from start to end.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(limit)
+
+    async def drive(run):
+        try:
+            async with semaphore:
+                async for event in run:
+                    processed = asyncio.get_running_loop().create_future()
+                    queue.put_nowait((event, processed))
+                    # Like ADK's ParallelAgent, a run only moves on once its event was processed
+                    await processed
+        except Exception as e:
+            queue.put_nowait((e, None))
+        finally:
+            await run.aclose()
+            queue.put_nowait((None, None))
+
+    tasks = [asyncio.ensure_future(drive(run)) for run in runs]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item, processed = await queue.get()
+            if item is None:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+                processed.set_result(None)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class FanOutAgent(BaseAgent):
+    """Plans a test case, runs its setup and verifies its checks with parallel sub-agents.
+
+    Test cases without at least two independent checks are run by the
+    executor alone, exactly like without fan-out.
+    """
+
+    planner: LlmAgent
+    executor: LlmAgent
+    check_instruction: str
+    check_tools: List[Any]
+    max_parallel: int = 4
+    # Models of the check agents of the current run by agent name
+    _check_models: Dict[str, Any] = {}
+
+    @property
+    def model(self):
+        """The model of the UI testing agent."""
+        return self.executor.model
+
+    def model_for(self, author: str):
+        """The model that produced an event of a sub-agent."""
+        return self._check_models.get(author, self.executor.model)
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        plan_text = None
+        async for event in self.planner.run_async(ctx):
+            plan_text = _final_text(event) or plan_text
+            yield event
+        plan = parse_plan(plan_text)
+
+        # The executor's answer is the answer of the whole agent, unless checks follow
+        setup_text = None
+        device = None
+        async for event in self.executor.run_async(ctx):
+            for call in event.get_function_calls():
+                if call.name == SELECT_DEVICE_TOOL and call.args and call.args.get("device"):
+                    device = str(call.args["device"])
+            text = _final_text(event)
+            if text is not None and event.author == self.executor.name:
+                if plan is None:
+                    event = event.model_copy(update={"author": self.name})
+                else:
+                    setup_text = text
+            yield event
+        if plan is None:
+            return
+
+        if setup_text is not None and SETUP_FAILED in setup_text:
+            yield self._final_event(ctx, f"{setup_text.strip()}\n\nTEST RESULT: FAILED")
+            return
+
+        checks = plan["checks"]
+        agents = [self._check_agent(index, check, device) for index, check in enumerate(checks, start=1)]
+        self._check_models = {agent.name: agent.model for agent in agents}
+        # Every check gets its own branch, so the checks do not see each other's tool calls
+        runs = [
+            agent.run_async(ctx.model_copy(update={"branch": f"{ctx.branch}.{agent.name}" if ctx.branch else agent.name}))
+            for agent in agents
+        ]
+        responses = {agent.name: "" for agent in agents}
+        async for event in _merge_runs(runs, self.max_parallel):
+            text = _final_text(event)
+            if text is not None and event.author in responses:
+                responses[event.author] = text
+            yield event
+
+        yield self._final_event(ctx, merge_verdicts(checks, [responses[agent.name] for agent in agents]))
+
+    def _check_agent(self, index: int, check: str, device: Optional[str] = None) -> LlmAgent:
+        instruction = load_prompt("fanout_check_instruction") \
+            .replace("{device}", _device_note(device)).replace("{check}", _literal(check))
+        model = self.executor.model
+        # The checks run at the same time, so a cascade's escalation state must not be shared
+        if isinstance(model, CascadeLlm):
+            model = model.fork()
+        return LlmAgent(
+            name=f"check_{index}",
+            model=model,
+            description=f"Verifies: {check}",
+            instruction=f"{self.check_instruction}\n\n{instruction}",
+            tools=self.check_tools,
+            before_model_callback=self.executor.before_model_callback,
+            after_model_callback=self.executor.after_model_callback,
+            disallow_transfer_to_parent=True,
+            disallow_transfer_to_peers=True,
+        )
+
+    def _final_event(self, ctx: InvocationContext, text: str) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+        )
+
+
+def _executor_instruction(instruction: str):
+    def provider(context) -> str:
+        plan = parse_plan(context.state.get(PLAN_KEY))
+        if plan is None:
+            return instruction
+        setup = _literal(plan["setup"]) or "None, the app is already in the state to check."
+        return f"{instruction}\n\n{load_prompt('fanout_setup_instruction').replace('{setup}', setup)}"
+    return provider
+
+
+def is_check_tool(name: str, read_only_tools=()) -> bool:
+    """Whether a check agent may use a tool, i.e. whether it leaves the screen unchanged."""
+    return name in DEFAULT_CACHEABLE_TOOLS or name in DEFAULT_READ_ONLY_TOOLS or \
+        name in CHECK_EXTRA_TOOLS or name in read_only_tools
+
+
+def create_fanout_agent(agent: LlmAgent, settings: Dict[str, Any]) -> FanOutAgent:
+    """Wrap a UI testing agent so that independent checks run in parallel.
+
+    Args:
+        agent: The UI testing agent, which becomes the executor of the setup
+        settings: Fan-out settings as returned by `get_fanout_settings`
+    """
+    instruction = agent.instruction
+    planner = LlmAgent(
+        name="planner",
+        model=agent.model,
+        description="Splits a test case into setup steps and independent checks",
+        instruction=load_prompt("fanout_planner_instruction"),
+        output_key=PLAN_KEY,
+        disallow_transfer_to_parent=True,
+        disallow_transfer_to_peers=True,
+    )
+    agent.instruction = _executor_instruction(instruction)
+    agent.disallow_transfer_to_parent = True
+    agent.disallow_transfer_to_peers = True
+    read_only_tools = set(settings.get("read_only_tools") or [])
+    return FanOutAgent(
+        name="uitesting_fanout",
+        description="Provide UI testing services, verifying independent checks in parallel",
+        planner=planner,
+        executor=agent,
+        check_instruction=instruction,
+        check_tools=[tool for tool in agent.tools if is_check_tool(tool.name, read_only_tools)],
+        max_parallel=settings.get("max_parallel", 4),
+        sub_agents=[planner, agent],
+    )
@@ -1,18 +1,24 @@
-from typing import AsyncGenerator
+import asyncio
+from typing import AsyncGenerator, Optional
 from google.adk.runners import Runner
 from google.genai import types
 
 from utils.events import (
     AgentEvent, UserQueryEvent, AgentResponseEvent, ToolCallEvent,
     FinalResponseEvent, ConversationStartEvent, ConversationEndEvent, ErrorEvent,
-    ToolResponseEvent
+    ToolResponseEvent, EventBus, LlmTurnEvent
 )
+from utils.budget import BudgetTracker, RunBudget, next_before, quiet_abandoned_spans
+from utils.metrics import RunMetrics, get_model_name, get_token_counts
+from utils.routing import CascadeLlm
 
 async def process_agent_interaction(
     runner: Runner, 
     query: str, 
     user_id: str, 
-    session_id: str
+    session_id: str,
+    event_bus: Optional[EventBus] = None,
+    budget: Optional[RunBudget] = None
 ) -> AsyncGenerator[AgentEvent, None]:
     """Process agent interaction and yield structured event objects.
     
@@ -21,10 +27,27 @@ async def process_agent_interaction(
         query: The user's query text
         user_id: ID of the current user
         session_id: Current session ID
+        event_bus: Optional EventBus whose events (e.g. from tool wrappers) are
+            yielded alongside the runner's events
+        budget: Optional RunBudget. A run that exceeds it is stopped with a
+            BudgetExceededEvent instead of a final response.
         
     Yields:
-        AgentEvent objects representing the conversation flow
+        AgentEvent objects representing the conversation flow, numbered
+        with consecutive sequence numbers starting at 1, including LLM turn
+        timings and a final RunSummaryEvent
     """
+    metrics = RunMetrics()
+    seq = 0
+    async for event in _interaction_events(runner, query, user_id, session_id, event_bus, metrics, budget):
+        seq += 1
+        event.seq = seq
+        # Time spent by the consumer on this event must not count as model or tool time
+        metrics.pause()
+        yield event
+        metrics.resume()
+
+async def _interaction_events(runner, query, user_id, session_id, event_bus, metrics, budget):
     # Start conversation
     yield ConversationStartEvent()
     
@@ -34,11 +57,50 @@ async def process_agent_interaction(
     # Set up content for the agent
     content = types.Content(role='user', parts=[types.Part(text=query)])
     
+    # Runners are reused between runs (e.g. by the daemon), so an escalation must not carry over
+    if isinstance(runner.agent.model, CascadeLlm):
+        runner.agent.model.reset()
+    model_name = get_model_name(runner.agent.model)
+    tracker = BudgetTracker(budget) if budget is not None and budget.is_limited() else None
+    exceeded = None
+    metrics.lap()
+    
     # Process agent's response
+    events = runner.run_async(user_id=user_id, session_id=session_id, new_message=content)
     try:
-        async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
-            # Check if this is a final response first
-            is_final = event.is_final_response()
+        while True:
+            try:
+                event = await next_before(events, tracker.deadline if tracker else None)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                metrics.lap()
+                exceeded = tracker.wall_time_exceeded()
+                break
+            
+            # Everything since the previous runner event was spent either running
+            # tools (function response events) or waiting for the model
+            duration = metrics.lap()
+            function_responses = event.get_function_responses() if hasattr(event, 'get_function_responses') else []
+            if function_responses:
+                metrics.record_tool_calls(duration, len(function_responses))
+            elif event.author != 'user':
+                prompt_tokens, completion_tokens = get_token_counts(event)
+                # A cascade reports which of its models handled the turn
+                agent_model = runner.agent.model_for(event.author) if hasattr(runner.agent, 'model_for') \
+                    else runner.agent.model
+                turn_model = getattr(agent_model, 'last_model_name', None) or model_name
+                metrics.record_llm_turn(duration, prompt_tokens, completion_tokens, turn_model)
+                yield LlmTurnEvent(turn_model, duration, prompt_tokens, completion_tokens)
+            
+            # Yield events emitted while the runner produced this event (e.g. during tool execution)
+            if event_bus is not None:
+                for bus_event in event_bus.drain():
+                    yield bus_event
+            
+            # Check if this is a final response first. Final responses of sub-agents
+            # (e.g. parallel checks) are intermediate results of the root agent.
+            is_final = event.is_final_response() and event.author == runner.agent.name
             
             # Process intermediate agent responses (only if not a final response)
             if not is_final and event.content and event.content.parts:
@@ -52,7 +114,6 @@ async def process_agent_interaction(
                 yield ToolCallEvent(call.name, call.args)
 
             # Process function responses
-            function_responses = event.get_function_responses() if hasattr(event, 'get_function_responses') else []
             for response in function_responses:
                 yield ToolResponseEvent(response.name, response.response)
             
@@ -66,8 +127,27 @@ async def process_agent_interaction(
                     final_response_text = "Agent did not produce a final response."
                 
                 yield FinalResponseEvent(final_response_text)
+            
+            # Stop before the runner executes the requested tools or asks the model again
+            if tracker is not None:
+                tracker.observe_responses(function_responses)
+                if event.author != 'user' and not function_responses:
+                    exceeded = tracker.check_turn(metrics, is_final) or tracker.check_tool_calls(function_calls, metrics)
+                if exceeded:
+                    break
     except Exception as e:
         yield ErrorEvent(str(e))
+    finally:
+        # Cancels whatever the runner was doing when the run was stopped early
+        if exceeded is not None:
+            quiet_abandoned_spans()
+        await events.aclose()
+    
+    if exceeded is not None:
+        yield exceeded
+    
+    # Summarize where the time went
+    yield metrics.summary()
     
     # End conversation
     yield ConversationEndEvent()
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""Caching of model responses and of the static prompt prefix across runs.
+
+The response cache stores complete model responses on disk, keyed by the
+model and a hash of the full request (instruction, tool declarations and
+conversation). Repeated runs of the same test replay the model's answers
+for as long as the conversation matches, with least recently used entries
+evicted first.
+
+The prefix cache makes the provider keep the static part of every request
+(the instruction and the tool declarations) instead of re-processing it on
+every turn: a Gemini context cache, Anthropic-style cache_control breakpoints
+through LiteLLM, or a loaded model with a warm prompt cache for Ollama.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from google.adk.models.llm_response import LlmResponse
+
+from utils.events import EventBus, LlmCacheEvent
+from utils.metrics import get_model_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+CREATE TABLE IF NOT EXISTS prefixes (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+# Stores are shared by all agents of a process that use the same file
+_stores: Dict[str, "LlmCacheStore"] = {}
+
+# Context caches being created, by prefix key, so concurrent agents create each one once
+_creating_prefixes: Dict[str, "asyncio.Task"] = {}
+
+
+def request_key(model: str, llm_request) -> str:
+    """Hash everything the model sees of a request."""
+    request = llm_request.model_dump(mode="json", exclude_none=True, exclude={"tools_dict", "live_connect_config"})
+    request["model"] = model
+    # Function call IDs are generated anew in every run
+    for content in request.get("contents", []):
+        for part in content.get("parts", []):
+            for key in ("function_call", "function_response"):
+                if isinstance(part.get(key), dict):
+                    part[key].pop("id", None)
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def prefix_key(model: str, config) -> str:
+    """Hash the static part of a request: instruction and tool declarations."""
+    prefix = config.model_dump(mode="json", exclude_none=True, include={"system_instruction", "tools"})
+    prefix["model"] = model
+    return hashlib.sha256(json.dumps(prefix, sort_keys=True).encode()).hexdigest()
+
+
+class LlmCacheStore:
+    """An on-disk LRU store of model responses and provider prefix caches."""
+
+    def __init__(self, path, max_entries: int = 1000, ttl: float = 0):
+        """Initializes the store.
+
+        Args:
+            path: Path of the SQLite database file
+            max_entries: Maximum number of cached responses (0 for unlimited)
+            ttl: Seconds after which a cached response expires (0 for never)
+        """
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.executescript(SCHEMA)
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response, refreshing its LRU position."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        """Store a response and evict the least recently used ones beyond the limit."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            if self.max_entries:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def get_prefix(self, key: str, min_lifetime: float = 0) -> Optional[str]:
+        """Name of a provider prefix cache that is valid for at least `min_lifetime` seconds."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT name FROM prefixes WHERE key = ? AND expires > ?", (key, time.time() + min_lifetime)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_prefix(self, key: str, name: str, expires: float):
+        """Remember a provider prefix cache until it expires."""
+        with self._lock:
+            self._db.execute("DELETE FROM prefixes WHERE expires <= ?", (time.time(),))
+            self._db.execute("INSERT OR REPLACE INTO prefixes (key, name, expires) VALUES (?, ?, ?)",
+                             (key, name, expires))
+
+    def clear(self):
+        """Drop all cached responses and prefix cache names."""
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.execute("DELETE FROM prefixes")
+
+
+def open_store(path, max_entries: int = 1000, ttl: float = 0) -> LlmCacheStore:
+    """Open the store at `path`, reusing an already open one."""
+    resolved = str(Path(path).expanduser().resolve())
+    if resolved not in _stores:
+        _stores[resolved] = LlmCacheStore(resolved, max_entries, ttl)
+    return _stores[resolved]
+
+
+def litellm_prefix_cache_args(model_name: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Additional LiteLLM completion arguments that enable provider prefix caching.
+
+    Ollama keeps the prompt cache of a loaded model, so the model is kept
+    loaded between runs. Other providers get a cache breakpoint after the
+    system message, which LiteLLM translates for backends that support it.
+    """
+    if not settings.get('enabled'):
+        return {}
+    if model_name.startswith("ollama"):
+        return {"keep_alive": settings['keep_alive']}
+    return {"cache_control_injection_points": [{"location": "message", "role": "system"}]}
+
+
+class LlmCacheCallbacks:
+    """Model callbacks of an agent that serve and fill the response cache.
+
+    Also moves the static prefix of Gemini requests into a provider context
+    cache when prefix caching is enabled.
+    """
+
+    def __init__(self, model, store: LlmCacheStore, cache_responses: bool = True, prefix_settings=None,
+                 event_bus: Optional[EventBus] = None):
+        """Initializes the callbacks.
+
+        Args:
+            model: The agent's model (a model name or an ADK model object)
+            store: Store for cached responses and the names of provider prefix caches
+            cache_responses: Whether to serve and store model responses
+            prefix_settings: Prompt prefix cache settings as returned by `get_prompt_cache_settings`
+            event_bus: Optional bus for cache hit and miss events
+        """
+        self.model_name = get_model_name(model)
+        self.cache_responses = cache_responses
+        # Gemini context caching only applies to models that are called through the Gemini API
+        self.gemini_prefix_cache = isinstance(model, str) and bool((prefix_settings or {}).get('enabled'))
+        self.prefix_ttl = (prefix_settings or {}).get('ttl', 3600)
+        self.store = store
+        self.event_bus = event_bus
+        # Request keys of model calls in flight, by invocation and agent (sub-agents may run in parallel)
+        self._pending: Dict[Any, str] = {}
+        self._failed_prefixes = set()
+
+    def before_model(self, callback_context, llm_request) -> Optional[LlmResponse]:
+        if self.cache_responses:
+            key = request_key(self.model_name, llm_request)
+            cached = self.store.get(key)
+            self._emit(cached is not None)
+            if cached is not None:
+                return LlmResponse.model_validate_json(cached)
+            self._pending[(callback_context.invocation_id, callback_context.agent_name)] = key
+
+        if self.gemini_prefix_cache:
+            self._use_context_cache(llm_request)
+        return None
+
+    def after_model(self, callback_context, llm_response) -> Optional[LlmResponse]:
+        key = self._pending.pop((callback_context.invocation_id, callback_context.agent_name), None)
+        # Only complete, successful responses are worth replaying
+        if key is None or llm_response.partial or llm_response.error_code or not llm_response.content:
+            return None
+        self.store.put(key, self.model_name, llm_response.model_dump_json(exclude_none=True))
+        return None
+
+    def _emit(self, hit: bool):
+        if self.event_bus is not None:
+            self.event_bus.emit(LlmCacheEvent(self.model_name, hit, self.store.hits, self.store.misses))
+
+    def _use_context_cache(self, llm_request):
+        config = llm_request.config
+        if config is None or config.cached_content or not (config.system_instruction or config.tools):
+            return
+        key = prefix_key(self.model_name, config)
+        if key in self._failed_prefixes:
+            return
+
+        # Keep a safety margin, a cache must not expire in the middle of a turn
+        name = self.store.get_prefix(key, min_lifetime=60)
+        if name is None:
+            # The model callbacks are synchronous, so the cache is created in the background
+            # without stalling the event loop, and this turn still sends the full prompt
+            if key not in _creating_prefixes:
+                _creating_prefixes[key] = asyncio.get_running_loop().create_task(
+                    self._create_context_cache(key, config)
+                )
+            return
+
+        config.cached_content = name
+        config.system_instruction = None
+        config.tools = None
+
+    def _create_context_cache(self, key: str, config):
+        from google.genai import Client, types
+
+        # Built right away, as the request's config is changed once the cache exists
+        cache_config = types.CreateCachedContentConfig(
+            system_instruction=config.system_instruction,
+            tools=config.tools,
+            ttl=f"{int(self.prefix_ttl)}s",
+        )
+
+        async def create():
+            try:
+                cache = await Client().aio.caches.create(model=self.model_name, config=cache_config)
+            except Exception as e:
+                # E.g. the prefix is below the provider's minimum size for caching
+                self._failed_prefixes.add(key)
+                print(f"Warning: Could not create a context cache, sending the full prompt instead: {e}",
+                      file=sys.stderr)
+            else:
+                self.store.put_prefix(key, cache.name, time.time() + self.prefix_ttl)
+            finally:
+                _creating_prefixes.pop(key, None)
+
+        return create()
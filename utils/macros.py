@@ -0,0 +1,548 @@
+"""Local macro tools that get past common obstacles in a single tool call.
+
+Dismissing a cookie banner, closing a popup, filling a login form or getting
+unstuck on a mobile screen each take the model several turns of inspecting
+the screen and acting on it. Macros run these routines locally in Python,
+directly against the MCP tools of the session, and are offered to the model
+as tools next to the MCP tools.
+
+More macros can be added by dropping Python files into the configured plugin
+directory. Every file defines a `MACROS` list of `Macro` subclasses or
+instances.
+"""
+import importlib.util
+import json
+import re
+import sys
+import time
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.tools.base_tool import BaseTool
+from google.genai import types
+
+from utils.compaction import RECT_KEYS
+from utils.events import is_error_result, to_jsonable
+
+# Tools that list the elements on screen, per target
+INSPECTION_TOOLS = {
+    "web": "browser_snapshot",
+    "android": "mobile_list_elements_on_screen",
+    "ios": "mobile_list_elements_on_screen",
+}
+
+# A line of a Playwright snapshot, e.g. `- button "Accept all" [ref=e12]` or `- paragraph [ref=e3]: Done`
+SNAPSHOT_LINE = re.compile(r'^\s*-\s+(?P<role>[\w-]+)(?:\s+"(?P<name>(?:[^"\\]|\\.)*)")?(?P<attributes>[^:]*)'
+                           r'(?::\s*(?P<value>.*))?$')
+SNAPSHOT_REF = re.compile(r"\[ref=([^\]]+)\]")
+
+# Web roles that can be clicked to dismiss something
+CLICKABLE_ROLES = ("button", "link", "menuitem")
+
+# Fields that name an element of a mobile element list, in order of preference
+ELEMENT_NAME_KEYS = ("text", "label", "name", "value", "identifier", "resourceId", "hint")
+
+CONSENT_CONTEXT = re.compile(r"cookie|consent|privacy|gdpr|tracking|datenschutz|confidentialit", re.IGNORECASE)
+CONSENT_ACCEPT = re.compile(
+    r"^(yes,? )?(i )?(accept|agree|consent)\b|^allow (all|cookies)|^(alle )?akzeptieren|^(tout )?accepter"
+    r"|^aceptar|^accett|^aceitar", re.IGNORECASE)
+# Labels that only accept a banner when the screen mentions cookies or consent
+CONSENT_ACKNOWLEDGE = re.compile(r"^(ok|okay|got it|allow|continue|understood|i understand)$", re.IGNORECASE)
+CONSENT_REJECT = re.compile(r"reject|decline|deny|refuse|necessary|manage|settings|preferences|custom|more options",
+                            re.IGNORECASE)
+
+CLOSE_LABEL = re.compile(r"^(close\b.*|dismiss|no,? thanks|not now|cancel|skip|maybe later|x|×|✕|✖)$", re.IGNORECASE)
+
+USERNAME_FIELD = re.compile(r"user|e-?mail|login|account|phone|identifier|benutzer", re.IGNORECASE)
+PASSWORD_FIELD = re.compile(r"pass(word|code)?|\bpin\b|kennwort|passwort|mot de passe|contrase", re.IGNORECASE)
+SUBMIT_LABEL = re.compile(r"^(log ?in|sign ?in|submit|continue|next|anmelden|einloggen|connexion|se connecter)\b",
+                          re.IGNORECASE)
+TEXT_FIELD_ROLES = re.compile(r"textbox|searchbox|combobox|edittext|textfield|securetextfield", re.IGNORECASE)
+
+
+class MacroError(Exception):
+    """Raised when a macro cannot complete its routine."""
+
+
+class UiElement:
+    """An element on screen that a macro can act on."""
+
+    def __init__(self, role: str, name: str, ref: Optional[str] = None,
+                 center: Optional[Tuple[int, int]] = None, search_text: Optional[str] = None,
+                 disabled: bool = False):
+        self.role = role
+        self.name = name
+        # Playwright element ref, or the center of a mobile element
+        self.ref = ref
+        self.center = center
+        # All identifying text of the element, used for matching
+        self.search_text = search_text if search_text is not None else name
+        self.disabled = disabled
+
+    def __repr__(self) -> str:
+        return f"UiElement({self.role!r}, {self.name!r})"
+
+
+def parse_elements(text: str) -> List[UiElement]:
+    """Parse an inspection result into the elements a macro can act on.
+
+    JSON element lists of mobile-mcp (optionally after a short prefix) yield
+    the elements with a bounding box. Any other text is read as a Playwright
+    snapshot, which yields a node per line. Only nodes with a ref can be
+    acted on; the others (e.g. `- text: ...`) can still be searched.
+    """
+    start = text.find("[")
+    if start >= 0:
+        try:
+            elements = json.loads(text[start:])
+        except ValueError:
+            elements = None
+        if isinstance(elements, list):
+            return [element for element in map(_parse_mobile_element, elements) if element is not None]
+
+    parsed = []
+    for line in text.split("\n"):
+        match = SNAPSHOT_LINE.match(line)
+        if match:
+            name = (match.group("name") or "").replace('\\"', '"')
+            value = match.group("value") or ""
+            ref = SNAPSHOT_REF.search(match.group("attributes"))
+            parsed.append(UiElement(match.group("role"), name or value, ref=ref.group(1) if ref else None,
+                                    search_text=" ".join(part for part in (name, value) if part),
+                                    disabled="[disabled" in match.group("attributes")))
+    return parsed
+
+
+def _parse_mobile_element(element: Any) -> Optional[UiElement]:
+    if not isinstance(element, dict):
+        return None
+    center = _center(next((element[key] for key in RECT_KEYS if key in element), None))
+    if center is None:
+        return None
+    names = [str(element[key]) for key in ELEMENT_NAME_KEYS if element.get(key)]
+    return UiElement(str(element.get("type", "")), names[0] if names else "", center=center,
+                     search_text=" ".join(names),
+                     disabled=element.get("enabled") in (False, "false") or element.get("disabled") in (True, "true"))
+
+
+def _center(rect: Any) -> Optional[Tuple[int, int]]:
+    if isinstance(rect, dict):
+        try:
+            x, y = float(rect["x"]), float(rect["y"])
+            width, height = float(rect.get("width", 0)), float(rect.get("height", 0))
+        except (KeyError, TypeError, ValueError):
+            return None
+        return int(x + width / 2), int(y + height / 2)
+    # Android bounds, e.g. "[0,210][1080,342]"
+    if isinstance(rect, str):
+        numbers = [int(number) for number in re.findall(r"-?\d+", rect)]
+        if len(numbers) == 4:
+            return (numbers[0] + numbers[2]) // 2, (numbers[1] + numbers[3]) // 2
+    return None
+
+
+def result_text(response: Any) -> str:
+    """The text items of a tool result, joined by newlines."""
+    data = to_jsonable(response)
+    if isinstance(data, dict) and isinstance(data.get("result"), dict):
+        data = data["result"]
+    if isinstance(data, dict) and isinstance(data.get("content"), list):
+        return "\n".join(item["text"] for item in data["content"]
+                         if isinstance(item, dict) and isinstance(item.get("text"), str))
+    return data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+
+
+class MacroContext:
+    """Runs the steps of a macro against the tools of the session and records them."""
+
+    def __init__(self, tools: Dict[str, BaseTool], target: str, tool_context: Any = None):
+        """Initializes the context.
+
+        Args:
+            tools: The tools of the session by name
+            target: The target platform, either "android", "ios", or "web"
+            tool_context: The tool context of the macro call, passed on to every step
+        """
+        self.tools = tools
+        self.target = target
+        self.tool_context = tool_context
+        # Tool name and duration of every step, in order
+        self.steps: List[Dict[str, Any]] = []
+
+    @property
+    def is_web(self) -> bool:
+        return self.target == "web"
+
+    def find_tool(self, pattern: str) -> Optional[str]:
+        """The name of the first tool matching a shell-style pattern, or None."""
+        if pattern in self.tools:
+            return pattern
+        return next((name for name in self.tools if fnmatchcase(name, pattern)), None)
+
+    async def call(self, tool: str, **args) -> str:
+        """Call a tool and return the text of its result.
+
+        Args:
+            tool: Name or shell-style pattern of the tool
+            **args: The arguments of the tool
+
+        Raises:
+            MacroError: If the tool is not available or reports an error.
+        """
+        name = self.find_tool(tool)
+        if name is None:
+            raise MacroError(f"Tool {tool} is not available")
+        start = time.perf_counter()
+        try:
+            response = await self.tools[name].run_async(args=args, tool_context=self.tool_context)
+        finally:
+            self.steps.append({"tool": name, "duration": round(time.perf_counter() - start, 3)})
+        text = result_text(response)
+        if is_error_result(response):
+            self.steps[-1]["error"] = True
+            raise MacroError(f"{name} failed: {text}")
+        return text
+
+    async def elements(self) -> List[UiElement]:
+        """The elements currently on screen."""
+        return parse_elements(await self.call(INSPECTION_TOOLS[self.target]))
+
+    async def click(self, element: UiElement) -> None:
+        if self.is_web:
+            await self.call("browser_click", element=element.name or element.role, ref=element.ref)
+        else:
+            await self.tap(*element.center)
+
+    async def tap(self, x: int, y: int) -> None:
+        await self.call("mobile_click_on_screen_at_coordinates", x=x, y=y)
+
+    async def type_text(self, element: UiElement, text: str, submit: bool = False) -> None:
+        """Type text into an input field.
+
+        Args:
+            element: The input field
+            text: The text to type
+            submit: Whether to press Enter afterwards
+        """
+        if self.is_web:
+            await self.call("browser_type", element=element.name or element.role, ref=element.ref,
+                            text=text, submit=submit)
+        else:
+            await self.tap(*element.center)
+            await self.call("mobile_type_keys", text=text, submit=submit)
+
+
+class Macro:
+    """A multi-step routine offered to the model as a single tool.
+
+    Subclasses set the class attributes and implement `run`.
+    """
+
+    name: str = ""
+    description: str = ""
+    # Target -> names or shell-style patterns of the tools the macro needs there.
+    # The macro is only offered on these targets, and only when all of them are available.
+    requires: Dict[str, List[str]] = {}
+    # Argument name -> {"type": JSON schema type, "description": ..., "required": bool}
+    parameters: Dict[str, Dict[str, Any]] = {}
+    # Whether the result lists every tool call the macro made
+    report_steps: bool = True
+
+    def is_available(self, target: str, tool_names: List[str]) -> bool:
+        if target not in self.requires:
+            return False
+        return all(any(fnmatchcase(name, pattern) for name in tool_names) for pattern in self.requires[target])
+
+    async def run(self, ctx: MacroContext, **args) -> Dict[str, Any]:
+        """Run the routine.
+
+        Args:
+            ctx: Context to call the tools of the session through
+            **args: The arguments the model called the macro with
+
+        Returns:
+            A JSON-serializable description of the outcome for the model.
+
+        Raises:
+            MacroError: If the routine cannot be completed.
+        """
+        raise NotImplementedError
+
+
+_WEB_CLICK = ["browser_snapshot", "browser_click"]
+_MOBILE_TAP = ["mobile_list_elements_on_screen", "mobile_click_on_screen_at_coordinates"]
+
+
+def _is_clickable(ctx: MacroContext, element: UiElement) -> bool:
+    if ctx.is_web:
+        return element.ref is not None and element.role.lower() in CLICKABLE_ROLES
+    return element.center is not None
+
+
+class DismissConsentBanner(Macro):
+    name = "dismiss_consent_banner"
+    description = ("Accept the cookie, consent or privacy banner on screen, if there is one. Clicks the accept "
+                   "button, repeating for banners with several layers, and reports what was clicked.")
+    requires = {"web": _WEB_CLICK, "android": _MOBILE_TAP, "ios": _MOBILE_TAP}
+
+    # Layered banners (e.g. a second confirmation) are dismissed in several rounds
+    MAX_ROUNDS = 3
+
+    async def run(self, ctx, **args):
+        clicked = []
+        for _ in range(self.MAX_ROUNDS):
+            text = await ctx.call(INSPECTION_TOOLS[ctx.target])
+            button = self._accept_button(ctx, parse_elements(text), CONSENT_CONTEXT.search(text) is not None)
+            if button is None:
+                break
+            await ctx.click(button)
+            clicked.append(button.name)
+        return {"dismissed": bool(clicked), "clicked": clicked}
+
+    @staticmethod
+    def _accept_button(ctx: MacroContext, elements: List[UiElement], consent_context: bool) -> Optional[UiElement]:
+        candidates = [element for element in elements
+                      if _is_clickable(ctx, element) and element.name and not CONSENT_REJECT.search(element.name)]
+        for element in candidates:
+            if CONSENT_ACCEPT.search(element.name.strip()):
+                return element
+        if consent_context:
+            for element in candidates:
+                if CONSENT_ACKNOWLEDGE.match(element.name.strip(" .!")):
+                    return element
+        return None
+
+
+class ClosePopup(Macro):
+    name = "close_popup"
+    description = ("Close the popup, modal or overlay on screen. Clicks its close button, or presses Escape "
+                   "(web) or taps outside of it (mobile) if it has none.")
+    requires = {"web": _WEB_CLICK, "android": _MOBILE_TAP, "ios": _MOBILE_TAP}
+
+    async def run(self, ctx, **args):
+        button = next((element for element in await ctx.elements()
+                       if _is_clickable(ctx, element) and CLOSE_LABEL.match(element.name.strip())), None)
+        if button is not None:
+            await ctx.click(button)
+            return {"closed": True, "clicked": button.name}
+        if ctx.is_web and ctx.find_tool("browser_press_key"):
+            await ctx.call("browser_press_key", key="Escape")
+            return {"closed": None, "pressed": "Escape",
+                    "note": "No close button found; check the screen to see whether the popup is gone"}
+        if not ctx.is_web and ctx.find_tool("mobile_get_screen_size"):
+            x, y = await _outside_point(ctx)
+            await ctx.tap(x, y)
+            return {"closed": None, "tapped": [x, y],
+                    "note": "No close button found; check the screen to see whether the popup is gone"}
+        return {"closed": False, "note": "No close button found"}
+
+
+async def _outside_point(ctx: MacroContext) -> Tuple[int, int]:
+    """A point near the top of the screen, outside of a centered popup."""
+    size = re.search(r"(\d+)\s*x\s*(\d+)", await ctx.call("mobile_get_screen_size"))
+    if size is None:
+        raise MacroError("Could not read the screen size")
+    width, height = int(size.group(1)), int(size.group(2))
+    return width // 2, height // 10
+
+
+class FillLoginForm(Macro):
+    name = "fill_login_form"
+    description = ("Fill the login form on screen with a username and password and submit it. Handles forms "
+                   "that ask for the password on a second step.")
+    requires = {"web": _WEB_CLICK + ["browser_type"], "android": _MOBILE_TAP + ["mobile_type_keys"],
+                "ios": _MOBILE_TAP + ["mobile_type_keys"]}
+    parameters = {
+        "username": {"type": "string", "description": "Username, e-mail address or phone number",
+                     "required": True},
+        "password": {"type": "string", "description": "Password", "required": True},
+        "submit": {"type": "boolean", "description": "Submit the form after filling it (default: true)"},
+    }
+
+    async def run(self, ctx, username="", password="", submit=True, **args):
+        elements = await ctx.elements()
+        fields = [element for element in elements if _is_text_field(element)]
+        password_field = next((field for field in fields if PASSWORD_FIELD.search(field.search_text)), None)
+        username_field = next((field for field in fields if field is not password_field
+                               and USERNAME_FIELD.search(field.search_text)), None)
+        if username_field is None:
+            username_field = next((field for field in fields if field is not password_field), None)
+        if username_field is None and password_field is None:
+            raise MacroError("No input fields found on screen")
+
+        filled = []
+        if username_field is not None and password_field is None:
+            # Two-step login: submit the username, then look for the password field
+            await self._fill(ctx, elements, username_field, username, submit=True)
+            filled.append(username_field.name or "username")
+            elements = await ctx.elements()
+            password_field = next((element for element in elements if _is_text_field(element)
+                                   and PASSWORD_FIELD.search(element.search_text)), None)
+            if password_field is None:
+                raise MacroError("No password field found on screen")
+        elif username_field is not None:
+            await ctx.type_text(username_field, username)
+            filled.append(username_field.name or "username")
+        submitted = await self._fill(ctx, elements, password_field, password, submit)
+        filled.append(password_field.name or "password")
+        return {"filled": filled, "submitted": submitted}
+
+    @staticmethod
+    async def _fill(ctx: MacroContext, elements: List[UiElement], field: UiElement, text: str,
+                    submit: bool) -> Optional[str]:
+        """Type into a field and optionally submit the form, returning how it was submitted."""
+        # On mobile the keyboard may cover the submit button, so Enter submits there
+        button = None
+        if submit and ctx.is_web:
+            button = next((element for element in elements if _is_clickable(ctx, element)
+                           and SUBMIT_LABEL.search(element.name.strip())), None)
+        await ctx.type_text(field, text, submit=submit and button is None)
+        if button is not None:
+            await ctx.click(button)
+            return button.name
+        return "Enter" if submit else None
+
+
+def _is_text_field(element: UiElement) -> bool:
+    actionable = element.ref is not None or element.center is not None
+    return actionable and TEXT_FIELD_ROLES.search(element.role) is not None
+
+
+class RecoverStuckScreen(Macro):
+    name = "recover_stuck_screen"
+    description = ("Try to get unstuck on a screen that does not respond: swipes down, swipes up, presses back "
+                   "(Android) and taps outside, stopping as soon as the screen changes.")
+    requires = {"android": ["mobile_list_elements_on_screen"], "ios": ["mobile_list_elements_on_screen"]}
+
+    async def run(self, ctx, **args):
+        before = await self._signature(ctx)
+        tried = []
+        for action in self._actions(ctx):
+            tried.append(action)
+            await self._perform(ctx, action)
+            if await self._signature(ctx) != before:
+                return {"recovered": True, "actions": tried}
+        return {"recovered": False, "actions": tried}
+
+    @staticmethod
+    def _actions(ctx: MacroContext) -> List[str]:
+        actions = []
+        if ctx.find_tool("*swipe*"):
+            actions += ["swipe down", "swipe up"]
+        if ctx.target == "android" and ctx.find_tool("mobile_press_button"):
+            actions.append("press back")
+        if ctx.find_tool("mobile_click_on_screen_at_coordinates") and ctx.find_tool("mobile_get_screen_size"):
+            actions.append("tap outside")
+        return actions
+
+    @staticmethod
+    async def _perform(ctx: MacroContext, action: str) -> None:
+        if action.startswith("swipe "):
+            await ctx.call("*swipe*", direction=action.split()[1])
+        elif action == "press back":
+            await ctx.call("mobile_press_button", button="BACK")
+        else:
+            await ctx.tap(*await _outside_point(ctx))
+
+    @staticmethod
+    async def _signature(ctx: MacroContext) -> List[Tuple[str, str]]:
+        return [(element.role, element.search_text) for element in await ctx.elements()]
+
+
+BUILTIN_MACROS = [DismissConsentBanner, ClosePopup, FillLoginForm, RecoverStuckScreen]
+
+
+class MacroTool(BaseTool):
+    """Offers a macro to the model as a tool that runs against the session's tools."""
+
+    def __init__(self, macro: Macro, tools: Dict[str, BaseTool], target: str):
+        super().__init__(name=macro.name, description=macro.description)
+        self.macro = macro
+        self.tools = tools
+        self.target = target
+
+    def _get_declaration(self):
+        return types.FunctionDeclaration(
+            name=self.name,
+            description=self.description,
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    name: types.Schema(type=types.Type(spec.get("type", "string").upper()),
+                                       description=spec.get("description"))
+                    for name, spec in self.macro.parameters.items()
+                },
+                required=[name for name, spec in self.macro.parameters.items() if spec.get("required")] or None,
+            ),
+        )
+
+    async def run_async(self, *, args, tool_context):
+        ctx = MacroContext(self.tools, self.target, tool_context)
+        try:
+            outcome = await self.macro.run(ctx, **(args or {}))
+            is_error = False
+        except MacroError as e:
+            outcome, is_error = {"error": str(e)}, True
+        if self.macro.report_steps:
+            outcome = dict(outcome, steps=ctx.steps)
+        return {"content": [{"type": "text", "text": json.dumps(outcome, ensure_ascii=False)}], "isError": is_error}
+
+
+_plugins: Dict[str, List[Macro]] = {}
+
+
+def load_plugin_macros(directory: Optional[str]) -> List[Macro]:
+    """Load the macros of the Python files in a plugin directory.
+
+    Files are loaded once per process. A file that fails to load is reported
+    on stderr and skipped.
+
+    Args:
+        directory: The plugin directory, or None for no plugins
+    """
+    if not directory:
+        return []
+    path = Path(directory).expanduser()
+    if str(path) in _plugins:
+        return _plugins[str(path)]
+
+    macros = []
+    for file in sorted(path.glob("*.py")):
+        if file.name.startswith("_"):
+            continue
+        try:
+            spec = importlib.util.spec_from_file_location(f"uitest_macros.{file.stem}", file)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            for macro in getattr(module, "MACROS", []):
+                macro = macro() if isinstance(macro, type) else macro
+                if not isinstance(macro, Macro) or not macro.name:
+                    raise TypeError(f"{macro!r} is not a named Macro")
+                macros.append(macro)
+        except Exception as e:
+            print(f"Warning: Could not load macros from {file}: {e}", file=sys.stderr)
+    _plugins[str(path)] = macros
+    return macros
+
+
+def create_macro_tools(tools: List[BaseTool], target: str, settings: Dict[str, Any]) -> List[MacroTool]:
+    """Create the macro tools that can run against a set of tools.
+
+    Plugin macros replace built-in macros of the same name. Macros whose name
+    is taken by a tool of the server are left out.
+
+    Args:
+        tools: The (wrapped) tools of the MCP server, which the macros call
+        target: The target platform, either "android", "ios", or "web"
+        settings: Macro settings as returned by `get_macro_settings`
+    """
+    target = target.lower()
+    by_name = {tool.name: tool for tool in tools}
+    macros: Dict[str, Macro] = {macro.name: macro() for macro in BUILTIN_MACROS}
+    macros.update((macro.name, macro) for macro in load_plugin_macros(settings.get('plugin_dir')))
+    disabled = set(settings.get('disabled') or [])
+    return [
+        MacroTool(macro, by_name, target) for name, macro in macros.items()
+        if name not in disabled and name not in by_name and macro.is_available(target, list(by_name))
+    ]
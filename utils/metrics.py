@@ -0,0 +1,105 @@
+"""Timing and token accounting for agent conversations."""
+import time
+from typing import Dict, Optional
+
+from utils.events import EventBus, RunSummaryEvent, ToolTimingEvent
+from utils.tool_wrapper import ToolWrapper
+
+
+class RunMetrics:
+    """Splits the wall time of a conversation into model, tool and overhead time.
+
+    The interaction loop is an async generator, so time spent by consumers
+    between two events (e.g. rendering) passes while the runner is suspended.
+    That time is excluded from model and tool segments via `pause`/`resume`
+    and ends up in the overhead instead.
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.model_time = 0.0
+        self.tool_time = 0.0
+        self.llm_turns = 0
+        self.tool_calls = 0
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.turns_by_model: Dict[str, int] = {}
+        self._paused = 0.0
+        self._paused_at = None
+        self._mark = self._active_time()
+
+    def _active_time(self) -> float:
+        return time.monotonic() - self._paused
+
+    def pause(self) -> None:
+        """Stop the clock while a consumer handles an event."""
+        self._paused_at = time.monotonic()
+
+    def resume(self) -> None:
+        """Restart the clock once the consumer asks for the next event."""
+        if self._paused_at is not None:
+            self._paused += time.monotonic() - self._paused_at
+            self._paused_at = None
+
+    def lap(self) -> float:
+        """Return the active time since the previous lap and start a new one."""
+        now = self._active_time()
+        duration, self._mark = now - self._mark, now
+        return duration
+
+    def record_llm_turn(self, duration: float, prompt_tokens=None, completion_tokens=None, model=None) -> None:
+        self.model_time += duration
+        self.llm_turns += 1
+        if model is not None:
+            self.turns_by_model[model] = self.turns_by_model.get(model, 0) + 1
+        if prompt_tokens is not None:
+            self.prompt_tokens = (self.prompt_tokens or 0) + prompt_tokens
+        if completion_tokens is not None:
+            self.completion_tokens = (self.completion_tokens or 0) + completion_tokens
+
+    def record_tool_calls(self, duration: float, count: int) -> None:
+        self.tool_time += duration
+        self.tool_calls += count
+
+    def summary(self) -> RunSummaryEvent:
+        """Create the summary event for the conversation so far."""
+        wall_time = time.monotonic() - self.start
+        return RunSummaryEvent(
+            wall_time=wall_time,
+            model_time=self.model_time,
+            tool_time=self.tool_time,
+            overhead=max(wall_time - self.model_time - self.tool_time, 0.0),
+            llm_turns=self.llm_turns,
+            tool_calls=self.tool_calls,
+            prompt_tokens=self.prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            turns_by_model=dict(self.turns_by_model),
+        )
+
+
+def get_model_name(model) -> str:
+    """Return the model name of a model string or a model object (e.g. LiteLlm)."""
+    return model if isinstance(model, str) else getattr(model, "model", str(model))
+
+
+def get_token_counts(event):
+    """Return (prompt_tokens, completion_tokens) of a runner event, if reported."""
+    usage = getattr(event, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+
+class TimedTool(ToolWrapper):
+    """Measures the latency of every call and reports it as a ToolTimingEvent."""
+
+    def __init__(self, tool, event_bus: EventBus):
+        super().__init__(tool)
+        self.event_bus = event_bus
+
+    async def run_async(self, *, args, tool_context):
+        start = time.monotonic()
+        try:
+            return await self.tool.run_async(args=args, tool_context=tool_context)
+        finally:
+            self.event_bus.emit(ToolTimingEvent(self.name, time.monotonic() - start))
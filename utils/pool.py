@@ -0,0 +1,266 @@
+"""Pool of warm, reusable MCP server connections keyed by target and device."""
+import asyncio
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.tools import get_tools_async
+
+
+def pool_key(target: str, device=None, browser_profile=None) -> str:
+    """The pool key of a target's servers, separate for every pinned device and browser profile."""
+    key = target.lower()
+    if device is not None:
+        key = f"{key}:{device.device_id}"
+    if browser_profile is not None:
+        key = f"{key}@{browser_profile}"
+    return key
+
+
+class PooledServer:
+    """A running MCP server process together with its tools.
+
+    The connection is opened and closed by a dedicated task, because the MCP
+    stdio client must be torn down by the same task that created it. Callers
+    only ever see the tools.
+    """
+
+    def __init__(self, target: str, device=None, browser_profile=None, isolated: bool = False):
+        self.target = target
+        self.device = device
+        # Every server works on its own copy of the browser profile
+        self.browser_profile = browser_profile
+        # Whether a web server keeps its profile in memory instead of sharing the persistent one
+        self.isolated = isolated
+        self.key = pool_key(target, device, browser_profile)
+        self.tools = None
+        self.last_used = time.monotonic()
+        self.leases = 0
+        self._ready = None
+        self._stop = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        """Spawn the MCP server and wait until its tools are loaded."""
+        self._ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run())
+        await asyncio.shield(self._ready)
+
+    async def _run(self):
+        profile_copy = None
+        try:
+            if self.browser_profile is not None:
+                profile_copy = Path(tempfile.mkdtemp(prefix="uitest-profile-")) / "profile"
+                shutil.copytree(self.browser_profile, profile_copy)
+            tools, exit_stack = await get_tools_async(self.target, self.device, profile_copy, self.isolated)
+        except Exception as e:
+            self._remove_profile_copy(profile_copy)
+            self._ready.set_exception(e)
+            return
+        try:
+            self.tools = tools
+            self._ready.set_result(None)
+            await self._stop.wait()
+        finally:
+            await exit_stack.aclose()
+            self._remove_profile_copy(profile_copy)
+
+    @staticmethod
+    def _remove_profile_copy(profile_copy: Optional[Path]):
+        if profile_copy is not None:
+            shutil.rmtree(profile_copy.parent, ignore_errors=True)
+
+    async def is_healthy(self, timeout: float) -> bool:
+        """Check that the server process is alive and answers a ping."""
+        if self._task is None or self._task.done():
+            return False
+        session = getattr(self.tools[0], "mcp_session", None) if self.tools else None
+        if session is None:
+            return True
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def stop(self):
+        """Shut down the MCP server process."""
+        self._stop.set()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class MCPServerPool:
+    """A pool of pre-spawned, health-checked MCP servers keyed by target and device.
+
+    Runs lease a server for their duration and return it afterwards, so the
+    `npx` resolution and Node startup cost is paid once per pooled server
+    instead of once per run. Several web servers cannot share the persistent
+    browser profile, so a pool that can hold more than one runs them isolated.
+
+    Example:
+        async with MCPServerPool(max_size=2) as pool:
+            await pool.prewarm("web", 2)
+            async with pool.lease("web") as server:
+                agent = create_agent(model_name, "web", server.tools)
+    """
+
+    def __init__(self, max_size: int = 4, idle_timeout: float = 300.0, health_check_timeout: float = 10.0):
+        """Initializes the pool.
+
+        Args:
+            max_size: Maximum number of servers per target (and device)
+            idle_timeout: Seconds after which an unused server is shut down
+            health_check_timeout: Seconds to wait for a server to answer a ping
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_timeout = health_check_timeout
+        self._idle: Dict[str, List[PooledServer]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._condition = asyncio.Condition()
+        self._reaper = None
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def size(self, target: str, device=None, browser_profile=None) -> int:
+        """Number of servers (idle and leased) currently running for a target (and device)."""
+        return self._sizes.get(pool_key(target, device, browser_profile), 0)
+
+    async def prewarm(self, target: str, count: int = 1, device=None):
+        """Spawn servers for a target (and device) up front, up to the pool's max size."""
+        key = pool_key(target, device)
+        async with self._condition:
+            count = min(count, self.max_size - self.size(target, device))
+            self._sizes[key] = self.size(target, device) + max(count, 0)
+        if count <= 0:
+            return
+
+        servers = [PooledServer(target.lower(), device, isolated=self.max_size > 1) for _ in range(count)]
+        results = await asyncio.gather(*[server.start() for server in servers], return_exceptions=True)
+        async with self._condition:
+            for server, result in zip(servers, results):
+                if isinstance(result, BaseException):
+                    self._sizes[key] -= 1
+                else:
+                    self._idle.setdefault(key, []).append(server)
+            self._condition.notify_all()
+        self._ensure_reaper()
+
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+    async def acquire(self, target: str, device=None, browser_profile=None) -> PooledServer:
+        """Take a healthy server for the target out of the pool.
+
+        Spawns a new server if none is idle and the pool has room, otherwise
+        waits until a server is released.
+
+        Args:
+            target: The target platform (android, ios, or web)
+            device: Optional Device the server must be pinned to
+            browser_profile: Optional browser profile (e.g. of a checkpoint) a web
+                server starts from. Servers of different profiles are kept apart.
+
+        Raises:
+            RuntimeError: If the pool has been closed.
+        """
+        key = pool_key(target, device, browser_profile)
+        while True:
+            server = None
+            async with self._condition:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("MCP server pool is closed")
+                    if self._idle.get(key):
+                        server = self._idle[key].pop()
+                        break
+                    if self.size(target, device, browser_profile) < self.max_size:
+                        self._sizes[key] = self.size(target, device, browser_profile) + 1
+                        break
+                    await self._condition.wait()
+
+            if server is None:
+                server = PooledServer(target.lower(), device, browser_profile, isolated=self.max_size > 1)
+                try:
+                    await server.start()
+                except BaseException:
+                    await self._discard(server)
+                    raise
+                self._ensure_reaper()
+            elif not await server.is_healthy(self.health_check_timeout):
+                await server.stop()
+                await self._discard(server)
+                continue
+
+            server.leases += 1
+            return server
+
+    async def release(self, server: PooledServer):
+        """Return a leased server to the pool."""
+        server.last_used = time.monotonic()
+        async with self._condition:
+            if not self._closed:
+                self._idle.setdefault(server.key, []).append(server)
+                self._condition.notify_all()
+                return
+        await server.stop()
+        await self._discard(server)
+
+    @asynccontextmanager
+    async def lease(self, target: str, device=None, browser_profile=None):
+        """Lease a server for the duration of the `async with` block."""
+        server = await self.acquire(target, device, browser_profile)
+        try:
+            yield server
+        finally:
+            await self.release(server)
+
+    async def close(self):
+        """Shut down all idle servers. Leased servers are stopped when released."""
+        async with self._condition:
+            self._closed = True
+            idle = [server for servers in self._idle.values() for server in servers]
+            self._idle.clear()
+            self._condition.notify_all()
+        if self._reaper:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+        for server in idle:
+            await server.stop()
+            await self._discard(server)
+
+    async def _discard(self, server: PooledServer):
+        async with self._condition:
+            self._sizes[server.key] = max(self._sizes.get(server.key, 0) - 1, 0)
+            self._condition.notify_all()
+
+    def _ensure_reaper(self):
+        if self._reaper is None and self.idle_timeout:
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def _reap_idle(self):
+        # Periodically shut down servers that have not been leased for a while
+        interval = max(min(self.idle_timeout / 2, 30.0), 0.1)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            expired = []
+            async with self._condition:
+                for servers in self._idle.values():
+                    for server in list(servers):
+                        if now - server.last_used >= self.idle_timeout:
+                            servers.remove(server)
+                            expired.append(server)
+            for server in expired:
+                await server.stop()
+                await self._discard(server)
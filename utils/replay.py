@@ -0,0 +1,210 @@
+"""Record tool-call traces of agent runs and replay them without the model.
+
+A trace holds the ordered tool calls of a run together with a fingerprint of
+each response. Replaying drives the same tools directly from the trace and
+stops at the first step whose response no longer matches the recording, so
+the caller can hand over to the agent from there.
+"""
+import hashlib
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from utils.events import (
+    AgentEvent, BudgetExceededEvent, ConversationEndEvent, ConversationStartEvent, ErrorEvent, EventBus,
+    FinalResponseEvent, ReplayDivergenceEvent, ToolCallEvent, ToolResponseEvent,
+    UserQueryEvent, to_jsonable
+)
+from utils.sinks import EventSink
+from utils.verdicts import run_verdict
+
+TRACE_VERSION = 1
+
+# Element refs and similar volatile identifiers that may change between runs
+# without the screen changing in a meaningful way
+VOLATILE_PATTERNS = [
+    re.compile(r"\[ref=[^\]]*\]"),
+    re.compile(r"\b\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?Z?\b"),
+]
+
+
+def response_fingerprint(response: Any) -> str:
+    """Fingerprint the textual content of a tool response.
+
+    Images (e.g. screenshots) are ignored, as they rarely match byte for byte
+    between runs. Volatile identifiers such as element refs are masked.
+    """
+    data = to_jsonable(response, inline=True)
+    # The ADK wraps non-dict tool results as {"result": ...}
+    if isinstance(data, dict) and set(data) == {"result"}:
+        data = data["result"]
+
+    if isinstance(data, dict) and isinstance(data.get("content"), list):
+        texts = [item.get("text", "") for item in data["content"]
+                 if isinstance(item, dict) and item.get("type") == "text"]
+        canonical = json.dumps({"text": texts, "isError": bool(data.get("isError"))})
+    else:
+        canonical = json.dumps(data, sort_keys=True)
+
+    for pattern in VOLATILE_PATTERNS:
+        canonical = pattern.sub("", canonical)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+class TraceRecorder(EventSink):
+    """Records the tool calls of a run into a trace file when the run ends."""
+
+    name = "trace"
+
+    def __init__(self, path, target: str):
+        self.path = Path(path)
+        self.target = target
+        self.query = None
+        self.final_response = None
+        self.error = None
+        self.aborted = None
+        self.steps: List[Dict[str, Any]] = []
+        self._pending_calls: List[Dict[str, Any]] = []
+
+    def handle(self, event: AgentEvent) -> None:
+        if isinstance(event, UserQueryEvent):
+            self.query = event.query
+        elif isinstance(event, ToolCallEvent):
+            step = {"tool": event.name, "args": to_jsonable(event.args) or {}}
+            self._pending_calls.append(step)
+            self.steps.append(step)
+        elif isinstance(event, ToolResponseEvent):
+            step = next((step for step in self._pending_calls if step["tool"] == event.name), None)
+            if step is not None:
+                self._pending_calls.remove(step)
+                step["fingerprint"] = response_fingerprint(event.response)
+        elif isinstance(event, FinalResponseEvent):
+            self.final_response = event.text
+        elif isinstance(event, ErrorEvent):
+            self.error = event.message
+        elif isinstance(event, BudgetExceededEvent):
+            self.aborted = event.message
+
+    def close(self) -> None:
+        if self.query is None:
+            return
+        # A broken run would replay as a successful one, so only finished runs that did not fail are kept
+        verdict, _ = run_verdict(self.final_response, self.error, self.aborted)
+        if verdict not in ("passed", "unknown") or not self.final_response:
+            reason = f"ended with verdict {verdict}" if verdict != "unknown" else "did not finish"
+            print(f"Trace {self.path} not saved, the run {reason}", file=sys.stderr)
+            return
+        trace = {
+            "version": TRACE_VERSION,
+            "target": self.target,
+            "query": self.query,
+            "steps": [step for step in self.steps if "fingerprint" in step],
+            "final_response": self.final_response,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(trace, f, indent=1)
+
+
+def load_trace(path) -> Dict[str, Any]:
+    """Load a trace file written by TraceRecorder.
+
+    Raises:
+        ValueError: If the file is missing or not a supported trace.
+    """
+    try:
+        with open(path, "r") as f:
+            trace = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not read trace {path}: {e}")
+    if trace.get("version") != TRACE_VERSION or "steps" not in trace:
+        raise ValueError(f"Unsupported trace format in {path}")
+    return trace
+
+
+def fallback_query(trace: Dict[str, Any], steps_performed: int) -> str:
+    """Build the query that hands a diverged replay over to the agent."""
+    return (
+        f"{trace['query']}\n\n"
+        f"Note: An automated replay of this test already performed the first {steps_performed} "
+        f"recorded steps, then the app behaved differently than recorded. The app may "
+        f"already be partway through the test. Continue from the current state."
+    )
+
+
+async def replay_trace(
+    trace: Dict[str, Any],
+    tools,
+    fallback: Optional[Callable[[str], AsyncGenerator[AgentEvent, None]]] = None,
+    event_bus: Optional[EventBus] = None,
+) -> AsyncGenerator[AgentEvent, None]:
+    """Replay a recorded trace directly against the tools.
+
+    Args:
+        trace: The trace as returned by `load_trace`
+        tools: The tools to call, usually prepared the same way as during recording
+        fallback: Optional function that runs the agent for a query and returns
+            its event stream. Called when a step diverges from the recording.
+        event_bus: Optional EventBus of the tool wrappers
+
+    Yields:
+        AgentEvent objects; a ReplayDivergenceEvent marks the hand-over to the agent.
+    """
+    tools_by_name = {tool.name: tool for tool in tools}
+    seq = 0
+
+    def numbered(event):
+        nonlocal seq
+        seq += 1
+        event.seq = seq
+        return event
+
+    def drain():
+        return [numbered(event) for event in (event_bus.drain() if event_bus else [])]
+
+    yield numbered(ConversationStartEvent())
+    yield numbered(UserQueryEvent(trace["query"]))
+
+    divergence = None
+    steps_performed = 0
+    for index, step in enumerate(trace["steps"]):
+        tool = tools_by_name.get(step["tool"])
+        if tool is None:
+            divergence = ReplayDivergenceEvent(index, step["tool"], "tool is not available")
+            break
+
+        yield numbered(ToolCallEvent(step["tool"], step["args"]))
+        steps_performed += 1
+        try:
+            response = await tool.run_async(args=step["args"], tool_context=None)
+        except Exception as e:
+            for event in drain():
+                yield event
+            divergence = ReplayDivergenceEvent(index, step["tool"], f"tool call failed: {e}")
+            break
+
+        for event in drain():
+            yield event
+        yield numbered(ToolResponseEvent(step["tool"], response))
+        if response_fingerprint(response) != step["fingerprint"]:
+            divergence = ReplayDivergenceEvent(index, step["tool"], "response differs from the recording")
+            break
+
+    if divergence is None:
+        yield numbered(FinalResponseEvent(trace.get("final_response") or "Replay completed."))
+        yield numbered(ConversationEndEvent())
+        return
+
+    yield numbered(divergence)
+    if fallback is None:
+        yield numbered(ErrorEvent(f"Replay diverged at step {divergence.step + 1} ({divergence.name})"))
+        yield numbered(ConversationEndEvent())
+        return
+
+    # The agent's conversation continues the stream with its own events
+    async for event in fallback(fallback_query(trace, steps_performed)):
+        if isinstance(event, ConversationStartEvent):
+            continue
+        yield numbered(event)
@@ -0,0 +1,356 @@
+"""Historical results store with flaky-test and slow-step analytics.
+
+Every run (a single query or a test case of a suite) is written to a local
+SQLite database: its verdict, timings, model, target and device, the
+latency of every tool call and optionally its full event stream. All runs of
+one invocation of the agent share a batch ID, so suites can be compared
+against each other.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.events import (
+    AgentEvent, BudgetExceededEvent, ConversationStartEvent, ErrorEvent, FinalResponseEvent, RunSummaryEvent,
+    ToolTimingEvent
+)
+from utils.sinks import EventSink
+from utils.verdicts import run_verdict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    batch TEXT NOT NULL,
+    test_id TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    verdict TEXT NOT NULL,
+    model TEXT,
+    target TEXT,
+    device TEXT,
+    error TEXT,
+    llm_turns INTEGER,
+    tool_calls INTEGER,
+    model_time REAL,
+    tool_time REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_test_id ON runs (test_id, started);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS runs_verdict ON runs (verdict);
+CREATE INDEX IF NOT EXISTS runs_batch ON runs (batch);
+CREATE TABLE IF NOT EXISTS tool_timings (
+    run_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tool_timings_run_id ON tool_timings (run_id);
+CREATE INDEX IF NOT EXISTS tool_timings_name ON tool_timings (name);
+CREATE TABLE IF NOT EXISTS events (
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event_type TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_run_id ON events (run_id, seq);
+"""
+
+
+def new_batch_id() -> str:
+    """A batch ID that sorts by creation time."""
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+
+def query_test_id(query: str) -> str:
+    """A stable test ID for a single query that was not given one."""
+    return "query-" + hashlib.sha1(query.strip().encode()).hexdigest()[:10]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """The percentile of a list of values, interpolating between the closest ranks."""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class ResultsStore:
+    """A SQLite store of past runs."""
+
+    def __init__(self, path, store_events: bool = True):
+        """Initializes the store.
+
+        Args:
+            path: Path of the SQLite database file
+            store_events: Whether to keep the full event stream of every run
+        """
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.store_events = store_events
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def record_run(self, run: Dict[str, Any], tool_timings: List[tuple], events: List[Dict[str, Any]]):
+        """Write a run with its tool timings and events in one transaction."""
+        with self._lock, self._db:
+            columns = ", ".join(run)
+            self._db.execute(f"INSERT INTO runs ({columns}) VALUES ({', '.join('?' * len(run))})",
+                             tuple(run.values()))
+            self._db.executemany("INSERT INTO tool_timings (run_id, name, duration) VALUES (?, ?, ?)",
+                                 [(run["run_id"], name, duration) for name, duration in tool_timings])
+            if self.store_events:
+                self._db.executemany(
+                    "INSERT INTO events (run_id, seq, event_type, data) VALUES (?, ?, ?, ?)",
+                    [(run["run_id"], index, event["event_type"], json.dumps(event, ensure_ascii=False))
+                     for index, event in enumerate(events, start=1)],
+                )
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self._lock:
+            self._db.row_factory = sqlite3.Row
+            try:
+                return self._db.execute(sql, params).fetchall()
+            finally:
+                self._db.row_factory = None
+
+    @staticmethod
+    def _group(rows) -> Dict[str, List[float]]:
+        durations: Dict[str, List[float]] = {}
+        for row in rows:
+            durations.setdefault(row["key"], []).append(row["duration"])
+        return durations
+
+    def slowest_tests(self, limit: int = 20, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Tests ordered by their total time, the share of the suite budget they use."""
+        durations = self._group(self._query(
+            "SELECT test_id AS key, duration FROM runs WHERE started >= ?", (since or 0,)
+        ))
+        rows = [{
+            "test_id": test_id,
+            "runs": len(values),
+            "total": sum(values),
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "max": max(values),
+        } for test_id, values in durations.items()]
+        return sorted(rows, key=lambda row: row["total"], reverse=True)[:limit]
+
+    def slowest_tools(self, limit: int = 20, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Tools ordered by the total time spent in them."""
+        durations = self._group(self._query(
+            "SELECT t.name AS key, t.duration FROM tool_timings t JOIN runs r ON r.run_id = t.run_id "
+            "WHERE r.started >= ?", (since or 0,)
+        ))
+        rows = [{
+            "tool": name,
+            "calls": len(values),
+            "total": sum(values),
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+        } for name, values in durations.items()]
+        return sorted(rows, key=lambda row: row["total"], reverse=True)[:limit]
+
+    def durations_over_time(self, test_id: Optional[str] = None, since: Optional[float] = None,
+                            bucket: str = "day") -> List[Dict[str, Any]]:
+        """p50 and p95 run durations per day or week, for one test or all of them."""
+        period = "%Y-%m-%d" if bucket == "day" else "%Y-W%W"
+        durations = self._group(self._query(
+            "SELECT strftime(?, started, 'unixepoch', 'localtime') AS key, duration FROM runs "
+            "WHERE started >= ? AND (? IS NULL OR test_id = ?) ORDER BY started",
+            (period, since or 0, test_id, test_id),
+        ))
+        return [{
+            "period": key,
+            "runs": len(values),
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+        } for key, values in durations.items()]
+
+    def flaky_tests(self, window: int = 20, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Tests that both passed and failed among their latest runs.
+
+        The flakiness rate is the share of consecutive runs whose verdicts
+        differ, so a test that failed once after many passes scores lower
+        than one that alternates.
+        """
+        rows = self._query(
+            "SELECT test_id, verdict FROM runs WHERE started >= ? AND verdict IN ('passed', 'failed') "
+            "ORDER BY started",
+            (since or 0,),
+        )
+        verdicts: Dict[str, List[str]] = {}
+        for row in rows:
+            verdicts.setdefault(row["test_id"], []).append(row["verdict"])
+
+        flaky = []
+        for test_id, values in verdicts.items():
+            values = values[-window:]
+            if len(set(values)) < 2:
+                continue
+            flips = sum(1 for before, after in zip(values, values[1:]) if before != after)
+            flaky.append({
+                "test_id": test_id,
+                "runs": len(values),
+                "passed": values.count("passed"),
+                "failed": values.count("failed"),
+                "flakiness": flips / (len(values) - 1),
+                "last": values[-1],
+            })
+        return sorted(flaky, key=lambda row: row["flakiness"], reverse=True)
+
+    def batches(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """The latest batches with their pass counts."""
+        rows = self._query(
+            "SELECT batch, MIN(started) AS started, COUNT(*) AS runs, "
+            "SUM(verdict = 'passed') AS passed, SUM(duration) AS total FROM runs "
+            "GROUP BY batch ORDER BY started DESC LIMIT ?",
+            (limit,),
+        )
+        return [dict(row) for row in rows]
+
+    def regressions(self, baseline: Optional[str] = None, batch: Optional[str] = None,
+                    tolerance: float = 0.2) -> Dict[str, Any]:
+        """Compare a batch against a baseline batch.
+
+        A test regressed if it passed in the baseline and does not pass now,
+        or if its median duration grew by more than `tolerance` (a fraction).
+
+        Args:
+            baseline: The baseline batch (default: the batch before `batch`)
+            batch: The batch to check (default: the latest batch)
+            tolerance: Allowed growth of the median duration
+
+        Raises:
+            ValueError: If there are not enough batches to compare.
+        """
+        batches = [row["batch"] for row in self.batches(limit=1000)]
+        batch = batch or (batches[0] if batches else None)
+        if batch not in batches:
+            raise ValueError(f"Unknown batch: {batch}" if batch else "No runs recorded yet")
+        if baseline is None:
+            older = batches[batches.index(batch) + 1:]
+            if not older:
+                raise ValueError(f"No batch before {batch} to compare against")
+            baseline = older[0]
+        elif baseline not in batches:
+            raise ValueError(f"Unknown baseline batch: {baseline}")
+
+        before, after = self._batch_runs(baseline), self._batch_runs(batch)
+        regressions = []
+        for test_id, runs in after.items():
+            if test_id not in before:
+                continue
+            old, new = before[test_id], runs
+            old_p50, new_p50 = percentile(old["durations"], 0.5), percentile(new["durations"], 0.5)
+            reasons = []
+            if "passed" in old["verdicts"] and "passed" not in new["verdicts"]:
+                reasons.append(f"now {new['verdicts'][-1]}")
+            if old_p50 and (new_p50 - old_p50) / old_p50 > tolerance:
+                reasons.append(f"median duration {(new_p50 - old_p50) / old_p50:+.0%}")
+            if reasons:
+                regressions.append({
+                    "test_id": test_id,
+                    "baseline_p50": old_p50,
+                    "p50": new_p50,
+                    "baseline_verdict": old["verdicts"][-1],
+                    "verdict": new["verdicts"][-1],
+                    "reason": ", ".join(reasons),
+                })
+        return {"baseline": baseline, "batch": batch, "regressions": regressions}
+
+    def _batch_runs(self, batch: str) -> Dict[str, Dict[str, list]]:
+        runs: Dict[str, Dict[str, list]] = {}
+        for row in self._query("SELECT test_id, verdict, duration FROM runs WHERE batch = ? ORDER BY started",
+                               (batch,)):
+            entry = runs.setdefault(row["test_id"], {"verdicts": [], "durations": []})
+            entry["verdicts"].append(row["verdict"])
+            entry["durations"].append(row["duration"])
+        return runs
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResultsRecorder(EventSink):
+    """Collects the events of a single run and writes the run to the store when closed."""
+
+    name = "results"
+
+    def __init__(self, store: ResultsStore, test_id: str, target: str, model: str, batch: str,
+                 device: Optional[str] = None):
+        """Initializes the recorder.
+
+        Args:
+            store: The store to write to
+            test_id: ID of the test case, or of the query for single runs
+            target: The target platform
+            model: The model the run uses
+            batch: ID shared by all runs of one invocation
+            device: Optional ID of the device the run is pinned to
+        """
+        self.store = store
+        self.test_id = test_id
+        self.target = target
+        self.model = model
+        self.batch = batch
+        self.device = device
+        self.started = time.time()
+        self._events: List[Dict[str, Any]] = []
+        self._tool_timings: List[tuple] = []
+        self._summary: Optional[RunSummaryEvent] = None
+        self._final_response = ""
+        self._error = None
+        self._aborted = None
+        self._closed = False
+
+    def handle(self, event: AgentEvent) -> None:
+        if isinstance(event, ConversationStartEvent) and not self._events:
+            self.started = event.timestamp
+        elif isinstance(event, ToolTimingEvent):
+            self._tool_timings.append((event.name, event.duration))
+        elif isinstance(event, RunSummaryEvent):
+            self._summary = event
+        elif isinstance(event, FinalResponseEvent):
+            self._final_response = event.text
+        elif isinstance(event, ErrorEvent):
+            self._error = event.message
+        elif isinstance(event, BudgetExceededEvent):
+            self._aborted = event.message
+        if self.store.store_events:
+            self._events.append(event.to_dict(inline=True))
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        verdict, error = run_verdict(self._final_response, self._error, self._aborted)
+        summary = self._summary
+        self.store.record_run({
+            "run_id": uuid.uuid4().hex,
+            "batch": self.batch,
+            "test_id": self.test_id,
+            "started": self.started,
+            "duration": summary.wall_time if summary else time.time() - self.started,
+            "verdict": verdict,
+            "model": self.model,
+            "target": self.target,
+            "device": self.device,
+            "error": error,
+            "llm_turns": summary.llm_turns if summary else 0,
+            "tool_calls": summary.tool_calls if summary else len(self._tool_timings),
+            "model_time": summary.model_time if summary else None,
+            "tool_time": summary.tool_time if summary else None,
+            "prompt_tokens": summary.prompt_tokens if summary else None,
+            "completion_tokens": summary.completion_tokens if summary else None,
+        }, self._tool_timings, self._events)
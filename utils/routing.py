@@ -0,0 +1,168 @@
+"""Routing of model turns between a fast, cheap model and a strong one.
+
+Most turns of a UI test are mechanical (select the device, list elements,
+tap the obvious button) and are handled by the fast model. The strong model
+takes over when a tool call failed, when the fast model failed or produced an
+invalid or empty response, and to verify the final verdict.
+"""
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.models.registry import LLMRegistry
+
+from utils.events import EventBus, ModelRouteEvent, to_jsonable
+from utils.llm_cache import litellm_prefix_cache_args
+
+
+def create_model(model_name: str, use_litellm: bool = False, prompt_cache_settings=None) -> BaseLlm:
+    """Create the ADK model object for a model name."""
+    if use_litellm:
+        # Importing LiteLLM takes seconds, so it is only imported when a model needs it
+        from google.adk.models.lite_llm import LiteLlm
+        return LiteLlm(model=model_name, **litellm_prefix_cache_args(model_name, prompt_cache_settings or {}))
+    return LLMRegistry.new_llm(model_name)
+
+
+def _has_tool_error(llm_request: LlmRequest) -> bool:
+    """Whether the latest tool responses in the request report an error."""
+    if not llm_request.contents:
+        return False
+    for part in llm_request.contents[-1].parts or []:
+        if part.function_response is None:
+            continue
+        response = to_jsonable(part.function_response.response)
+        if isinstance(response, dict) and set(response) == {"result"}:
+            response = response["result"]
+        if isinstance(response, dict) and (response.get("isError") or response.get("error")):
+            return True
+    return False
+
+
+def _response_problem(llm_request: LlmRequest, response: LlmResponse) -> Optional[str]:
+    """Why a response of the fast model cannot be used as is, if at all."""
+    if response.error_code:
+        return f"fast model error: {response.error_code}"
+    parts = response.content.parts if response.content and response.content.parts else []
+    calls = [part.function_call for part in parts if part.function_call]
+    if not calls and not any(part.text for part in parts):
+        return "empty response"
+    unknown = [call.name for call in calls if llm_request.tools_dict and call.name not in llm_request.tools_dict]
+    if unknown:
+        return f"call to unknown tool {unknown[0]}"
+    if not calls:
+        return "final verification"
+    return None
+
+
+class CascadeLlm(BaseLlm):
+    """A model that routes each turn to a fast model and escalates to a strong one.
+
+    Every turn is reported as a ModelRouteEvent on the event bus, and the
+    name of the model that handled the latest turn is kept in
+    `last_model_name`. This state belongs to a single run, so agents that are
+    reused between runs must be `reset` before each one, and agents that run
+    at the same time each need a `fork` of their own.
+    """
+
+    fast: BaseLlm
+    strong: BaseLlm
+    escalate_on_tool_error: bool = True
+    escalate_on_invalid_response: bool = True
+    verify_final: bool = True
+    # Turns the strong model keeps handling after an escalation
+    sticky_turns: int = 1
+    event_bus: Optional[Any] = None
+    last_model_name: Optional[str] = None
+    strong_turns_left: int = 0
+
+    def reset(self) -> None:
+        """Forget the escalation and the latest model of the previous run."""
+        self.strong_turns_left = 0
+        self.last_model_name = None
+
+    def fork(self) -> "CascadeLlm":
+        """A cascade with the same models and settings but a state of its own."""
+        return self.model_copy(update={"strong_turns_left": 0, "last_model_name": None})
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        reason = None
+        if self.strong_turns_left > 0:
+            self.strong_turns_left -= 1
+            reason = "following an escalation"
+        elif self.escalate_on_tool_error and _has_tool_error(llm_request):
+            reason = "tool call failed"
+
+        if reason is None:
+            try:
+                responses = [response async for response in self._generate(self.fast, llm_request, stream)]
+            except Exception as e:
+                # e.g. the fast model's provider is down or rejects the request
+                responses, problem = [], f"fast model error: {e}"
+            else:
+                problem = self._check(llm_request, responses)
+            if problem is None:
+                self._route(self.fast, "routine step")
+                for response in responses:
+                    yield response
+                return
+            reason = problem
+
+        if reason not in ("following an escalation", "final verification"):
+            self.strong_turns_left = self.sticky_turns
+        self._route(self.strong, reason)
+        async for response in self._generate(self.strong, llm_request, stream):
+            yield response
+
+    def _check(self, llm_request: LlmRequest, responses) -> Optional[str]:
+        complete = [response for response in responses if not response.partial]
+        if not complete:
+            return "empty response" if self.escalate_on_invalid_response else None
+        problem = _response_problem(llm_request, complete[-1])
+        if problem == "final verification":
+            return problem if self.verify_final else None
+        return problem if self.escalate_on_invalid_response else None
+
+    async def _generate(self, model: BaseLlm, llm_request: LlmRequest, stream: bool):
+        # Models may modify the request (e.g. append content), so each one gets its own copy.
+        # The tools themselves are shared, they are not part of what the model changes.
+        request = llm_request.model_copy(update={
+            "model": model.model,
+            "contents": list(llm_request.contents),
+            "config": llm_request.config.model_copy(deep=True) if llm_request.config else None,
+        })
+        async for response in model.generate_content_async(request, stream):
+            yield response
+
+    def _route(self, model: BaseLlm, reason: str):
+        self.last_model_name = model.model
+        if self.event_bus is not None:
+            self.event_bus.emit(ModelRouteEvent(model.model, reason, escalated=model is self.strong))
+
+
+def create_cascade(model_name: str, use_litellm: bool, settings: Dict[str, Any],
+                   event_bus: Optional[EventBus] = None, prompt_cache_settings=None) -> CascadeLlm:
+    """Create a cascade from the routing settings.
+
+    Args:
+        model_name: The strong model, unless the settings name one
+        use_litellm: Whether the strong model is called through LiteLLM
+        settings: Routing settings as returned by `get_routing_settings`
+        event_bus: Optional bus for ModelRouteEvents
+        prompt_cache_settings: Optional prompt cache settings for models called through LiteLLM
+    """
+    strong_name = settings['strong_model'] or model_name
+    strong_litellm = use_litellm if settings['strong_model_litellm'] is None else settings['strong_model_litellm']
+    fast = create_model(settings['fast_model'], settings['fast_model_litellm'], prompt_cache_settings)
+    strong = create_model(strong_name, strong_litellm, prompt_cache_settings)
+    return CascadeLlm(
+        model=f"{fast.model}→{strong.model}",
+        fast=fast,
+        strong=strong,
+        escalate_on_tool_error=settings['escalate_on_tool_error'],
+        escalate_on_invalid_response=settings['escalate_on_invalid_response'],
+        verify_final=settings['verify_final'],
+        sticky_turns=settings['sticky_turns'],
+        event_bus=event_bus,
+    )
@@ -0,0 +1,344 @@
+"""Persistent, resumable agent sessions with named checkpoints.
+
+The SQLite session service keeps every session on disk, so a run that dies
+mid-test can be resumed from its last completed step instead of starting
+over. A passing run can also be saved as a named checkpoint (e.g.
+"logged-in"): later runs start from a copy of its conversation, and for web
+tests from a copy of its browser profile, so the setup steps are not
+repeated by the model for every test.
+"""
+import json
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListEventsResponse, ListSessionsResponse
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    target TEXT,
+    query TEXT,
+    status TEXT,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE INDEX IF NOT EXISTS sessions_status ON sessions (status, updated);
+CREATE TABLE IF NOT EXISTS events (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id, session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    target TEXT,
+    query TEXT,
+    state TEXT NOT NULL,
+    events TEXT NOT NULL,
+    browser_profile TEXT,
+    created REAL NOT NULL
+);
+"""
+
+# Run status of a session: a run that is still "running" when no process works on it was interrupted
+RUNNING = "running"
+COMPLETED = "completed"
+
+RESUME_MESSAGE = (
+    "The previous run of this test was interrupted. The steps above have already been performed. "
+    "The app may have been restarted since, so inspect the screen first, then continue the test "
+    "from where it stopped and report the result as instructed."
+)
+
+CHECKPOINT_MESSAGE = (
+    "The steps above were performed in an earlier run and the app is still in the resulting state. "
+    "Do not repeat them, inspect the screen first if needed. Now perform this test:\n\n"
+)
+
+
+def _dump_event(event: Event) -> str:
+    return event.model_dump_json(exclude_none=True)
+
+
+def _load_event(data: str) -> Event:
+    return Event.model_validate_json(data)
+
+
+def last_complete_step(events: List[Event]) -> int:
+    """The number of leading events up to the last step whose tool calls all have responses.
+
+    A run interrupted after the model requested tool calls but before their
+    responses arrived leaves calls that no model would accept without
+    responses, so they are dropped before the run is resumed.
+    """
+    pending = set()
+    complete = 0
+    for index, event in enumerate(events, start=1):
+        for call in event.get_function_calls():
+            pending.add(call.id or call.name)
+        for response in event.get_function_responses():
+            pending.discard(response.id or response.name)
+        if not pending:
+            complete = index
+    return complete
+
+
+class SqliteSessionService(BaseSessionService):
+    """An ADK session service that keeps sessions, their runs and checkpoints in SQLite.
+
+    Session state is stored per session; `app:` and `user:` state is not
+    shared between sessions.
+    """
+
+    def __init__(self, path, checkpoint_dir=None):
+        """Initializes the service.
+
+        Args:
+            path: Path of the SQLite database file
+            checkpoint_dir: Directory for the browser profiles of checkpoints
+                (default: a `checkpoints` directory next to the database)
+        """
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_dir = Path(checkpoint_dir).expanduser() if checkpoint_dir else self.path.parent / "checkpoints"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def create_session(self, *, app_name: str, user_id: str, state: Optional[Dict[str, Any]] = None,
+                       session_id: Optional[str] = None) -> Session:
+        session = Session(app_name=app_name, user_id=user_id, id=session_id or str(uuid.uuid4()),
+                          state=dict(state or {}), last_update_time=time.time())
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO sessions (app_name, user_id, id, state, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (app_name, user_id, session.id, json.dumps(session.state), session.last_update_time,
+                 session.last_update_time),
+            )
+        return session
+
+    def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                    config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state, updated FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                (app_name, user_id, session_id),
+            ).fetchone()
+            if row is None:
+                return None
+            events = [_load_event(data) for (data,) in self._db.execute(
+                "SELECT data FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq",
+                (app_name, user_id, session_id),
+            )]
+        if config is not None:
+            if config.after_timestamp:
+                events = [event for event in events if event.timestamp > config.after_timestamp]
+            if config.num_recent_events:
+                events = events[-config.num_recent_events:]
+        return Session(app_name=app_name, user_id=user_id, id=session_id, state=json.loads(row[0]),
+                       events=events, last_update_time=row[1])
+
+    def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, updated FROM sessions WHERE app_name = ? AND user_id = ? ORDER BY updated",
+                (app_name, user_id),
+            ).fetchall()
+        return ListSessionsResponse(sessions=[
+            Session(app_name=app_name, user_id=user_id, id=session_id, last_update_time=updated)
+            for session_id, updated in rows
+        ])
+
+    def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                             (app_name, user_id, session_id))
+            self._db.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                             (app_name, user_id, session_id))
+
+    def list_events(self, *, app_name: str, user_id: str, session_id: str) -> ListEventsResponse:
+        session = self.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        return ListEventsResponse(events=session.events if session else [])
+
+    def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        super().append_event(session, event)
+        session.last_update_time = event.timestamp
+        # Every event is committed on its own, so a crash loses at most the step in progress
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO events (app_name, user_id, session_id, seq, data) VALUES (?, ?, ?, "
+                "(SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?), ?)",
+                (session.app_name, session.user_id, session.id,
+                 session.app_name, session.user_id, session.id, _dump_event(event)),
+            )
+            self._db.execute(
+                "UPDATE sessions SET state = ?, updated = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                (json.dumps(session.state, default=str), time.time(), session.app_name, session.user_id, session.id),
+            )
+        return event
+
+    def set_run(self, session: Session, status: str, target: Optional[str] = None, query: Optional[str] = None):
+        """Record the status of the session's run, and the target and query it was started with."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE sessions SET status = ?, target = COALESCE(?, target), query = COALESCE(?, query), "
+                "updated = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                (status, target, query, time.time(), session.app_name, session.user_id, session.id),
+            )
+
+    def get_run(self, app_name: str, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        """The target, query and status of a session's run, or None if the session does not exist."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT target, query, status FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                (app_name, user_id, session_id),
+            ).fetchone()
+        return dict(zip(("target", "query", "status"), row)) if row else None
+
+    def last_interrupted(self, app_name: str, user_id: str, target: Optional[str] = None) -> Optional[str]:
+        """The ID of the most recently updated session whose run did not complete."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM sessions WHERE app_name = ? AND user_id = ? AND status = ? "
+                "AND (? IS NULL OR target = ?) ORDER BY updated DESC LIMIT 1",
+                (app_name, user_id, RUNNING, target, target),
+            ).fetchone()
+        return row[0] if row else None
+
+    def truncate_to_last_step(self, session: Session) -> int:
+        """Drop the events after the last completed step of an interrupted run.
+
+        Returns:
+            The number of dropped events.
+        """
+        complete = last_complete_step(session.events)
+        dropped = len(session.events) - complete
+        if dropped:
+            with self._lock, self._db:
+                self._db.execute(
+                    "DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND seq > ?",
+                    (session.app_name, session.user_id, session.id, complete),
+                )
+            del session.events[complete:]
+        return dropped
+
+    def save_checkpoint(self, name: str, session: Session, target: Optional[str] = None,
+                        query: Optional[str] = None, browser_profile: Optional[Path] = None):
+        """Save the conversation and state of a session (and a browser profile) under a name.
+
+        An existing checkpoint of the same name is replaced.
+
+        Args:
+            name: The checkpoint name, e.g. "logged-in"
+            session: The session to save, as returned by `get_session`
+            target: The target platform of the session
+            query: The query the session was started with
+            browser_profile: Optional browser profile directory, moved into the checkpoint directory
+        """
+        profile = None
+        if browser_profile is not None:
+            profile = self.checkpoint_dir / name
+            shutil.rmtree(profile, ignore_errors=True)
+            profile.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(browser_profile), str(profile))
+        events = [json.loads(_dump_event(event)) for event in session.events[:last_complete_step(session.events)]]
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (name, target, query, state, events, browser_profile, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, target, query, json.dumps(session.state, default=str), json.dumps(events),
+                 str(profile) if profile else None, time.time()),
+            )
+
+    def get_checkpoint(self, name: str) -> Optional[Dict[str, Any]]:
+        """A checkpoint with its target, query, state, events and browser profile, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT name, target, query, state, events, browser_profile, created FROM checkpoints WHERE name = ?",
+                (name,),
+            ).fetchone()
+        if row is None:
+            return None
+        checkpoint = dict(zip(("name", "target", "query", "state", "events", "browser_profile", "created"), row))
+        checkpoint["state"] = json.loads(checkpoint["state"])
+        # Validated from JSON, so that binary data such as screenshots is decoded from base64
+        checkpoint["events"] = [_load_event(json.dumps(event)) for event in json.loads(checkpoint["events"])]
+        return checkpoint
+
+    def list_checkpoints(self) -> List[Dict[str, Any]]:
+        """All checkpoints, newest first, without their events."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, target, query, browser_profile, created, json_array_length(events) "
+                "FROM checkpoints ORDER BY created DESC"
+            ).fetchall()
+        return [dict(zip(("name", "target", "query", "browser_profile", "created", "events"), row)) for row in rows]
+
+    def delete_checkpoint(self, name: str) -> bool:
+        """Delete a checkpoint and its browser profile. Returns whether it existed."""
+        checkpoint = self.get_checkpoint(name)
+        if checkpoint is None:
+            return False
+        if checkpoint["browser_profile"]:
+            shutil.rmtree(checkpoint["browser_profile"], ignore_errors=True)
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM checkpoints WHERE name = ?", (name,))
+        return True
+
+    def fork_checkpoint(self, name: str, app_name: str, user_id: str, session_id: Optional[str] = None) -> Session:
+        """Create a new session that starts with the conversation and state of a checkpoint.
+
+        Raises:
+            ValueError: If there is no checkpoint of that name.
+        """
+        checkpoint = self.get_checkpoint(name)
+        if checkpoint is None:
+            raise ValueError(f"Unknown checkpoint: {name}")
+        session = self.create_session(app_name=app_name, user_id=user_id, state=checkpoint["state"],
+                                      session_id=session_id)
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO events (app_name, user_id, session_id, seq, data) VALUES (?, ?, ?, ?, ?)",
+                [(app_name, user_id, session.id, index, _dump_event(event))
+                 for index, event in enumerate(checkpoint["events"], start=1)],
+            )
+        session.events = list(checkpoint["events"])
+        return session
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def copy_browser_profile(checkpoint: Optional[Dict[str, Any]]) -> Optional[Path]:
+    """Copy the browser profile of a checkpoint into a temporary directory.
+
+    Runs work on a copy, so the checkpoint itself stays unchanged. The caller
+    removes the copy when the run is over.
+    """
+    if not checkpoint or not checkpoint.get("browser_profile") or not Path(checkpoint["browser_profile"]).exists():
+        return None
+    copy = Path(tempfile.mkdtemp(prefix="uitest-profile-")) / "profile"
+    shutil.copytree(checkpoint["browser_profile"], copy)
+    return copy
+
+
+def new_browser_profile() -> Path:
+    """A fresh temporary browser profile directory, e.g. for a run that will be saved as a checkpoint."""
+    return Path(tempfile.mkdtemp(prefix="uitest-profile-")) / "profile"
@@ -0,0 +1,328 @@
+"""Pluggable sinks that consume the agent event stream.
+
+The interaction loop never waits for a sink to render or write an event.
+`dispatch_events` puts every event into a bounded queue per sink, and each
+sink handles its queue in a worker thread of its own. What happens when a
+sink falls so far behind that its queue is full is the sink's overflow
+policy (see OVERFLOW_POLICIES).
+"""
+import asyncio
+import json
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncGenerator, Dict, List, Optional, TextIO
+
+from utils.events import AgentEvent, EventsSkippedEvent
+
+OUTPUT_FORMATS = ("rich", "jsonl")
+
+# block: the interaction loop waits until the sink's queue has room again
+# drop: events that arrive while the queue is full are skipped
+# coalesce: the pending events are replaced by a single EventsSkippedEvent, so the
+#   sink catches up with the run instead of showing stale events
+OVERFLOW_POLICIES = ("block", "drop", "coalesce")
+
+DEFAULT_QUEUE_SIZE = 256
+
+# Events no overflow policy skips, a full queue blocks instead
+ESSENTIAL_EVENT_TYPES = {
+    "conversation_start", "user_query", "final_response", "error", "budget_exceeded",
+    "replay_divergence", "run_summary", "test_result", "conversation_end",
+}
+
+
+class EventSink:
+    """Base class for consumers of agent events.
+
+    `handle` and `close` are called from a worker thread of the sink, never
+    from two threads at once.
+    """
+
+    # Name of the sink in the `output.overflow` settings
+    name = "sink"
+    # Overflow policy of the sink unless the settings choose another one
+    overflow = "block"
+
+    def handle(self, event: AgentEvent) -> None:
+        """Consume a single event."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Flush and release any resources held by the sink."""
+
+
+class RichSink(EventSink):
+    """Renders events to the terminal using Rich panels."""
+
+    name = "terminal"
+    overflow = "coalesce"
+
+    def __init__(self):
+        # Imported lazily so headless runs never load or initialize Rich
+        from utils.display import print_agent_event
+        self._print_agent_event = print_agent_event
+
+    def handle(self, event: AgentEvent) -> None:
+        self._print_agent_event(event)
+
+
+class JsonlSink(EventSink):
+    """Writes one JSON object per event (NDJSON) to a file or stream."""
+
+    name = "jsonl"
+
+    def __init__(self, path: Optional[str] = None, stream: Optional[TextIO] = None):
+        """Initializes the sink.
+
+        Args:
+            path: File to write to. The file is truncated.
+            stream: Stream to write to if no path is given (default: stdout)
+        """
+        self._owns_stream = path is not None
+        self._stream = open(path, "w") if path is not None else (stream or sys.stdout)
+
+    def handle(self, event: AgentEvent) -> None:
+        self._stream.write(json.dumps(event.to_dict(inline=True), ensure_ascii=False) + "\n")
+        self._stream.flush()
+
+    def close(self) -> None:
+        if self._owns_stream:
+            self._stream.close()
+
+
+def create_sinks(output: str = "rich", output_file: Optional[str] = None) -> List[EventSink]:
+    """Create the sinks for an output mode.
+
+    Args:
+        output: Either "rich" for terminal rendering or "jsonl" for NDJSON
+        output_file: Optional file for the JSONL output (default: stdout). In
+            "rich" mode the events are additionally written to this file.
+
+    Raises:
+        ValueError: If the output mode is unknown.
+    """
+    if output == "rich":
+        sinks = [RichSink()]
+        if output_file:
+            sinks.append(JsonlSink(path=output_file))
+        return sinks
+    if output == "jsonl":
+        return [JsonlSink(path=output_file)]
+    raise ValueError(f"Unsupported output format: {output}. Must be one of {', '.join(OUTPUT_FORMATS)}.")
+
+
+class SinkQueue:
+    """Bounded queue of the events for one sink, drained by the sink's worker thread."""
+
+    def __init__(self, sink: EventSink, maxsize: int = DEFAULT_QUEUE_SIZE, overflow: str = "block"):
+        """Initializes the queue.
+
+        Args:
+            sink: The sink that handles the events
+            maxsize: Number of pending events at which the overflow policy applies
+            overflow: One of OVERFLOW_POLICIES
+
+        Raises:
+            ValueError: If the overflow policy is unknown.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported overflow policy for the {sink.name} sink: {overflow}. "
+                             f"Must be one of {', '.join(OVERFLOW_POLICIES)}.")
+        self.sink = sink
+        self.maxsize = max(maxsize, 1)
+        self.overflow = overflow
+        self.skipped = 0
+        self.error: Optional[BaseException] = None
+        self._events: deque = deque()
+        self._condition = asyncio.Condition()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sink-{sink.name}")
+
+    async def put(self, event: AgentEvent) -> None:
+        """Queue an event, applying the overflow policy if the queue is full."""
+        async with self._condition:
+            while len(self._events) >= self.maxsize and self.error is None:
+                if event.event_type not in ESSENTIAL_EVENT_TYPES and self.overflow == "drop":
+                    self._skip(event)
+                    return
+                if self.overflow == "coalesce" and self._coalesce():
+                    break
+                await self._condition.wait()
+            if self.error is None:
+                self._events.append(event)
+                self._condition.notify_all()
+
+    def _skip(self, event: AgentEvent) -> None:
+        # Consecutive skipped events share one notice at the end of the queue
+        self.skipped += 1
+        if not self._events or not isinstance(self._events[-1], EventsSkippedEvent):
+            notice = EventsSkippedEvent()
+            notice.seq = event.seq
+            self._events.append(notice)
+        self._events[-1].add(event)
+
+    def _coalesce(self) -> bool:
+        """Replace the pending events that may be skipped by one notice, return whether that made room."""
+        kept = deque()
+        notice = None
+        for pending in self._events:
+            if pending.event_type in ESSENTIAL_EVENT_TYPES:
+                kept.append(pending)
+                continue
+            if notice is None:
+                notice = EventsSkippedEvent()
+                notice.seq = pending.seq
+                kept.append(notice)
+            notice.add(pending)
+            if not isinstance(pending, EventsSkippedEvent):
+                self.skipped += 1
+        if len(kept) >= len(self._events):
+            return False
+        self._events = kept
+        return True
+
+    async def drain(self) -> None:
+        """Hand the queued events to the sink until the queue is closed, then close the sink."""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                async with self._condition:
+                    while not self._events and not self._closed:
+                        await self._condition.wait()
+                    if not self._events:
+                        break
+                    batch = list(self._events)
+                    self._events.clear()
+                    self._condition.notify_all()
+                await loop.run_in_executor(self._executor, self._handle, batch)
+        except Exception as e:
+            self.error = e
+            async with self._condition:
+                self._events.clear()
+                self._condition.notify_all()
+        try:
+            await loop.run_in_executor(self._executor, self.sink.close)
+        except Exception as e:
+            self.error = self.error or e
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def _handle(self, events: List[AgentEvent]) -> None:
+        for event in events:
+            self.sink.handle(event)
+
+    async def close(self) -> None:
+        """Let the worker finish the queued events and stop."""
+        async with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class EventDispatcher:
+    """Fans events out to sinks without waiting for them to handle the events.
+
+    Every sink gets a SinkQueue and a worker of its own, so a slow sink only
+    delays itself, and the producer only ever waits for sinks with the
+    "block" overflow policy whose queue is full.
+    """
+
+    def __init__(self, sinks: List[EventSink], queue_size: int = DEFAULT_QUEUE_SIZE,
+                 overflow: Optional[Dict[str, str]] = None):
+        """Initializes the dispatcher.
+
+        Args:
+            sinks: The sinks to hand every event to
+            queue_size: Maximum number of pending events per sink
+            overflow: Optional overflow policy per sink name, overriding the
+                sinks' own policies
+
+        Raises:
+            ValueError: If an overflow policy is unknown.
+        """
+        overflow = overflow or {}
+        self.queues = [SinkQueue(sink, queue_size, overflow.get(sink.name, sink.overflow)) for sink in sinks]
+        self._tasks = [asyncio.ensure_future(queue.drain()) for queue in self.queues]
+
+    async def publish(self, event: AgentEvent) -> None:
+        """Queue an event for every sink.
+
+        Raises:
+            Exception: The first exception a sink raised while handling an event.
+        """
+        for queue in self.queues:
+            if queue.error is not None:
+                raise queue.error
+            await queue.put(event)
+
+    async def close(self) -> None:
+        """Wait for all sinks to handle their queued events, then close them.
+
+        Raises:
+            Exception: The first exception a sink raised while handling an event.
+        """
+        for queue in self.queues:
+            await queue.close()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        skipped = [f"{queue.sink.name}: {queue.skipped}" for queue in self.queues if queue.skipped]
+        if skipped:
+            sys.stderr.write(f"Skipped events of sinks that fell behind ({', '.join(skipped)})\n")
+        for queue in self.queues:
+            if queue.error is not None:
+                raise queue.error
+
+
+async def dispatch_events(event_generator: AsyncGenerator[AgentEvent, None], sinks: List[EventSink],
+                          settings: Optional[Dict[str, Any]] = None) -> None:
+    """Consume an event stream and hand every event to each sink.
+
+    Args:
+        event_generator: The events to dispatch
+        sinks: The sinks to hand every event to. They are closed at the end.
+        settings: Optional output settings as returned by `get_output_settings`
+    """
+    settings = settings or {}
+    dispatcher = EventDispatcher(sinks, settings.get('queue_size', DEFAULT_QUEUE_SIZE), settings.get('overflow'))
+    try:
+        async for event in event_generator:
+            await dispatcher.publish(event)
+    finally:
+        await dispatcher.close()
+
+
+class EventFeed:
+    """Dispatches events that synchronous callbacks produce, e.g. the results of a suite.
+
+    Events are dispatched to the sinks by `dispatch_events` in a task of the
+    feed, so `put` never waits for a sink.
+    """
+
+    def __init__(self, sinks: List[EventSink], settings: Optional[Dict[str, Any]] = None):
+        """Initializes the feed.
+
+        Args:
+            sinks: The sinks to hand every event to. They are closed by `close`.
+            settings: Optional output settings as returned by `get_output_settings`
+        """
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(dispatch_events(self._stream(), sinks, settings))
+
+    def put(self, event: AgentEvent) -> None:
+        """Queue an event for the sinks."""
+        self._events.put_nowait(event)
+
+    async def _stream(self) -> AsyncGenerator[AgentEvent, None]:
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            yield event
+
+    async def close(self) -> None:
+        """Wait for the sinks to handle the queued events, then close them.
+
+        Raises:
+            Exception: The first exception a sink raised while handling an event.
+        """
+        self._events.put_nowait(None)
+        await self._task
@@ -0,0 +1,111 @@
+"""Profiling of the command line startup path.
+
+With `--profile-startup`, main.py installs an import hook before anything
+else is imported. When the process exits, the time spent in each startup
+phase (parsing arguments, loading the configuration, creating the agent)
+and the slowest module imports are printed to stderr.
+
+The module only uses the standard library, so importing it costs nothing.
+"""
+import atexit
+import builtins
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Number of imports listed in the report
+TOP_IMPORTS = 25
+
+
+class StartupProfiler:
+    """Times module imports and named startup phases."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Module name -> (cumulative time, self time) of its first import
+        self.imports: Dict[str, Tuple[float, float]] = {}
+        self.phases: List[Tuple[str, float]] = []
+        # Total time of the outermost imports, which includes all nested ones
+        self.import_time = 0.0
+        # Time spent in nested imports, one entry per import in progress
+        self._nested: List[float] = []
+        self._import = builtins.__import__
+
+    def install(self):
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if builtins.__import__ is self._timed_import:
+            builtins.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module_name = name
+        if level and globals:
+            package = (globals.get("__package__") or "").rsplit(".", level - 1)[0]
+            module_name = f"{package}.{name}" if name else package
+        if module_name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            else:
+                self.import_time += elapsed
+            self.imports.setdefault(module_name, (elapsed, elapsed - nested))
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def format_report(self, limit: int = TOP_IMPORTS) -> str:
+        """Describe the phases and the slowest imports as plain text."""
+        total = time.perf_counter() - self.started
+        lines = [f"Startup profile: {total:.3f}s since the profiler was installed, "
+                 f"{self.import_time:.3f}s in {len(self.imports)} module imports"]
+        if self.phases:
+            lines.append("Phases:")
+            lines.extend(f"  {seconds:8.3f}s  {name}" for name, seconds in self.phases)
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        if slowest:
+            lines.append("Slowest imports (cumulative, self):")
+            lines.extend(f"  {cumulative:8.3f}s  {own:8.3f}s  {name}" for name, (cumulative, own) in slowest)
+        return "\n".join(lines)
+
+
+_profiler: Optional[StartupProfiler] = None
+
+
+def start_profiling() -> StartupProfiler:
+    """Start timing imports and phases, and print the report when the process exits."""
+    global _profiler
+    if _profiler is None:
+        _profiler = StartupProfiler()
+        _profiler.install()
+        atexit.register(_report)
+    return _profiler
+
+
+def _report():
+    _profiler.uninstall()
+    sys.stderr.write(_profiler.format_report() + "\n")
+
+
+@contextmanager
+def startup_phase(name: str):
+    """Time a phase of the startup, if startup profiling is enabled."""
+    if _profiler is None:
+        yield
+        return
+    with _profiler.phase(name):
+        yield
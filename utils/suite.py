@@ -0,0 +1,331 @@
+"""Batch runner for executing a suite of test cases concurrently."""
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import yaml
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+from utils.agent import create_agent
+from utils.budget import RunBudget
+from utils.devices import DeviceScheduler, pin_query
+from utils.events import BudgetExceededEvent, ErrorEvent, EventBus, FinalResponseEvent, ToolCallEvent
+from utils.interactions import process_agent_interaction
+from utils.pool import MCPServerPool
+from utils.sessions import CHECKPOINT_MESSAGE, COMPLETED, RUNNING, SqliteSessionService
+from utils.sinks import EventDispatcher, EventSink
+from utils.verdicts import run_verdict, verdict_query
+
+APP_NAME = "ui-test-agent"
+USER_ID = "user"
+
+# File types picked up when a directory is given as the suite
+TEST_FILE_SUFFIXES = (".txt", ".md")
+MANIFEST_SUFFIXES = (".yaml", ".yml")
+
+SUPPORTED_TARGETS = ("android", "ios", "web")
+
+
+@dataclass
+class TestCase:
+    """A single natural-language test case."""
+    test_id: str
+    query: str
+    target: Optional[str] = None
+    # Name of the checkpoint the test case starts from, e.g. "logged-in"
+    checkpoint: Optional[str] = None
+    # Tool profile of the test case, e.g. "read-only" or "auto"
+    tool_profile: Optional[str] = None
+
+
+@dataclass
+class TestResult:
+    """The outcome of running a single test case."""
+    test_id: str
+    target: str
+    verdict: str
+    duration: float
+    final_response: str = ""
+    error: Optional[str] = None
+    tool_calls: int = 0
+    device: Optional[str] = None
+    # Whether the verdict was taken from the verdict cache instead of running the test case
+    cached: bool = False
+
+    @property
+    def passed(self) -> bool:
+        return self.verdict == "passed"
+
+
+def load_test_cases(path) -> List[TestCase]:
+    """Load test cases from a directory, a manifest, or a single test file.
+
+    A directory is scanned recursively for .txt and .md files, each holding one
+    query. A YAML manifest contains a `tests` list whose entries have an `id`,
+    a `target` (optional), a `checkpoint` to start from (optional), a
+    `tool_profile` (optional) and either an inline `query` or a `file`
+    relative to the manifest.
+
+    Args:
+        path: Path to a directory, a YAML manifest, or a single test file
+
+    Raises:
+        ValueError: If the path does not exist or contains no test cases, if two
+            test cases share an ID or if a test case has an unsupported target.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise ValueError(f"Test suite path not found: {path}")
+
+    if path.is_dir():
+        cases = [
+            TestCase(test_id=file.relative_to(path).with_suffix("").as_posix(),
+                     query=file.read_text().strip())
+            for file in sorted(path.rglob("*"))
+            if file.is_file() and file.suffix in TEST_FILE_SUFFIXES
+        ]
+    elif path.suffix in MANIFEST_SUFFIXES:
+        cases = _load_manifest(path)
+    else:
+        cases = [TestCase(test_id=path.stem, query=path.read_text().strip())]
+
+    cases = [case for case in cases if case.query]
+    if not cases:
+        raise ValueError(f"No test cases found in {path}")
+    # Results, cached verdicts and distributed leases are all keyed by test ID
+    seen = set()
+    for case in cases:
+        if case.test_id in seen:
+            raise ValueError(f"Duplicate test ID in {path}: {case.test_id}")
+        seen.add(case.test_id)
+    return cases
+
+
+def _load_manifest(path: Path) -> List[TestCase]:
+    with open(path, 'r') as f:
+        manifest = yaml.safe_load(f) or {}
+
+    cases = []
+    for index, entry in enumerate(manifest.get("tests", [])):
+        if isinstance(entry, str):
+            entry = {"query": entry}
+        query = entry.get("query")
+        if query is None and entry.get("file"):
+            query = (path.parent / entry["file"]).read_text()
+        test_id = entry.get("id") or (Path(entry["file"]).stem if entry.get("file") else f"test-{index + 1}")
+        target = entry.get("target")
+        if target is not None and str(target).lower() not in SUPPORTED_TARGETS:
+            raise ValueError(f"Unsupported target of test case {test_id} in {path}: {target}. "
+                             f"Must be one of {', '.join(SUPPORTED_TARGETS)}.")
+        cases.append(TestCase(test_id=str(test_id), query=(query or "").strip(), target=target,
+                              checkpoint=entry.get("checkpoint"), tool_profile=entry.get("tool_profile")))
+    return cases
+
+
+async def run_test_case(root_agent, case: TestCase, target: str, event_bus: Optional[EventBus] = None,
+                        device=None, budget: Optional[RunBudget] = None,
+                        dispatcher: Optional[EventDispatcher] = None, session_service=None) -> TestResult:
+    """Run a single test case against an already connected agent.
+
+    Every test case gets its own session so that conversations never leak
+    between test cases sharing the same agent and tool connection. A test
+    case with a checkpoint starts with a copy of the checkpoint's conversation.
+
+    Args:
+        root_agent: The agent to run the test case with
+        case: The test case to run
+        target: The target platform the agent is connected to
+        event_bus: Optional EventBus the agent's tool wrappers emit events to
+        device: Optional Device the agent's MCP server is pinned to
+        budget: Optional RunBudget; a test case exceeding it is aborted
+        dispatcher: Optional EventDispatcher publishing every event of the test case to its sinks,
+            e.g. the results store
+        session_service: Optional SqliteSessionService keeping the session on disk; required
+            for test cases that start from a checkpoint
+
+    Raises:
+        ValueError: If the test case's checkpoint does not exist.
+    """
+    session_id = str(uuid.uuid4())
+    query = pin_query(case.query, device)
+    if case.checkpoint:
+        if session_service is None:
+            raise ValueError(f"Test case {case.test_id} starts from a checkpoint, but sessions are not enabled")
+        session = session_service.fork_checkpoint(case.checkpoint, APP_NAME, USER_ID, session_id)
+        query = CHECKPOINT_MESSAGE + query
+    else:
+        session_service = session_service or InMemorySessionService()
+        session = session_service.create_session(
+            state={}, app_name=APP_NAME, user_id=USER_ID, session_id=session_id
+        )
+    if isinstance(session_service, SqliteSessionService):
+        session_service.set_run(session, RUNNING, target, case.query)
+    runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
+
+    start = time.monotonic()
+    final_response = ""
+    error = None
+    aborted = None
+    tool_calls = 0
+    query = verdict_query(query)
+    async for event in process_agent_interaction(runner, query, USER_ID, session_id, event_bus, budget):
+        if dispatcher is not None:
+            await dispatcher.publish(event)
+        if isinstance(event, ToolCallEvent):
+            tool_calls += 1
+        elif isinstance(event, FinalResponseEvent):
+            final_response = event.text
+        elif isinstance(event, ErrorEvent):
+            error = event.message
+        elif isinstance(event, BudgetExceededEvent):
+            aborted = event.message
+
+    if final_response and isinstance(session_service, SqliteSessionService):
+        session_service.set_run(session, COMPLETED)
+    verdict, error = run_verdict(final_response, error, aborted)
+    return TestResult(
+        test_id=case.test_id,
+        target=target,
+        verdict=verdict,
+        duration=time.monotonic() - start,
+        final_response=final_response,
+        error=error,
+        tool_calls=tool_calls,
+        device=device.device_id if device else None,
+    )
+
+
+async def execute_test_case(case: TestCase, pool: MCPServerPool, model_name, default_target, use_litellm=False,
+                            scheduler: Optional[DeviceScheduler] = None, budget: Optional[RunBudget] = None,
+                            recorder: Optional[EventSink] = None, session_service=None) -> TestResult:
+    """Run a test case on a leased MCP server, pinned to a device of the scheduler if there is one.
+
+    Errors are reported as a result with the verdict "error" rather than
+    raised. The recorder handles the events in a worker thread of its own,
+    like the output sinks, and is closed once the test case is done.
+
+    Args:
+        case: The test case to run
+        pool: MCP server pool to lease the server from
+        model_name: The name of the model to use
+        default_target: Target platform if the test case does not specify one
+        use_litellm: Whether to use LiteLLM wrapper for the model
+        scheduler: Optional DeviceScheduler to acquire the device from
+        budget: Optional RunBudget; a test case exceeding it is aborted
+        recorder: Optional EventSink receiving every event of the test case
+        session_service: Optional SqliteSessionService for persistent sessions and checkpoints
+    """
+    target = (case.target or default_target).lower()
+    start = time.monotonic()
+    device = None
+    result = None
+    dispatcher = EventDispatcher([recorder]) if recorder is not None else None
+    try:
+        if scheduler is not None:
+            device = await scheduler.acquire(target)
+            if recorder is not None:
+                recorder.device = device.device_id
+        async with pool.lease(target, device, _browser_profile(case, target, session_service)) as server:
+            event_bus = EventBus()
+            root_agent = create_agent(model_name, target, server.tools, use_litellm, show_info=False,
+                                      event_bus=event_bus, tool_profile=case.tool_profile, query=case.query)
+            result = await run_test_case(root_agent, case, target, event_bus, device, budget, dispatcher,
+                                         session_service)
+    except Exception as e:
+        if dispatcher is not None:
+            await dispatcher.publish(ErrorEvent(str(e)))
+        result = TestResult(
+            test_id=case.test_id, target=target, verdict="error",
+            duration=time.monotonic() - start, error=str(e),
+            device=device.device_id if device else None,
+        )
+    finally:
+        if device is not None:
+            # Errors (as opposed to failed tests) count against the device's health
+            await scheduler.release(device, ok=result is not None and result.verdict != "error")
+        if dispatcher is not None:
+            await dispatcher.close()
+    return result
+
+
+async def _worker(queue, results, pool, model_name, default_target, use_litellm, on_result, scheduler, budget,
+                  recorder_factory, session_service):
+    while True:
+        try:
+            case = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+
+        target = (case.target or default_target).lower()
+        recorder = recorder_factory(case.test_id, target) if recorder_factory else None
+        result = await execute_test_case(case, pool, model_name, default_target, use_litellm, scheduler, budget,
+                                         recorder, session_service)
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+
+def _browser_profile(case: TestCase, target: str, session_service) -> Optional[str]:
+    # Web test cases start from the browser profile of their checkpoint, if it has one
+    if not case.checkpoint or target != "web" or session_service is None:
+        return None
+    checkpoint = session_service.get_checkpoint(case.checkpoint)
+    return checkpoint["browser_profile"] if checkpoint else None
+
+
+async def run_suite(cases: List[TestCase], model_name, default_target, use_litellm=False,
+                    concurrency=1, on_result=None, pool: Optional[MCPServerPool] = None,
+                    scheduler: Optional[DeviceScheduler] = None,
+                    budget: Optional[RunBudget] = None, recorder_factory=None,
+                    session_service=None) -> List[TestResult]:
+    """Run test cases through a bounded pool of concurrent workers.
+
+    Each worker leases an MCP server per test case. Servers are reused between
+    test cases, so the server startup cost is paid once per worker rather than
+    once per test case. With a device scheduler, every test case is pinned to
+    a device of its own and the servers are kept per device.
+
+    Args:
+        cases: The test cases to run
+        model_name: The name of the model to use
+        default_target: Target platform for test cases that do not specify one
+        use_litellm: Whether to use LiteLLM wrapper for the model
+        concurrency: Maximum number of test cases running at the same time
+        on_result: Optional callback invoked with each TestResult as it completes
+        pool: Optional MCP server pool to lease servers from. If not provided,
+            a pool sized to the concurrency is created for this run.
+        scheduler: Optional DeviceScheduler to shard the test cases across devices
+        budget: Optional RunBudget applied to every test case
+        recorder_factory: Optional callable taking a test ID and a target and returning
+            an EventSink for the events of that test case, e.g. a ResultsRecorder
+        session_service: Optional SqliteSessionService for persistent sessions and checkpoints
+
+    Returns:
+        The test results in the order of the given test cases.
+    """
+    queue = asyncio.Queue()
+    for case in cases:
+        queue.put_nowait(case)
+
+    results = []
+    worker_count = max(1, min(concurrency, len(cases)))
+    owns_pool = pool is None
+    if owns_pool:
+        pool = MCPServerPool(max_size=worker_count)
+
+    try:
+        await asyncio.gather(*[
+            _worker(queue, results, pool, model_name, default_target, use_litellm, on_result, scheduler, budget,
+                    recorder_factory, session_service)
+            for _ in range(worker_count)
+        ])
+    finally:
+        if owns_pool:
+            await pool.close()
+
+    order = {case.test_id: index for index, case in enumerate(cases)}
+    return sorted(results, key=lambda result: order.get(result.test_id, len(order)))
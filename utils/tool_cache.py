@@ -0,0 +1,137 @@
+"""Result cache for idempotent inspection tools."""
+import json
+import time
+from typing import Any, Dict, Optional
+
+from utils.events import EventBus, ToolCacheEvent, is_error_result
+from utils.tool_wrapper import ToolWrapper
+
+# Read-only inspection tools whose results are cached, with their TTL in seconds
+DEFAULT_CACHEABLE_TOOLS = {
+    # mobile-mcp
+    "mobile_list_available_devices": 60,
+    "mobile_list_apps": 60,
+    "mobile_get_screen_size": 300,
+    "mobile_get_orientation": 60,
+    "mobile_list_elements_on_screen": 5,
+    "mobile_take_screenshot": 5,
+    # Playwright MCP
+    "browser_snapshot": 5,
+    "browser_take_screenshot": 5,
+    "browser_tab_list": 5,
+}
+
+# Read-only tools that are not cached but do not invalidate the cache either.
+# Any tool not listed here or in the cacheable tools is treated as mutating.
+DEFAULT_READ_ONLY_TOOLS = {
+    "browser_console_messages",
+    "browser_network_requests",
+}
+
+
+def canonicalize_args(args: Optional[Dict[str, Any]]) -> str:
+    """Turn tool arguments into a stable string usable as a cache key."""
+    return json.dumps(args or {}, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class ToolResultCache:
+    """Memoizes read-only tool results until a mutating tool is called."""
+
+    def __init__(self, cacheable_tools=None, read_only_tools=None, event_bus: Optional[EventBus] = None):
+        """Initializes the cache.
+
+        Args:
+            cacheable_tools: Dict mapping tool names to TTLs in seconds. A TTL
+                of 0 disables caching for that tool.
+            read_only_tools: Names of tools that never invalidate the cache
+            event_bus: Optional bus that receives a ToolCacheEvent per lookup
+        """
+        self.cacheable_tools = dict(DEFAULT_CACHEABLE_TOOLS if cacheable_tools is None else cacheable_tools)
+        self.read_only_tools = set(DEFAULT_READ_ONLY_TOOLS if read_only_tools is None else read_only_tools)
+        self.event_bus = event_bus
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def is_cacheable(self, name: str) -> bool:
+        return self.cacheable_tools.get(name, 0) > 0
+
+    def is_read_only(self, name: str) -> bool:
+        return name in self.cacheable_tools or name in self.read_only_tools
+
+    def get(self, name: str, args) -> Any:
+        """Return the cached result for the call, or None on a miss."""
+        key = (name, canonicalize_args(args))
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self._emit(name, hit=True)
+            return entry[1]
+
+        self._entries.pop(key, None)
+        self.misses += 1
+        self._emit(name, hit=False)
+        return None
+
+    def put(self, name: str, args, result: Any) -> None:
+        if is_error_result(result):
+            return
+        expires_at = time.monotonic() + self.cacheable_tools[name]
+        self._entries[(name, canonicalize_args(args))] = (expires_at, result)
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+
+    def reset(self) -> None:
+        """Forget the cached results and the hit and miss counts."""
+        self.invalidate()
+        self.hits = 0
+        self.misses = 0
+
+    def _emit(self, name: str, hit: bool) -> None:
+        if self.event_bus is not None:
+            self.event_bus.emit(ToolCacheEvent(name, hit, self.hits, self.misses))
+
+
+class CachingTool(ToolWrapper):
+    """Serves read-only tool calls from the cache and invalidates it on mutations."""
+
+    def __init__(self, tool, cache: ToolResultCache):
+        super().__init__(tool)
+        self.cache = cache
+
+    async def run_async(self, *, args, tool_context):
+        if not self.cache.is_cacheable(self.name):
+            if not self.cache.is_read_only(self.name):
+                # The screen may change, so nothing cached so far can be trusted.
+                # Invalidate again afterwards in case a read raced with this call.
+                self.cache.invalidate()
+                try:
+                    return await self.tool.run_async(args=args, tool_context=tool_context)
+                finally:
+                    self.cache.invalidate()
+            return await self.tool.run_async(args=args, tool_context=tool_context)
+
+        result = self.cache.get(self.name, args)
+        if result is None:
+            result = await self.tool.run_async(args=args, tool_context=tool_context)
+            self.cache.put(self.name, args, result)
+        return result
+
+
+def wrap_with_cache(tools, settings, event_bus: Optional[EventBus] = None):
+    """Wrap tools with a shared result cache configured from settings.
+
+    Args:
+        tools: The tools from the MCP server
+        settings: Tool cache settings as returned by `get_tool_cache_settings`
+        event_bus: Optional bus for cache hit/miss events
+    """
+    configured_tools = settings.get("tools") or {}
+    if isinstance(configured_tools, list):
+        configured_tools = {name: settings.get("default_ttl", 5) for name in configured_tools}
+    cacheable_tools = dict(DEFAULT_CACHEABLE_TOOLS)
+    cacheable_tools.update(configured_tools)
+    read_only_tools = DEFAULT_READ_ONLY_TOOLS | set(settings.get("read_only") or [])
+    cache = ToolResultCache(cacheable_tools, read_only_tools, event_bus)
+    return [CachingTool(tool, cache) for tool in tools]
@@ -0,0 +1,120 @@
+"""Pruning of the MCP tool set an agent is given.
+
+Every LLM turn carries the declarations of all tools of the agent, and the
+Playwright and mobile-mcp servers offer dozens of tools most tests never
+use. Tools can be pruned in three ways, which combine:
+
+- static `allow` and `deny` lists per target,
+- a named profile for a test (e.g. "read-only" for pure verification),
+- the "auto" profile, which picks the tools from the text of the test.
+
+Tool names are matched as shell-style patterns, e.g. "browser_tab_*".
+"""
+import re
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.tool_cache import DEFAULT_CACHEABLE_TOOLS, DEFAULT_READ_ONLY_TOOLS
+from utils.tools import SELECT_DEVICE_TOOL
+
+# Profile that selects the tools from the text of the test
+AUTO_PROFILE = "auto"
+
+# Tools every profile keeps, so the agent can still pick a device
+ALWAYS_KEPT_TOOLS = [SELECT_DEVICE_TOOL, "mobile_list_available_devices"]
+
+READ_ONLY_TOOLS = sorted(DEFAULT_CACHEABLE_TOOLS) + sorted(DEFAULT_READ_ONLY_TOOLS) + ["browser_wait*"]
+
+NAVIGATION_TOOLS = READ_ONLY_TOOLS + [
+    # Playwright MCP
+    "browser_navigate*", "browser_click", "browser_hover", "browser_press_key", "browser_tab_*",
+    # mobile-mcp
+    "mobile_launch_app", "mobile_open_url", "mobile_click_on_screen_at_coordinates", "*swipe*",
+    "mobile_press_button",
+]
+
+FORM_TOOLS = NAVIGATION_TOOLS + [
+    "browser_type", "browser_select_option", "browser_file_upload", "browser_handle_dialog",
+    "mobile_type_keys",
+]
+
+BUILTIN_PROFILES = {
+    "read-only": READ_ONLY_TOOLS,
+    "navigation": NAVIGATION_TOOLS,
+    "forms": FORM_TOOLS,
+}
+
+# Tools the auto profile adds to the navigation tools when the test mentions them
+AUTO_TOOL_GROUPS = [
+    (r"\b(type|typing|enter|fill|input|search|write|password|e-?mail|form|log ?in|sign ?in|sign ?up)",
+     ["browser_type", "browser_select_option", "mobile_type_keys"]),
+    (r"\b(select|choose|dropdown|drop-down|option)", ["browser_select_option"]),
+    (r"\b(upload|attach)", ["browser_file_upload"]),
+    (r"\b(dialog|alert|confirm|prompt|popup|pop-up)", ["browser_handle_dialog"]),
+    (r"\b(drag|drop)", ["browser_drag", "*drag*"]),
+    (r"\b(long[ -]?press|hold)", ["*long_press*"]),
+    (r"\b(double[ -]?(tap|click))", ["*double_tap*", "browser_click"]),
+    (r"\b(rotate|orientation|landscape|portrait)", ["*orientation*"]),
+    (r"\b(install|uninstall)", ["mobile_install_app", "mobile_uninstall_app"]),
+    (r"\b(close|quit|terminate|kill|restart)", ["mobile_terminate_app", "browser_close", "browser_tab_close"]),
+    (r"\b(resize|viewport|window size|screen size)", ["browser_resize"]),
+    (r"\b(pdf)", ["browser_pdf_save"]),
+    (r"\b(screenshot|save .*screen)", ["*screenshot*"]),
+]
+
+
+def get_profile_tools(profile: str, settings: Dict[str, Any], query: Optional[str] = None) -> List[str]:
+    """The tool name patterns of a profile.
+
+    Args:
+        profile: Name of a profile from the settings, a built-in profile, or "auto"
+        settings: Tool filter settings as returned by `get_tool_filter_settings`
+        query: The text of the test, which the auto profile picks the tools from
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if profile == AUTO_PROFILE:
+        patterns = list(NAVIGATION_TOOLS)
+        for keywords, tools in AUTO_TOOL_GROUPS:
+            if re.search(keywords, query or "", re.IGNORECASE):
+                patterns.extend(tools)
+        return patterns
+    profiles = dict(BUILTIN_PROFILES, **(settings.get('profiles') or {}))
+    if profile not in profiles:
+        raise ValueError(f"Unknown tool profile: {profile}. Must be one of "
+                         f"{', '.join(sorted(profiles) + [AUTO_PROFILE])}.")
+    return list(profiles[profile])
+
+
+def _matches(name: str, patterns: Iterable[str]) -> bool:
+    return any(fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def filter_tools(tools: List[Any], settings: Dict[str, Any], profile: Optional[str] = None,
+                 query: Optional[str] = None) -> List[Any]:
+    """Prune the tools of an agent.
+
+    Args:
+        tools: The tools from the MCP server
+        settings: Tool filter settings for the target as returned by `get_tool_filter_settings`
+        profile: Optional profile of the test, overriding the configured default profile
+        query: The text of the test, used by the auto profile
+
+    Returns:
+        The tools allowed by the static lists and the profile, in their original order.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    allow = settings.get('allow') or []
+    deny = settings.get('deny') or []
+    profile = profile or settings.get('profile')
+    profile_tools = get_profile_tools(profile, settings, query) + ALWAYS_KEPT_TOOLS if profile else None
+
+    return [
+        tool for tool in tools
+        if (not allow or _matches(tool.name, allow))
+        and not _matches(tool.name, deny)
+        and (profile_tools is None or _matches(tool.name, profile_tools))
+    ]
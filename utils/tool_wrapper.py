@@ -0,0 +1,21 @@
+"""Base class for tools that wrap MCP tools to add behavior around them."""
+from google.adk.tools.base_tool import BaseTool
+
+
+class ToolWrapper(BaseTool):
+    """A tool that delegates to another tool.
+
+    Subclasses override `run_async` to add behavior around the wrapped tool
+    while keeping its name and function declaration, so the model sees the
+    same tool surface.
+    """
+
+    def __init__(self, tool: BaseTool):
+        super().__init__(name=tool.name, description=tool.description, is_long_running=tool.is_long_running)
+        self.tool = tool
+
+    def _get_declaration(self):
+        return self.tool._get_declaration()
+
+    async def run_async(self, *, args, tool_context):
+        return await self.tool.run_async(args=args, tool_context=tool_context)
@@ -1,12 +1,25 @@
 import asyncio
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters
-from utils.config import load_config
+from utils.config import (load_config, get_tool_cache_settings, get_compaction_settings, get_ui_diff_settings,
+                          get_macro_settings, get_wait_settings)
+from utils.compaction import wrap_with_compaction
+from utils.macros import create_macro_tools
+from utils.metrics import TimedTool
+from utils.tool_cache import CachingTool, wrap_with_cache
+from utils.tool_wrapper import ToolWrapper
+from utils.ui_diff import DiffingTool, wrap_with_diffing
+from utils.wait_for import create_wait_tools
 
-async def get_mobile_tools_async(platform=None):
+# mobile-mcp tool that selects the device all other tools act on
+SELECT_DEVICE_TOOL = 'mobile_use_device'
+
+async def get_mobile_tools_async(platform=None, device=None):
     """Gets tools from the mobile MCP server.
     
     Args:
         platform: Optional specific mobile platform (android or ios)
+        device: Optional Device to pin the server to. It is selected before the
+            tools are handed out, so the agent never has to pick a device.
     """
     config = load_config()
     
@@ -19,16 +32,54 @@ async def get_mobile_tools_async(platform=None):
         command = 'node'
         args = [config.get('mobile_mcp_path')]
     
+    # Or run an arbitrary command, e.g. a stub server
+    if config.get('mobile_mcp_command'):
+        command, *args = config.get('mobile_mcp_command')
+    
     tools, exit_stack = await MCPToolset.from_server(
         connection_params=StdioServerParameters(
             command=command,
             args=args,
         )
     )
+    
+    if device is not None:
+        if platform and device.target != platform:
+            await exit_stack.aclose()
+            raise ValueError(f"Device {device.device_id} belongs to target {device.target}, not {platform}")
+        try:
+            await select_device(tools, device)
+        except BaseException:
+            await exit_stack.aclose()
+            raise
+        # A pinned server must stay on its device, so the agent cannot switch away
+        tools = [tool for tool in tools if tool.name != SELECT_DEVICE_TOOL]
     return tools, exit_stack
 
-async def get_web_tools_async():
-    """Gets tools from the web (Playwright) MCP server."""
+async def select_device(tools, device):
+    """Select the device on a freshly started mobile MCP server.
+    
+    Raises:
+        RuntimeError: If the server reports an error selecting the device.
+    """
+    select_tool = next((tool for tool in tools if tool.name == SELECT_DEVICE_TOOL), None)
+    if select_tool is None:
+        return
+    result = await select_tool.run_async(
+        args={'device': device.device_id, 'deviceType': device.device_type}, tool_context=None
+    )
+    if getattr(result, 'isError', False):
+        raise RuntimeError(f"Could not select device {device.device_id}")
+
+async def get_web_tools_async(isolated=False, browser_profile=None):
+    """Gets tools from the web (Playwright) MCP server.
+    
+    Args:
+        isolated: Keep the browser profile in memory, so that several servers
+            can run side by side without sharing state
+        browser_profile: Optional browser profile directory, e.g. the copy of a
+            checkpoint's profile, so the browser keeps its cookies and storage
+    """
     config = load_config()
     
     # Use Playwright MCP for web testing
@@ -40,6 +91,15 @@ async def get_web_tools_async():
         command = 'node'
         args = [config.get('web_mcp_path')]
     
+    # Or run an arbitrary command, e.g. a stub server
+    if config.get('web_mcp_command'):
+        command, *args = config.get('web_mcp_command')
+    
+    if browser_profile is not None:
+        args.extend(['--user-data-dir', str(browser_profile)])
+    elif isolated:
+        args.append('--isolated')
+    
     tools, exit_stack = await MCPToolset.from_server(
         connection_params=StdioServerParameters(
             command=command,
@@ -48,11 +108,16 @@ async def get_web_tools_async():
     )
     return tools, exit_stack
 
-async def get_tools_async(target):
+async def get_tools_async(target, device=None, browser_profile=None, isolated=False):
     """Gets tools from the appropriate MCP server based on the target.
     
     Args:
         target: The target platform, either "android", "ios", or "web".
+        device: Optional Device (or browser context) to pin the server to
+        browser_profile: Optional browser profile directory for the web target.
+            Apps on mobile devices keep their state on the device.
+        isolated: Keep the web browser profile in memory, so that several servers
+            can run side by side. Implied by a device (browser context).
         
     Returns:
         A tuple of (tools, exit_stack).
@@ -62,10 +127,72 @@ async def get_tools_async(target):
     """
     target = target.lower()
     if target == "android":
-        return await get_mobile_tools_async(platform="android")
+        return await get_mobile_tools_async(platform="android", device=device)
     elif target == "ios":
-        return await get_mobile_tools_async(platform="ios")
+        return await get_mobile_tools_async(platform="ios", device=device)
     elif target == "web":
-        return await get_web_tools_async()
+        return await get_web_tools_async(isolated=isolated or device is not None, browser_profile=browser_profile)
     else:
-        raise ValueError(f"Unsupported target: {target}. Must be 'android', 'ios', or 'web'.")
\ No newline at end of file
+        raise ValueError(f"Unsupported target: {target}. Must be 'android', 'ios', or 'web'.")
+
+def prepare_tools(tools, target, event_bus=None):
+    """Wrap the MCP tools with the processing layers enabled in config.
+    
+    Args:
+        tools: The tools from the MCP server
+        target: The target platform, either "android", "ios", or "web".
+        event_bus: Optional EventBus receiving events emitted by the wrappers
+        
+    Returns:
+        The list of tools to hand to the agent.
+    """
+    config = load_config()
+    
+    # Compact payloads first, so that cached results are already compacted
+    compaction_settings = get_compaction_settings(config, target.lower())
+    if compaction_settings.pop('enabled'):
+        tools = wrap_with_compaction(tools, compaction_settings, event_bus)
+    
+    # Polls the uncached tools, while the cache treats a wait like any call that changes the screen
+    wait_settings = get_wait_settings(config)
+    if wait_settings['enabled']:
+        tools = tools + create_wait_tools(tools, target, wait_settings)
+    
+    cache_settings = get_tool_cache_settings(config)
+    if cache_settings['enabled']:
+        tools = wrap_with_cache(tools, cache_settings, event_bus)
+    
+    # Macros act through the cache, so their clicks invalidate cached inspection results
+    macro_settings = get_macro_settings(config)
+    if macro_settings['enabled']:
+        tools = tools + create_macro_tools(tools, target, macro_settings)
+    
+    # Diff outside the cache, so a cached inspection result reads as "no changes"
+    diff_settings = get_ui_diff_settings(config)
+    if diff_settings['enabled']:
+        tools = wrap_with_diffing(tools, diff_settings, event_bus)
+    
+    # Outermost layer, so the measured latency is what the agent actually waits for
+    if event_bus is not None:
+        tools = [TimedTool(tool, event_bus) for tool in tools]
+    
+    return tools
+
+
+def reset_tools(tools):
+    """Forget what the layers of `prepare_tools` kept from previous runs.
+
+    Tools that are reused between runs (e.g. by the daemon) would otherwise
+    serve cached inspection results and diff against element trees of an
+    earlier run.
+
+    Args:
+        tools: Tools as returned by `prepare_tools`
+    """
+    for tool in tools:
+        while isinstance(tool, ToolWrapper):
+            if isinstance(tool, CachingTool):
+                tool.cache.reset()
+            elif isinstance(tool, DiffingTool):
+                tool.tracker.reset()
+            tool = tool.tool
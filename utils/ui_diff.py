@@ -0,0 +1,252 @@
+"""Incremental diffing of UI inspection results.
+
+Listing the elements on screen or taking a Playwright snapshot after every
+action sends the whole screen back to the model again and again, so the
+conversation grows quadratically with the number of steps. The tracker keeps
+the latest tree of every inspection tool per session and answers later calls
+with only the nodes that were added, removed or changed. The model can ask
+for the complete tree with the `full_tree` argument.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.genai import types
+
+from utils.compaction import REF_PATTERN, payload_size
+from utils.events import EventBus, PayloadCompactionEvent, to_jsonable
+from utils.tool_wrapper import ToolWrapper
+
+# Inspection tools whose results are element trees
+DEFAULT_DIFF_TOOLS = {
+    "mobile_list_elements_on_screen",
+    "browser_snapshot",
+}
+
+FULL_TREE_ARG = "full_tree"
+
+# Fields that identify an element of a mobile element list
+ELEMENT_ID_KEYS = ("type", "identifier", "resourceId", "label", "name", "text")
+
+
+class UiNode:
+    """A node of a parsed element tree."""
+
+    def __init__(self, key: Tuple, line: str, parent: Optional[Tuple], lines: List[str]):
+        self.key = key
+        # What the model sees of the node itself, and of its whole subtree
+        self.line = line
+        self.parent = parent
+        self.lines = lines
+
+
+def parse_tree(text: str) -> Dict[Tuple, UiNode]:
+    """Parse an inspection result into its nodes, keyed by a stable identity.
+
+    JSON element lists (optionally after a short prefix) are keyed by the
+    identifying fields of each element. Any other text is treated as an
+    indented tree such as a Playwright snapshot, where a node is a line and
+    its identity is the path of its ancestors without element refs and
+    values. Identical siblings are told apart by their position.
+    """
+    start = text.find("[")
+    if start >= 0:
+        try:
+            elements = json.loads(text[start:])
+        except ValueError:
+            elements = None
+        if isinstance(elements, list) and all(isinstance(element, dict) for element in elements):
+            return _parse_elements(elements)
+    return _parse_indented(text)
+
+
+def _parse_elements(elements: List[Dict[str, Any]]) -> Dict[Tuple, UiNode]:
+    nodes = {}
+    seen: Dict[Tuple, int] = {}
+    for element in elements:
+        identity = tuple(str(element.get(key, "")) for key in ELEMENT_ID_KEYS)
+        key = _unique(seen, identity)
+        line = json.dumps(element, ensure_ascii=False, separators=(",", ":"))
+        nodes[key] = UiNode(key, line, None, [line])
+    return nodes
+
+
+def _parse_indented(text: str) -> Dict[Tuple, UiNode]:
+    nodes = {}
+    seen: Dict[Tuple, int] = {}
+    # (indent, key) of the ancestors of the current line
+    stack: List[Tuple[int, Tuple]] = []
+    for line in text.split("\n"):
+        if not line.strip():
+            continue
+        indent = len(line) - len(line.lstrip())
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        parent = stack[-1][1] if stack else None
+        # Text after a colon is the node's value, e.g. `- Page URL: ...` or `- text: ...`
+        signature = REF_PATTERN.sub("", line.strip()).split(": ", 1)[0]
+        key = _unique(seen, (parent, signature))
+        nodes[key] = UiNode(key, line, parent, [line])
+        for _, ancestor in stack:
+            nodes[ancestor].lines.append(line)
+        stack.append((indent, key))
+    return nodes
+
+
+def _unique(seen: Dict[Tuple, int], identity: Tuple) -> Tuple:
+    """Tell identical siblings apart by how many came before them."""
+    index = seen.get(identity, 0)
+    seen[identity] = index + 1
+    return identity + (index,)
+
+
+def diff_trees(before: Dict[Tuple, UiNode], after: Dict[Tuple, UiNode]) -> Dict[str, List[UiNode]]:
+    """Compare two parsed trees.
+
+    Added and removed subtrees are reported once, by their topmost node.
+    A node whose identity is unchanged but whose content differs (e.g. a new
+    value, state or element ref) is reported as changed.
+    """
+    new_keys = after.keys() - before.keys()
+    gone_keys = before.keys() - after.keys()
+    added = [node for key, node in after.items() if key in new_keys and node.parent not in new_keys]
+    removed = [node for key, node in before.items() if key in gone_keys and node.parent not in gone_keys]
+    changed = [node for key, node in after.items() if key in before and before[key].line != node.line]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def format_diff(name: str, diff: Dict[str, List[UiNode]], before: Dict[Tuple, UiNode],
+                after: Dict[Tuple, UiNode]) -> str:
+    """Describe a diff in a form the model can read like the tree itself."""
+    if not any(diff.values()):
+        return f"No changes since the previous {name} call. Call it with {FULL_TREE_ARG}=true for the full tree."
+
+    sections = [f"Changes since the previous {name} call (call it with {FULL_TREE_ARG}=true for the full tree):"]
+    for label, nodes, tree in (("Added", diff["added"], after), ("Removed", diff["removed"], before)):
+        if nodes:
+            sections.append(f"{label} ({len(nodes)}):")
+            for node in nodes:
+                sections.append(_located(node, tree))
+                sections.extend(node.lines[1:])
+    if diff["changed"]:
+        sections.append(f"Changed ({len(diff['changed'])}):")
+        for node in diff["changed"]:
+            sections.append(_located(node, after))
+            sections.append(f"  was: {before[node.key].line.strip()}")
+    return "\n".join(sections)
+
+
+def _located(node: UiNode, tree: Dict[Tuple, UiNode]) -> str:
+    if node.parent is None:
+        return node.line
+    return f"{node.line}  # in: {REF_PATTERN.sub('', tree[node.parent].line.strip())}"
+
+
+class UiStateTracker:
+    """Keeps the latest element tree of every inspection tool, per session and branch."""
+
+    def __init__(self, diff_tools=None, max_diff_ratio: float = 0.5):
+        """Initializes the tracker.
+
+        Args:
+            diff_tools: Names of the inspection tools whose results are diffed
+            max_diff_ratio: Return the full tree when the diff would be larger
+                than this fraction of it (e.g. after navigating to a new screen)
+        """
+        self.diff_tools = set(DEFAULT_DIFF_TOOLS if diff_tools is None else diff_tools)
+        self.max_diff_ratio = max_diff_ratio
+        self._trees: Dict[Tuple[Any, str], Dict[Tuple, UiNode]] = {}
+
+    def is_diffed(self, name: str) -> bool:
+        return name in self.diff_tools
+
+    def reset(self) -> None:
+        """Forget the trees of all conversations."""
+        self._trees.clear()
+
+    def update(self, history: Any, name: str, text: str, full_tree: bool = False) -> str:
+        """Remember the tree of a result and return what the model should see of it.
+
+        Args:
+            history: Identifies the conversation the result is added to, e.g. a session
+            name: Name of the inspection tool
+            text: The full result
+            full_tree: Whether the model asked for the full tree
+        """
+        tree = parse_tree(text)
+        previous = self._trees.get((history, name))
+        self._trees[(history, name)] = tree
+        if previous is None or full_tree:
+            return text
+        diff_text = format_diff(name, diff_trees(previous, tree), previous, tree)
+        if len(diff_text) > self.max_diff_ratio * len(text):
+            return text
+        return diff_text
+
+
+def _history(tool_context) -> Tuple[Optional[str], Optional[str]]:
+    # Sub-agents on their own branch (e.g. parallel checks) do not see each other's results
+    invocation_context = getattr(tool_context, "_invocation_context", None)
+    session = getattr(invocation_context, "session", None)
+    return getattr(session, "id", None), getattr(invocation_context, "branch", None)
+
+
+class DiffingTool(ToolWrapper):
+    """Returns the changes of an inspection tool's tree since its previous call.
+
+    Adds an optional `full_tree` argument to the tool's declaration, so the
+    model can still ask for the complete tree.
+    """
+
+    def __init__(self, tool, tracker: UiStateTracker, event_bus: Optional[EventBus] = None):
+        super().__init__(tool)
+        self.tracker = tracker
+        self.event_bus = event_bus
+
+    def _get_declaration(self):
+        declaration = self.tool._get_declaration()
+        if declaration is None:
+            return None
+        declaration = declaration.model_copy(deep=True)
+        if declaration.parameters is None:
+            declaration.parameters = types.Schema(type=types.Type.OBJECT, properties={})
+        declaration.parameters.properties = dict(declaration.parameters.properties or {})
+        declaration.parameters.properties[FULL_TREE_ARG] = types.Schema(
+            type=types.Type.BOOLEAN,
+            description="Return the complete tree instead of the changes since the previous call",
+        )
+        return declaration
+
+    async def run_async(self, *, args, tool_context):
+        args = dict(args or {})
+        full_tree = bool(args.pop(FULL_TREE_ARG, False))
+        response = await self.tool.run_async(args=args, tool_context=tool_context)
+
+        data = to_jsonable(response)
+        if not isinstance(data, dict) or data.get("isError") or not isinstance(data.get("content"), list):
+            return response
+        texts = [index for index, item in enumerate(data["content"])
+                 if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str)]
+        # Only single-text results are trees; anything else is passed through unchanged
+        if len(texts) != 1:
+            return response
+
+        item = data["content"][texts[0]]
+        text = self.tracker.update(_history(tool_context), self.name, item["text"], full_tree)
+        if text is item["text"]:
+            return response
+        data["content"][texts[0]] = dict(item, text=text)
+        if self.event_bus is not None:
+            self.event_bus.emit(PayloadCompactionEvent(self.name, payload_size(response), payload_size(data)))
+        return data
+
+
+def wrap_with_diffing(tools, settings, event_bus: Optional[EventBus] = None):
+    """Wrap the inspection tools so they return the changes since their previous call.
+
+    Args:
+        tools: The tools from the MCP server
+        settings: UI diff settings as returned by `get_ui_diff_settings`
+        event_bus: Optional bus for bytes-in/bytes-out events
+    """
+    tracker = UiStateTracker(DEFAULT_DIFF_TOOLS | set(settings.get("tools") or []), settings.get("max_diff_ratio", 0.5))
+    return [DiffingTool(tool, tracker, event_bus) if tracker.is_diffed(tool.name) else tool for tool in tools]
@@ -0,0 +1,145 @@
+"""Cache of passing verdicts, so unchanged tests are not run again.
+
+A test case that passed is skipped on later suite runs for as long as
+nothing that could change its outcome changed: its query (with checkpoint
+and tool profile), the agent and verdict instructions, the model, the target
+and the build of the app under test. The build is identified by a fingerprint the user supplies, e.g. the
+hash of an APK or IPA or the version string of a deployed web app. Entries
+expire after a TTL, so every test still runs now and then.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.agent import load_instruction
+from utils.suite import TestCase, TestResult
+from utils.verdicts import VERDICT_INSTRUCTION
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    key TEXT PRIMARY KEY,
+    test_id TEXT NOT NULL,
+    target TEXT NOT NULL,
+    duration REAL NOT NULL,
+    tool_calls INTEGER NOT NULL,
+    final_response TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS verdicts_created ON verdicts (created);
+"""
+
+# Files are read in chunks of this size when they are hashed
+CHUNK_SIZE = 1 << 20
+
+
+def build_fingerprint(value: str) -> str:
+    """The fingerprint of an app build: the SHA-256 of a file (e.g. an APK or IPA), or the given string."""
+    path = Path(value).expanduser()
+    if not path.is_file():
+        return value
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return "sha256:" + digest.hexdigest()
+
+
+def verdict_key(case: TestCase, instruction: str, model: str, target: str, build: str) -> str:
+    """Hash everything a cached verdict depends on."""
+    key = {
+        "query": case.query,
+        "checkpoint": case.checkpoint,
+        "tool_profile": case.tool_profile,
+        "instruction": instruction,
+        "verdict_instruction": VERDICT_INSTRUCTION,
+        "model": model,
+        "target": target,
+        "build": build,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+class VerdictCache:
+    """A SQLite store of passing verdicts."""
+
+    def __init__(self, path, ttl: float = 0):
+        """Initializes the cache.
+
+        Args:
+            path: Path of the SQLite database file
+            ttl: Seconds a passing verdict is reused for (0 for until a key part changes)
+        """
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cached passing verdict of a key, or None if there is none or it expired."""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl and time.time() - row["created"] > self.ttl:
+                self._db.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                row = None
+        return dict(row) if row else None
+
+    def put(self, key: str, result: TestResult) -> None:
+        """Remember a passing result, or forget the verdict of a key whose test no longer passes."""
+        with self._lock:
+            if not result.passed:
+                self._db.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO verdicts (key, test_id, target, duration, tool_calls, final_response, "
+                "created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, result.test_id, result.target, result.duration, result.tool_calls, result.final_response,
+                 time.time()),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def split_cached(cases: List[TestCase], cache: VerdictCache, model: str, default_target: str, build: str,
+                 force: bool = False) -> Tuple[List[TestResult], List[TestCase], Dict[str, str]]:
+    """Split the test cases of a suite into those with a cached passing verdict and those to run.
+
+    Args:
+        cases: The test cases of the suite
+        cache: The verdict cache
+        model: The model the test cases run with
+        default_target: Target platform for test cases that do not specify one
+        build: Fingerprint of the app build under test
+        force: Run every test case, ignoring the cached verdicts
+
+    Returns:
+        A tuple of (cached results, test cases to run, cache key by test ID
+        of the test cases to run).
+    """
+    cached, remaining, keys = [], [], {}
+    for case in cases:
+        target = (case.target or default_target).lower()
+        key = verdict_key(case, load_instruction(target), model, target, build)
+        entry = None if force else cache.get(key)
+        if entry is None:
+            remaining.append(case)
+            keys[case.test_id] = key
+            continue
+        cached.append(TestResult(
+            test_id=case.test_id,
+            target=target,
+            verdict="passed",
+            duration=0.0,
+            final_response=entry["final_response"],
+            tool_calls=0,
+            cached=True,
+        ))
+    return cached, remaining, keys
@@ -0,0 +1,67 @@
+"""Verdicts of test runs."""
+import re
+from typing import Optional
+
+from utils.events import AgentEvent, BudgetExceededEvent, ErrorEvent, FinalResponseEvent
+from utils.sinks import EventSink
+
+# Appended to every test query so the final response carries a parseable verdict
+VERDICT_INSTRUCTION = (
+    "When you are done, end your final response with a single line that reads "
+    "either 'TEST RESULT: PASSED' or 'TEST RESULT: FAILED'."
+)
+VERDICT_PATTERN = re.compile(r"TEST RESULT:\s*\**\s*(PASSED|FAILED)", re.IGNORECASE)
+
+
+def verdict_query(query: str) -> str:
+    """The query sent to the agent, asking for a parseable verdict at the end of the run."""
+    return f"{query}\n\n{VERDICT_INSTRUCTION}"
+
+
+def parse_verdict(text: str) -> str:
+    """Extract the verdict ("passed", "failed" or "unknown") from a final response."""
+    matches = VERDICT_PATTERN.findall(text or "")
+    if not matches:
+        return "unknown"
+    return matches[-1].lower()
+
+
+def run_verdict(final_response: str, error: Optional[str] = None, aborted: Optional[str] = None):
+    """The verdict of a run and its error message, if any.
+
+    Args:
+        final_response: The final response of the agent
+        error: The error the run ended with, if any
+        aborted: Why the run was stopped early by its budget, if it was
+
+    Returns:
+        A tuple of (verdict, error).
+    """
+    if error:
+        return "error", error
+    if aborted:
+        return "aborted", f"Budget exceeded: {aborted}"
+    return parse_verdict(final_response), None
+
+
+class VerdictSink(EventSink):
+    """Collects what decides the verdict of a single run from its events."""
+
+    name = "verdict"
+
+    def __init__(self):
+        self.final_response = ""
+        self.error = None
+        self.aborted = None
+
+    def handle(self, event: AgentEvent) -> None:
+        if isinstance(event, FinalResponseEvent):
+            self.final_response = event.text
+        elif isinstance(event, ErrorEvent):
+            self.error = event.message
+        elif isinstance(event, BudgetExceededEvent):
+            self.aborted = event.message
+
+    def verdict(self):
+        """The verdict of the run and its error message, as returned by `run_verdict`."""
+        return run_verdict(self.final_response, self.error, self.aborted)
@@ -0,0 +1,118 @@
+"""Built-in tool that waits for an element condition by polling locally.
+
+Without it, the model waits for a slow screen by listing the elements again
+and again, with a full model round trip per poll. The `wait_for` tool polls
+the inspection tool of the session in-process with exponential backoff and
+returns once the condition holds or the timeout expires, so the whole wait
+is a single tool call.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from utils.macros import INSPECTION_TOOLS, Macro, MacroError, MacroTool, UiElement, parse_elements
+
+WAIT_TOOL = "wait_for"
+
+# Conditions the tool can wait for
+WAIT_STATES = ("visible", "hidden", "enabled")
+
+# Matching elements described in the result
+MAX_REPORTED_ELEMENTS = 5
+
+
+class WaitFor(Macro):
+    name = WAIT_TOOL
+    description = ("Wait until an element is visible, hidden or enabled, polling the screen locally. Use this "
+                   "instead of inspecting the screen repeatedly while an app or page is loading. Returns the "
+                   "matching elements once the condition holds, or reports that the timeout expired.")
+    requires = {target: [tool] for target, tool in INSPECTION_TOOLS.items()}
+    parameters = {
+        "text": {"type": "string",
+                 "description": "Text, label, accessibility id or resource id the element contains "
+                                "(case-insensitive)"},
+        "role": {"type": "string", "description": "Role or type of the element, e.g. button or EditText"},
+        "state": {"type": "string", "description": "visible (default), hidden or enabled"},
+        "timeout": {"type": "number", "description": "Seconds to wait at most"},
+    }
+    # A long wait polls many times, the number of polls is reported instead
+    report_steps = False
+
+    def __init__(self, settings: Dict[str, Any]):
+        """Initializes the tool.
+
+        Args:
+            settings: Wait settings as returned by `get_wait_settings`
+        """
+        self.settings = settings
+
+    async def run(self, ctx, text="", role="", state="visible", timeout=None, **args):
+        if not text and not role:
+            raise MacroError("Specify the text or the role of the element to wait for")
+        state = (state or "visible").lower()
+        if state not in WAIT_STATES:
+            raise MacroError(f"Unknown state {state}, must be one of {', '.join(WAIT_STATES)}")
+        timeout = self.settings['default_timeout'] if timeout is None else float(timeout)
+        timeout = max(0.0, min(timeout, self.settings['max_timeout']))
+
+        start = time.monotonic()
+        deadline = start + timeout
+        interval = self.settings['initial_interval']
+        polls = 0
+        while True:
+            polls += 1
+            elements = _matching(parse_elements(await ctx.call(INSPECTION_TOOLS[ctx.target])), text, role)
+            if _holds(elements, state):
+                outcome = {"condition_met": True, "state": state, "elapsed": round(time.monotonic() - start, 2),
+                           "polls": polls}
+                if elements:
+                    outcome["elements"] = [_describe(element) for element in elements[:MAX_REPORTED_ELEMENTS]]
+                return outcome
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {"condition_met": False, "state": state, "elapsed": round(time.monotonic() - start, 2),
+                        "polls": polls, "note": f"Timed out after {timeout:g}s"}
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * self.settings['backoff'], self.settings['max_interval'])
+
+
+def _matching(elements: List[UiElement], text: str, role: str) -> List[UiElement]:
+    text, role = (text or "").lower(), (role or "").lower()
+    return [element for element in elements
+            if text in element.search_text.lower() and role in element.role.lower()]
+
+
+def _holds(elements: List[UiElement], state: str) -> bool:
+    if state == "hidden":
+        return not elements
+    if state == "enabled":
+        return any(not element.disabled for element in elements)
+    return bool(elements)
+
+
+def _describe(element: UiElement) -> Dict[str, Any]:
+    description = {"role": element.role, "name": element.name}
+    if element.ref is not None:
+        description["ref"] = element.ref
+    if element.center is not None:
+        description["x"], description["y"] = element.center
+    if element.disabled:
+        description["disabled"] = True
+    return description
+
+
+def create_wait_tools(tools: List[Any], target: str, settings: Dict[str, Any]) -> List[MacroTool]:
+    """Create the wait tool, if the server has an inspection tool for the target.
+
+    Args:
+        tools: The tools of the MCP server, which must not be cached so
+            that every poll sees the current screen
+        target: The target platform, either "android", "ios", or "web"
+        settings: Wait settings as returned by `get_wait_settings`
+    """
+    target = target.lower()
+    by_name = {tool.name: tool for tool in tools}
+    wait = WaitFor(settings)
+    if WAIT_TOOL in by_name or not wait.is_available(target, list(by_name)):
+        return []
+    return [MacroTool(wait, by_name, target)]